@@ -85,6 +85,9 @@ cp -fL bash/ipa2-task pbipa/bin/
 cp -fL scripts/ipa pbipa/bin/
 cp -fL scripts/ipa2_ovlp_to_graph pbipa/bin/
 cp -fL scripts/ipa2_graph_to_contig pbipa/bin/
+cp -fL scripts/ipa2_m4_to_ovb pbipa/bin/
+cp -fL scripts/ipa2_overlaps.py pbipa/bin/
+cp -fL scripts/ipa2_stage_report.py pbipa/bin/
 
 mkdir -p pbipa/etc
 cp -fL etc/ipa.snakefile pbipa/etc/
@@ -17,6 +17,9 @@ cd scripts/ci
 cp -Lf ../ipa ${PREFIX_ARG}/bin/
 cp -Lf ../ipa2_graph_to_contig ${PREFIX_ARG}/bin/
 cp -Lf ../ipa2_ovlp_to_graph ${PREFIX_ARG}/bin/
+cp -Lf ../ipa2_m4_to_ovb ${PREFIX_ARG}/bin/
+cp -Lf ../ipa2_overlaps.py ${PREFIX_ARG}/bin/
+cp -Lf ../ipa2_stage_report.py ${PREFIX_ARG}/bin/
 cp -Lf ../../bash/ipa2-task ${PREFIX_ARG}/bin/
 cp -Lf ../../etc/ipa.snakefile ${PREFIX_ARG}/etc/
 
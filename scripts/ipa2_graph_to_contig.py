@@ -5,9 +5,10 @@ import argparse
 import logging
 import sys
 import networkx as nx
-import time
 import contextlib
 
+from ipa2_stage_report import StageReport
+
 LOG = logging.getLogger(__name__)
 RCMAP = dict(list(zip("ACGTacgtNn-", "TGCAtgcaNn-")))
 
@@ -15,13 +16,6 @@ def log(msg):
     sys.stderr.write(msg)
     sys.stderr.write('\n')
 
-def time_diff_to_str(time_list):
-    elapsed_time = time_list[1] - time_list[0]
-    return time.strftime("%H:%M:%S", time.gmtime(elapsed_time))
-
-def log_time(label, time_list):
-    LOG.info('Time for "{}": {}'.format(label, time_diff_to_str(time_list)))
-
 def rc(seq):
     return "".join([RCMAP[c] for c in seq[::-1]])
 
@@ -106,7 +100,12 @@ def open_progress(fn, mode='r', log=LOG.info):
             yield line
 
     fp = FilePercenter(fn, log=log)
-    with open(fn, mode=mode) as stream:
+    if fn.endswith('.gz'):
+        import gzip
+        stream = gzip.open(fn, mode=mode + 't')
+    else:
+        stream = open(fn, mode=mode)
+    with stream:
         yield get_iter(stream, fp)
     fp.finish()
 
@@ -132,11 +131,17 @@ def compose_tiling_paths(edge_data, ctg_id, path_edges):
 
     return tiling_path_lines, total_score, total_length
 
-def run(sg_edges_list_fn, utg_data_fn, ctg_paths_fn):
-    time_total = [time.time()]
+def run(sg_edges_list_fn, utg_data_fn, ctg_paths_fn, report_fn='', trace_malloc=False, profile=False,
+        profile_prefix='graph_to_contig.profile'):
+    report = StageReport()
+    if trace_malloc:
+        report.enable_trace_malloc()
+    if profile:
+        report.enable_profile(profile_prefix)
+    time_total = report.start()
 
     ### Load the string graph edge data.
-    time_edge_data = [time.time()]
+    time_edge_data = report.start()
     edge_data = {}
     with open_progress(sg_edges_list_fn) as fp_in:
         for l in fp_in:
@@ -152,11 +157,10 @@ def run(sg_edges_list_fn, utg_data_fn, ctg_paths_fn):
             idt = float(idt)
             e_seq = None
             edge_data[(v, w)] = (rid, s, t, aln_score, idt, e_seq, inphase)
-    time_edge_data += [time.time()]
-    log_time('edge_data', time_edge_data)
+    report.end('edge_data', time_edge_data, edges=len(edge_data))
 
     ### Load the unitig data.
-    time_utg_data = [time.time()]
+    time_utg_data = report.start()
     utg_data = {}
     with open_progress(utg_data_fn) as fp_in:
         for l in fp_in:
@@ -172,11 +176,10 @@ def run(sg_edges_list_fn, utg_data_fn, ctg_paths_fn):
                 path_or_edges = [tuple(e.split("~"))
                                  for e in path_or_edges.split("|")]
             utg_data[(s, v, t)] = type_, length, score, path_or_edges
-    time_utg_data += [time.time()]
-    log_time('utg_data', time_utg_data)
+    report.end('utg_data', time_utg_data, unitigs=len(utg_data))
 
     ### Produce tiling paths from contig annotations.
-    time_write_contigs = [time.time()]
+    time_write_contigs = report.start()
     layout_ctg = set()
     with open_progress(ctg_paths_fn) as fp_in, \
             open("p_ctg_tiling_path", "w") as fp_pctg_tp, \
@@ -303,11 +306,14 @@ def run(sg_edges_list_fn, utg_data_fn, ctg_paths_fn):
 
                 a_id += 1
 
-    time_write_contigs += [time.time()]
-    log_time('write_contigs', time_write_contigs)
+    report.end('write_contigs', time_write_contigs, contigs=len(layout_ctg))
 
-    time_total += [time.time()]
-    log_time('TOTAL', time_total)
+    report.end('TOTAL', time_total)
+    if report_fn:
+        report.write(report_fn, program='ipa2_graph_to_contig', args={
+            'sg_edges_list_fn': sg_edges_list_fn, 'utg_data_fn': utg_data_fn, 'ctg_paths_fn': ctg_paths_fn})
+    if profile:
+        report.write_profile_summary()
 
 class HelpF(argparse.RawDescriptionHelpFormatter, argparse.ArgumentDefaultsHelpFormatter):
     pass
@@ -320,6 +326,7 @@ def main(argv=sys.argv):
 We write these:
     p_ctg_tiling_path
     a_ctg_all_tiling_path
+    graph_to_contig_report.json
 """
     parser = argparse.ArgumentParser(
             description=description,
@@ -334,6 +341,17 @@ We write these:
     parser.add_argument('--ctg-paths-fn', type=str,
             default='./ctg_paths',
             help='Input. File containing contig paths, produced by ovlp_to_graph.py.')
+    parser.add_argument('--report-fn', type=str,
+            default='graph_to_contig_report.json',
+            help='Output. JSON report of the time, memory and counts of each stage (empty to skip it).')
+    parser.add_argument('--trace-malloc', action='store_true', default=False,
+            help='Add the peak of the Python allocations of each stage to the report (slow).')
+    parser.add_argument('--profile', action='store_true', default=False,
+            help='Profile each stage with cProfile, into <profile-prefix>.<index>.<stage>.pstats files, '
+                 'merged into <profile-prefix>.pstats with a summary of the top functions in <profile-prefix>.txt.')
+    parser.add_argument('--profile-prefix', type=str,
+            default='graph_to_contig.profile',
+            help='Output. Prefix of the profile files.')
     args = parser.parse_args(argv[1:])
     logging.basicConfig(level=logging.INFO, stream=sys.stdout, format='[%(asctime)s %(levelname)s] %(msg)s', datefmt='%Y-%m-%d %H:%M:%S')
     run(**vars(args))
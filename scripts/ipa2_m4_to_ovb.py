@@ -0,0 +1,42 @@
+#! /usr/bin/env python3
+
+import argparse
+import logging
+import sys
+import time
+
+from ipa2_overlaps import read_overlap_blocks, write_overlap_binary
+from ipa2_stage_report import log_time
+
+LOG = logging.getLogger(__name__)
+
+def run(m4_fn, ovb_fn, workers):
+    time_convert = [time.time()]
+    n_records = write_overlap_binary(read_overlap_blocks(m4_fn, workers=workers), ovb_fn)
+    time_convert += [time.time()]
+    LOG.info('Wrote {} overlaps to "{}".'.format(n_records, ovb_fn))
+    log_time('m4_to_ovb', time_convert)
+
+class HelpF(argparse.RawTextHelpFormatter, argparse.ArgumentDefaultsHelpFormatter):
+    pass
+
+def main(argv=sys.argv):
+    description = 'Convert an m4 overlap file to the binary columnar overlap format (see ipa2_ovlp_to_graph --overlap-format).'
+    parser = argparse.ArgumentParser(
+            description=description,
+            formatter_class=HelpF)
+    parser.add_argument('--m4-fn', type=str,
+            default='preads.m4',
+            help='Input. m4 overlap file.')
+    parser.add_argument('--ovb-fn', type=str,
+            default='preads.ovb',
+            help='Output. Binary overlap file.')
+    parser.add_argument('--workers', type=int,
+            default=1,
+            help='Number of processes for parsing the m4 file.')
+    args = parser.parse_args(argv[1:])
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout, format='[%(asctime)s %(levelname)s] %(msg)s', datefmt='%Y-%m-%d %H:%M:%S')
+    run(**vars(args))
+
+if __name__ == "__main__":
+    main(sys.argv)
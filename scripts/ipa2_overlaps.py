@@ -0,0 +1,361 @@
+"""
+the overlap files read by the ipa2 scripts: m4 text and the binary columnar format
+"""
+
+import array
+import mmap
+import os
+import struct
+import sys
+
+# the via node of the unitig edges which do not have one (compound edges)
+NA = -1
+
+
+class ReadIndex(object):
+    """
+    bidirectional mapping between read names and integer read indices
+    """
+
+    def __init__(self):
+        self.names = []
+        self.index = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getstate__(self):
+        return self.names
+
+    def __setstate__(self, names):
+        self.names = names
+        self.index = {name: i for (i, name) in enumerate(names)}
+
+    def get_index(self, read_name):
+        """
+        return the index of a read, adding the read if it was not seen before
+        """
+        read_index = self.index.get(read_name)
+        if read_index is None:
+            read_index = len(self.names)
+            self.index[read_name] = read_index
+            self.names.append(read_name)
+        return read_index
+
+    def node_name(self, node):
+        return '%s:%s' % (self.names[node >> 1], 'E' if node & 1 else 'B')
+
+    def via_name(self, v):
+        if v == NA:
+            return 'NA'
+        return self.node_name(v)
+
+    def utg_name(self, s, t, v):
+        """
+        the "s~v~t" name of a unitig edge
+        """
+        return self.node_name(s) + '~' + self.via_name(v) + '~' + self.node_name(t)
+
+
+OVERLAP_BLOCK_SIZE = 64 * 1024 * 1024  # bytes of m4 text per OverlapBlock
+
+
+class OverlapBlock(object):
+    """
+    a batch of overlap records, stored by column
+
+    Read ids and inphase codes are lists of strings, the other columns are
+    typed arrays. When read_names is given, the read ids are integer
+    indices into read_names instead.
+    """
+
+    columns = ('f_id', 'g_id', 'score', 'identity',
+               'f_strand', 'f_start', 'f_end', 'f_len',
+               'g_strand', 'g_start', 'g_end', 'g_len', 'inphase')
+
+    def __init__(self, f_id, g_id, score, identity,
+                 f_strand, f_start, f_end, f_len,
+                 g_strand, g_start, g_end, g_len, inphase, read_names=None):
+        self.f_id = f_id
+        self.g_id = g_id
+        self.score = score
+        self.identity = identity
+        self.f_strand = f_strand
+        self.f_start = f_start
+        self.f_end = f_end
+        self.f_len = f_len
+        self.g_strand = g_strand
+        self.g_start = g_start
+        self.g_end = g_end
+        self.g_len = g_len
+        self.inphase = inphase
+        self.read_names = read_names
+
+    def __len__(self):
+        return len(self.f_id)
+
+    def records(self):
+        """
+        yield the overlaps as (f_id, g_id, score, identity, f_strand, ..., g_len, inphase) tuples
+        """
+        if self.read_names is None:
+            return zip(*[getattr(self, c) for c in self.columns])
+        read_name = self.read_names.__getitem__
+        return zip(map(read_name, self.f_id), map(read_name, self.g_id),
+                   *[getattr(self, c) for c in self.columns[2:]])
+
+    def read_indices(self, reads):
+        """
+        return the f and g read index columns, adding the reads to the ReadIndex in order of appearance
+        """
+        if self.read_names is not None:
+            to_index = array.array('l', map(reads.get_index, self.read_names))
+            if to_index == array.array('l', range(len(to_index))):
+                # the reads were indexed in the order of read_names
+                return self.f_id, self.g_id
+            return (array.array('l', map(to_index.__getitem__, self.f_id)),
+                    array.array('l', map(to_index.__getitem__, self.g_id)))
+        f_index = array.array('l')
+        g_index = array.array('l')
+        get_index = reads.get_index
+        for f_id, g_id in zip(self.f_id, self.g_id):
+            f_index.append(get_index(f_id))
+            g_index.append(get_index(g_id))
+        return f_index, g_index
+
+    def indexed_records(self, reads):
+        """
+        yield the overlaps as (f_index, g_index, score, identity, f_strand, ..., g_len, inphase) tuples
+        """
+        f_index, g_index = self.read_indices(reads)
+        return zip(f_index, g_index, *[getattr(self, c) for c in self.columns[2:]])
+
+    @classmethod
+    def from_records(cls, records):
+        columns = list(zip(*records)) if records else [()] * len(cls.columns)
+        return cls(list(columns[0]), list(columns[1]),
+                   array.array('l', columns[2]), array.array('d', columns[3]),
+                   *[array.array('l', c) for c in columns[4:12]],
+                   list(columns[12]))
+
+
+def parse_overlap_line(line):
+    l = line.strip().split()
+    f_id, g_id, score, identity = l[:4]
+
+    score = int(score)
+    identity = float(identity)
+    #contained_etc = l[12]
+    f_strand, f_start, f_end, f_len = (int(c) for c in l[4:8])
+    g_strand, g_start, g_end, g_len = (int(c) for c in l[8:12])
+    inphase = 'u' if len(l) < 15 else l[14]
+
+    return (f_id, g_id, score, identity,
+                        f_strand, f_start, f_end, f_len,
+                        g_strand, g_start, g_end, g_len, inphase)
+
+
+def parse_overlap_text(text):
+    """
+    parse a block of whole m4 lines (without the "-" terminator) into an OverlapBlock
+    """
+    n_lines = text.count('\n')
+    if not text.endswith('\n'):
+        n_lines += 1
+    # Every line gets an end-of-line token, so the columns can be sliced
+    # out of one flat token list when all the lines have the same number
+    # of columns.
+    tokens = text.replace('\n', ' \0 ').split()
+    if tokens and tokens[-1] != '\0':
+        tokens.append('\0')
+    ncols = tokens.index('\0') if tokens else 0
+    step = ncols + 1
+    if ncols < 12 or len(tokens) != n_lines * step or \
+       tokens[ncols::step].count('\0') != n_lines:
+        # lines with different numbers of columns (or malformed lines)
+        return OverlapBlock.from_records([parse_overlap_line(line) for line in text.splitlines()])
+
+    def int_column(k):
+        return array.array('l', map(int, tokens[k::step]))
+
+    if ncols < 15:
+        inphase = ['u'] * n_lines
+    else:
+        inphase = tokens[14::step]
+    return OverlapBlock(tokens[0::step], tokens[1::step],
+                        int_column(2), array.array('d', map(float, tokens[3::step])),
+                        int_column(4), int_column(5), int_column(6), int_column(7),
+                        int_column(8), int_column(9), int_column(10), int_column(11),
+                        inphase)
+
+
+def find_overlap_chunks(overlap_file, chunk_size):
+    """
+    split an overlap file into chunks of about chunk_size bytes, which start and end at line boundaries;
+    return the list of (start, end) byte offsets
+    """
+    size = os.path.getsize(overlap_file)
+    chunks = []
+    with open(overlap_file, 'rb') as f:
+        start = 0
+        while start < size:
+            f.seek(min(start + chunk_size, size))
+            f.readline()  # move on to the end of the line
+            end = f.tell()
+            chunks.append((start, end))
+            start = end
+    return chunks
+
+
+def parse_overlap_chunk(chunk):
+    """
+    parse the m4 lines in the (overlap_file, start, end) byte range;
+    return (block, terminated), where terminated tells if the "-" terminator line was found
+    """
+    overlap_file, start, end = chunk
+    with open(overlap_file, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode()
+    terminated = False
+    if text.startswith('-'):
+        text = ''
+        terminated = True
+    else:
+        i = text.find('\n-')
+        if i >= 0:
+            text = text[:i + 1]
+            terminated = True
+    return parse_overlap_text(text), terminated
+
+
+def read_overlap_blocks(overlap_file, block_size=OVERLAP_BLOCK_SIZE, workers=1):
+    """
+    read an m4 overlap file, and yield its records in OverlapBlock batches of about block_size bytes
+
+    With workers > 1, the blocks are parsed by a pool of processes, and
+    still yielded in file order. Reading stops at the "-" terminator line, if any.
+    """
+    chunks = [(overlap_file, start, end) for (start, end) in find_overlap_chunks(overlap_file, block_size)]
+    if workers > 1 and len(chunks) > 1:
+        import multiprocessing
+        with multiprocessing.Pool(workers) as pool:
+            for block, terminated in pool.imap(parse_overlap_chunk, chunks):
+                yield block
+                if terminated:
+                    break
+    else:
+        for chunk in chunks:
+            block, terminated = parse_overlap_chunk(chunk)
+            yield block
+            if terminated:
+                break
+
+
+def yield_from_overlap_file(overlap_file, workers=1):
+    # loop through the overlapping data, one record at a time
+    for block in read_overlap_blocks(overlap_file, workers=workers):
+        yield from block.records()
+
+
+# Binary overlap files hold the same records as m4 files, by column:
+#     header: magic, number of records, number of reads, size of the read-name table
+#     read-name table: "\n" terminated names, the read ids are indices in this table
+#     one little-endian column per OVB_COLUMNS entry
+# Each section starts at a multiple of 8 bytes, so the file can be memory
+# mapped and its columns used in place.
+OVB_MAGIC = b'IPAOVB\x00\x01'
+OVB_HEADER = struct.Struct('<8sQQQ')
+OVB_COLUMNS = (
+    ('f_id', 'I'),
+    ('g_id', 'I'),
+    ('score', 'i'),
+    ('identity', 'd'),
+    ('f_strand', 'B'),
+    ('f_start', 'i'),
+    ('f_end', 'i'),
+    ('f_len', 'i'),
+    ('g_strand', 'B'),
+    ('g_start', 'i'),
+    ('g_end', 'i'),
+    ('g_len', 'i'),
+    ('inphase', 'B'),  # the ASCII code of the inphase character
+)
+OVB_BLOCK_RECORDS = 1024 * 1024
+
+
+def ovb_padding(size):
+    return -size % 8
+
+
+def write_overlap_binary(overlap_blocks, ovb_file):
+    """
+    write batches of overlaps (OverlapBlock) to a binary overlap file; return the number of records
+    """
+    reads = ReadIndex()
+    columns = dict((c, array.array(typecode)) for (c, typecode) in OVB_COLUMNS)
+    for block in overlap_blocks:
+        f_index, g_index = block.read_indices(reads)
+        columns['f_id'].extend(array.array('I', f_index))
+        columns['g_id'].extend(array.array('I', g_index))
+        for (c, typecode) in OVB_COLUMNS[2:-1]:
+            columns[c].extend(array.array(typecode, getattr(block, c)))
+        inphase = ''.join(block.inphase).encode('ascii')
+        if len(inphase) != len(block):
+            raise Exception('The inphase codes must be single characters: {}'.format(sorted(frozenset(block.inphase))))
+        columns['inphase'].frombytes(inphase)
+
+    n_records = len(columns['f_id'])
+    names = ''.join(name + '\n' for name in reads.names).encode()
+    with open(ovb_file, 'wb') as f:
+        f.write(OVB_HEADER.pack(OVB_MAGIC, n_records, len(reads), len(names)))
+        f.write(names + bytes(ovb_padding(len(names))))
+        for (c, typecode) in OVB_COLUMNS:
+            column = columns[c]
+            if sys.byteorder != 'little':
+                column.byteswap()
+            data = column.tobytes()
+            f.write(data + bytes(ovb_padding(len(data))))
+    return n_records
+
+
+def read_overlap_binary(ovb_file, block_size=OVB_BLOCK_RECORDS):
+    """
+    memory map a binary overlap file, and yield its records in OverlapBlock batches of block_size records
+
+    The numeric columns of the blocks are views of the mapped file.
+    """
+    with open(ovb_file, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    buf = memoryview(mm)
+    magic, n_records, n_reads, names_size = OVB_HEADER.unpack_from(buf)
+    if magic != OVB_MAGIC:
+        raise Exception('Not a binary overlap file: {!r}'.format(ovb_file))
+    offset = OVB_HEADER.size
+    read_names = bytes(buf[offset:offset + names_size]).decode().split('\n')[:-1]
+    assert len(read_names) == n_reads
+    offset += names_size + ovb_padding(names_size)
+
+    columns = {}
+    for (c, typecode) in OVB_COLUMNS:
+        size = n_records * array.array(typecode).itemsize
+        if sys.byteorder == 'little':
+            columns[c] = buf[offset:offset + size].cast(typecode)
+        else:
+            columns[c] = array.array(typecode, bytes(buf[offset:offset + size]))
+            columns[c].byteswap()
+        offset += size + ovb_padding(size)
+
+    for b in range(0, n_records, block_size):
+        e = min(b + block_size, n_records)
+        block_columns = [columns[c][b:e] for (c, typecode) in OVB_COLUMNS]
+        block_columns[-1] = bytes(block_columns[-1]).decode('ascii')
+        yield OverlapBlock(*block_columns, read_names=read_names)
+
+
+def read_overlaps(overlap_file, overlap_format='m4', workers=1):
+    """
+    yield the OverlapBlock batches of an m4 or binary ("ovb") overlap file
+    """
+    if overlap_format == 'ovb':
+        return read_overlap_binary(overlap_file)
+    return read_overlap_blocks(overlap_file, workers=workers)
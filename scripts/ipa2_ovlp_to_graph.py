@@ -2,18 +2,26 @@
 
 import networkx as nx
 import argparse
+import array
+import bisect
+import heapq
+import itertools
+import json
 import logging
 import os
+import pickle
 import random
-import re
+import shutil
 import shlex
 import subprocess
 import sys
-import time
 
 # Not sure if adds to stability, but at least adds determinism.
 from collections import OrderedDict as dict
 
+from ipa2_overlaps import NA, ReadIndex, read_overlaps
+from ipa2_stage_report import StageReport
+
 PYTHONHASHSEED = os.environ.get('PYTHONHASHSEED')
 #random.seed(int(os.environ['PYTHONHASHSEED']))  # probably harmless but has no impact here
 if PYTHONHASHSEED:
@@ -22,6 +30,53 @@ if PYTHONHASHSEED:
 
 LOG = logging.getLogger(__name__)
 
+TRACE_STAGES = ('find_bundle', 'compound_paths', 'simple_paths', 'c_paths')
+
+class Tracer(object):
+    """
+    structured trace records of the inner loops, written as JSON lines to a trace file
+
+    Each stage in TRACE_STAGES is a boolean attribute, which the loops test
+    (hoisted into a local) before building a record, so a disabled stage
+    costs nothing but the test. Forked worker processes write to their own
+    file, with the process id appended to the file name.
+    """
+
+    def __init__(self):
+        for stage in TRACE_STAGES:
+            setattr(self, stage, False)
+        self.fn = None
+        self.file = None
+        self.pid = None
+
+    def enable(self, stages, fn):
+        for stage in stages:
+            setattr(self, stage, True)
+        self.fn = fn
+
+    def open(self):
+        if self.pid is None:
+            self.file = open(self.fn, 'w')
+        else:
+            # A forked process: leave the parent's file alone.
+            self.file = open('{}.{}'.format(self.fn, os.getpid()), 'w', buffering=1)
+        self.pid = os.getpid()
+
+    def __call__(self, stage, event, **fields):
+        if self.pid != os.getpid():
+            self.open()
+        record = {'stage': stage, 'event': event}
+        record.update(fields)
+        self.file.write(json.dumps(record, default=list))
+        self.file.write('\n')
+
+    def close(self):
+        if self.file is not None and self.pid == os.getpid():
+            self.file.close()
+            self.file = None
+
+TRACE = Tracer()
+
 ###################################
 ### Ordered set implementation. ###
 ###################################
@@ -80,6 +135,10 @@ class OrderedSet(collections.abc.MutableSet):
         self.discard(key)
         return key
 
+    def __reduce__(self):
+        # Pickle the items, not the linked list (which is as deep as the set is long).
+        return (self.__class__, (list(self),))
+
     def __repr__(self):
         if not self:
             return '%s()' % (self.__class__.__name__,)
@@ -125,15 +184,32 @@ class SGEdge(object):
         self.attr[attr] = value
 
 
-def reverse_end(node_name):
-    if (node_name == 'NA'):
-        return node_name
-    if (len(node_name) < 2 or (node_name[-2:] not in [':B', ':E'])):
-        raise Exception(
-            'Invalid node name. Node name passed to method: "{node_name}", expected format: "(%d)+:[BE]" or "NA".'.format(node_name=node_name))
-    node_id, end = node_name.split(":")
-    new_end = "B" if end == "E" else "E"
-    return node_id + ":" + new_end
+# Nodes of the string graph and of the unitig graph are integers:
+#     node = read_index * 2 + end
+# where end is 0 for the "B" end and 1 for the "E" end of the read.
+# The read names are kept in a ReadIndex, and are only used to build the
+# "000333411:E" style node names when the output files are written.
+# Compound unitig edges do not have a via node, and use NA (from
+# ipa2_overlaps) as the key.
+
+
+def reverse_end(node):
+    return node ^ 1
+
+
+def reverse_via(v):
+    if v == NA:
+        return v
+    return v ^ 1
+
+
+# node states of the transitive reduction
+VACANT = 0
+INPLAY = 1
+ELIMINATED = 2
+TR_FUZZ = 500
+TR_BATCH_SIZE = 65536
+OUTPUT_BUFFER_SIZE = 4 * 1024 * 1024  # characters of text per write of a BufferedTextWriter
 
 
 class StringGraph(object):
@@ -146,6 +222,7 @@ class StringGraph(object):
         self.edges = {}
         self.e_reduce = {}
         self.best_in = {}
+        self.reads = ReadIndex()
 
     def add_node(self, node_name):
         """
@@ -177,6 +254,22 @@ class StringGraph(object):
         for e in self.edges:
             self.e_reduce[e] = False
 
+    def iter_edges(self):
+        """
+        yield (key, v, w, rid, sp, tp, length, score, identity, inphase, reduced) in insertion order,
+        where key is the (v, w) tuple and rid is the index of the read that the edge spans
+        """
+        for (v, w), e in self.edges.items():
+            attr = e.attr
+            yield ((v, w), v, w, attr["rid"], attr["sp"], attr["tp"], attr["length"], attr["score"],
+                   attr["identity"], attr["inphase"], self.e_reduce[(v, w)])
+
+    def count_reduced(self):
+        return sum([1 for c in self.e_reduce.values() if c])
+
+    def count_not_reduced(self):
+        return sum([1 for c in self.e_reduce.values() if not c])
+
     def bfs_nodes(self, n, exclude=None, depth=5):
         all_nodes = set()
         all_nodes.add(n)
@@ -248,8 +341,8 @@ class StringGraph(object):
                         if self.e_reduce[(v, w)] != True:
                             self.e_reduce[(v, w)] = True
                             chimer_edges.add((v, w))
-                            rv = reverse_end(w)
-                            rw = reverse_end(v)
+                            rv = w ^ 1
+                            rw = v ^ 1
                             self.e_reduce[(rv, rw)] = True
                             chimer_edges.add((rv, rw))
 
@@ -258,12 +351,12 @@ class StringGraph(object):
                         if self.e_reduce[(v, w)] != True:
                             self.e_reduce[(v, w)] = True
                             chimer_edges.add((v, w))
-                            rv = reverse_end(w)
-                            rw = reverse_end(v)
+                            rv = w ^ 1
+                            rw = v ^ 1
                             self.e_reduce[(rv, rw)] = True
                             chimer_edges.add((rv, rw))
                     chimer_nodes.append(n.name)
-                    chimer_nodes.append(reverse_end(n.name))
+                    chimer_nodes.append(n.name ^ 1)
 
         return chimer_nodes, chimer_edges
 
@@ -278,7 +371,7 @@ class StringGraph(object):
                     if len(self.nodes[w].out_edges) == 0 and self.e_reduce[(v, w)] != True:
                         self.e_reduce[(v, w)] = True
                         removed_edges.add((v, w))
-                        v2, w2 = reverse_end(w), reverse_end(v)
+                        v2, w2 = w ^ 1, v ^ 1
                         self.e_reduce[(v2, w2)] = True
                         removed_edges.add((v2, w2))
 
@@ -288,20 +381,26 @@ class StringGraph(object):
                     if len(self.nodes[w].in_edges) == 0 and self.e_reduce[(w, v)] != True:
                         self.e_reduce[(w, v)] = True
                         removed_edges.add((w, v))
-                        v2, w2 = reverse_end(w), reverse_end(v)
+                        v2, w2 = w ^ 1, v ^ 1
                         self.e_reduce[(w2, v2)] = True
                         removed_edges.add((w2, v2))
         return removed_edges
 
-    def mark_tr_edges(self):
+    def mark_tr_edges(self, workers=1):
         """
-        transitive reduction
+        transitive reduction (always serial)
         """
+        if workers > 1:
+            LOG.warning('The object string graph runs the transitive reduction in a single process.')
         n_mark = {}
         e_reduce = self.e_reduce
-        FUZZ = 500
+        FUZZ = TR_FUZZ
         for n in self.nodes:
-            n_mark[n] = "vacant"
+            n_mark[n] = VACANT
+
+        # Lengths do not change, so the out edges are sorted only once.
+        for node in self.nodes.values():
+            node.out_edges.sort(key=lambda x: x.attr["length"])
 
         for (n_name, node) in self.nodes.items():
 
@@ -309,11 +408,9 @@ class StringGraph(object):
             if len(out_edges) == 0:
                 continue
 
-            out_edges.sort(key=lambda x: x.attr["length"])
-
             for e in out_edges:
                 w = e.out_node
-                n_mark[w.name] = "inplay"
+                n_mark[w.name] = INPLAY
 
             max_len = out_edges[-1].attr["length"]
 
@@ -322,36 +419,35 @@ class StringGraph(object):
             for e in out_edges:
                 e_len = e.attr["length"]
                 w = e.out_node
-                if n_mark[w.name] == "inplay":
-                    w.out_edges.sort(key=lambda x: x.attr["length"])
+                if n_mark[w.name] == INPLAY:
                     for e2 in w.out_edges:
-                        if e2.attr["length"] + e_len < max_len:
-                            x = e2.out_node
-                            if n_mark[x.name] == "inplay":
-                                n_mark[x.name] = "eliminated"
+                        if e2.attr["length"] + e_len >= max_len:
+                            break
+                        x = e2.out_node
+                        if n_mark[x.name] == INPLAY:
+                            n_mark[x.name] = ELIMINATED
 
             for e in out_edges:
-                e_len = e.attr["length"]
                 w = e.out_node
-                w.out_edges.sort(key=lambda x: x.attr["length"])
                 if len(w.out_edges) > 0:
                     x = w.out_edges[0].out_node
-                    if n_mark[x.name] == "inplay":
-                        n_mark[x.name] = "eliminated"
+                    if n_mark[x.name] == INPLAY:
+                        n_mark[x.name] = ELIMINATED
                 for e2 in w.out_edges:
-                    if e2.attr["length"] < FUZZ:
-                        x = e2.out_node
-                        if n_mark[x.name] == "inplay":
-                            n_mark[x.name] = "eliminated"
+                    if e2.attr["length"] >= FUZZ:
+                        break
+                    x = e2.out_node
+                    if n_mark[x.name] == INPLAY:
+                        n_mark[x.name] = ELIMINATED
 
             for out_edge in out_edges:
                 v = out_edge.in_node
                 w = out_edge.out_node
-                if n_mark[w.name] == "eliminated":
+                if n_mark[w.name] == ELIMINATED:
                     e_reduce[(v.name, w.name)] = True
-                    v_name, w_name = reverse_end(w.name), reverse_end(v.name)
+                    v_name, w_name = w.name ^ 1, v.name ^ 1
                     e_reduce[(v_name, w_name)] = True
-                n_mark[w.name] = "vacant"
+                n_mark[w.name] = VACANT
 
     def mark_best_overlap(self):
         """
@@ -389,7 +485,7 @@ class StringGraph(object):
                 if (v, w) not in best_edges:
                     self.e_reduce[(v, w)] = True
                     removed_edges.add((v, w))
-                    v2, w2 = reverse_end(w), reverse_end(v)
+                    v2, w2 = w ^ 1, v ^ 1
                     self.e_reduce[(v2, w2)] = True
                     removed_edges.add((v2, w2))
 
@@ -483,6 +579,553 @@ class StringGraph(object):
 
         return removed_edges
 
+
+
+
+class CompactStringGraph(object):
+    """
+    array-backed string graph
+
+    Edges are numbered in the order in which they are added, and their
+    attributes are kept in columns indexed by the edge id. Once all the edges
+    are added, init_reduce_dict() builds the out and in adjacency in
+    compressed sparse row (CSR) form: the edges of node v are
+    out_edges[out_start[v]:out_start[v + 1]]. Out edges are sorted by
+    length (which is the order mark_tr_edges needs), in edges are kept in
+    insertion order. e_twin maps each edge to its reverse complement edge
+    (or -1), and the reduce flags are a Bitset indexed by the edge id.
+
+    The mark_* methods return sets of edge ids, rather than (v, w) tuples.
+    """
+
+    def __init__(self):
+        self.reads = ReadIndex()
+        self.best_in = {}
+        self.node_order = array.array('l')  # nodes, in the order they were first seen
+        self.node_seen = bytearray()
+        self.e_in = array.array('l')
+        self.e_out = array.array('l')
+        self.e_length = array.array('l')
+        self.e_score = array.array('l')
+        self.e_identity = array.array('d')
+        self.e_inphase = bytearray()
+        self.e_rid = array.array('l')  # the read spanned by the edge, from sp to tp
+        self.e_sp = array.array('l')
+        self.e_tp = array.array('l')
+        self.inphase_values = []
+        self.inphase_codes = {}
+        self.e_alive = None
+        self.e_twin = None
+        self.e_reduce = None
+        self.out_start = None
+        self.out_edges = None
+        self.in_start = None
+        self.in_edges = None
+
+    def add_node(self, node):
+        node_seen = self.node_seen
+        if node >= len(node_seen):
+            # Keep room for the reverse complement node (node ^ 1) as well.
+            node_seen.extend(bytes(max((node | 1) + 1, 2 * len(node_seen)) - len(node_seen)))
+        if not node_seen[node]:
+            node_seen[node] = 1
+            self.node_order.append(node)
+
+    def add_edge(self, in_node_name, out_node_name, rid, sp, tp, length, score, identity, inphase):
+        """
+        add an edge into the graph by given a pair of nodes
+        """
+        self.add_node(in_node_name)
+        self.add_node(out_node_name)
+        code = self.inphase_codes.get(inphase)
+        if code is None:
+            code = len(self.inphase_values)
+            self.inphase_codes[inphase] = code
+            self.inphase_values.append(inphase)
+        self.e_in.append(in_node_name)
+        self.e_out.append(out_node_name)
+        self.e_rid.append(rid)
+        self.e_sp.append(sp)
+        self.e_tp.append(tp)
+        self.e_length.append(length)
+        self.e_score.append(score)
+        self.e_identity.append(identity)
+        self.e_inphase.append(code)
+
+    def init_reduce_dict(self):
+        """
+        build the CSR adjacency and clear the reduce flags, once all the edges were added
+        """
+        n_nodes = len(self.node_seen)
+        n_edges = len(self.e_in)
+        e_out = self.e_out
+        self.e_alive = alive = bytearray(b'\x01') * n_edges
+        self.out_start, self.out_edges = build_csr(self.e_in, n_nodes, alive)
+
+        # Adding the same (v, w) pair more than once only updates the
+        # attributes of the first edge, as in StringGraph.add_edge().
+        out_start, out_edges = self.out_start, self.out_edges
+        n_dup = 0
+        for v in self.node_order:
+            s, t = out_start[v], out_start[v + 1]
+            if t - s < 2:
+                continue
+            first = {}
+            for e in out_edges[s:t]:
+                w = e_out[e]
+                if w in first:
+                    self.copy_edge_attributes(e, first[w])
+                    alive[e] = 0
+                    n_dup += 1
+                else:
+                    first[w] = e
+        if n_dup:
+            self.out_start, self.out_edges = build_csr(self.e_in, n_nodes, alive)
+            out_start, out_edges = self.out_start, self.out_edges
+        self.in_start, self.in_edges = build_csr(self.e_out, n_nodes, alive)
+
+        e_length = self.e_length
+        for v in self.node_order:
+            s, t = out_start[v], out_start[v + 1]
+            if t - s > 1:
+                out_edges[s:t] = array.array('l', sorted(out_edges[s:t], key=e_length.__getitem__))
+
+        e_in = self.e_in
+        find_edge = self.find_edge
+        self.e_twin = e_twin = array.array('l', [-1]) * n_edges
+        for e in range(n_edges):
+            if alive[e]:
+                e_twin[e] = find_edge(e_out[e] ^ 1, e_in[e] ^ 1)
+
+        self.e_reduce = Bitset(n_edges)
+
+    def copy_edge_attributes(self, e_from, e_to):
+        for column in (self.e_rid, self.e_sp, self.e_tp, self.e_length, self.e_score, self.e_identity, self.e_inphase):
+            column[e_to] = column[e_from]
+
+    def out_edges_of(self, v):
+        return self.out_edges[self.out_start[v]:self.out_start[v + 1]]
+
+    def in_edges_of(self, v):
+        return self.in_edges[self.in_start[v]:self.in_start[v + 1]]
+
+    def find_edge(self, v, w):
+        """
+        return the id of the edge v->w, or -1
+        """
+        out_edges = self.out_edges
+        e_out = self.e_out
+        for i in range(self.out_start[v], self.out_start[v + 1]):
+            if e_out[out_edges[i]] == w:
+                return out_edges[i]
+        return -1
+
+    def reduce_edge(self, e):
+        """
+        set the reduce flag of an edge and of its twin edge; return the twin edge id, or -1
+        """
+        e_reduce = self.e_reduce
+        e_reduce[e] = 1
+        d = self.e_twin[e]
+        if d >= 0:
+            e_reduce[d] = 1
+        return d
+
+    def iter_edges(self):
+        """
+        yield (key, v, w, rid, sp, tp, length, score, identity, inphase, reduced) in insertion order,
+        where key is the edge id and rid is the index of the read that the edge spans
+        """
+        e_in, e_out = self.e_in, self.e_out
+        e_rid, e_sp, e_tp = self.e_rid, self.e_sp, self.e_tp
+        e_length, e_score, e_identity = self.e_length, self.e_score, self.e_identity
+        e_inphase, inphase_values = self.e_inphase, self.inphase_values
+        e_alive, e_reduce = self.e_alive, self.e_reduce
+        for e in range(len(e_in)):
+            if e_alive[e]:
+                yield (e, e_in[e], e_out[e], e_rid[e], e_sp[e], e_tp[e], e_length[e], e_score[e], e_identity[e],
+                       inphase_values[e_inphase[e]], e_reduce[e])
+
+    def count_reduced(self):
+        return self.e_reduce.count()
+
+    def count_not_reduced(self):
+        return sum(self.e_alive) - self.e_reduce.count()
+
+    def bfs_nodes(self, n, exclude=None, depth=5):
+        out_start, out_edges, e_out = self.out_start, self.out_edges, self.e_out
+        all_nodes = set()
+        all_nodes.add(n)
+        candidate_nodes = set()
+        candidate_nodes.add(n)
+        dp = 1
+        while dp < depth and len(candidate_nodes) > 0:
+            v = candidate_nodes.pop()
+            for i in range(out_start[v], out_start[v + 1]):
+                w = e_out[out_edges[i]]
+                if w == exclude:
+                    continue
+                if w not in all_nodes:
+                    all_nodes.add(w)
+                    if out_start[w + 1] > out_start[w]:
+                        candidate_nodes.add(w)
+            dp += 1
+
+        return all_nodes
+
+    def mark_edge_and_dual(self, e, marked_edges):
+        marked_edges.add(e)
+        d = self.reduce_edge(e)
+        if d >= 0:
+            marked_edges.add(d)
+
+    def mark_chimer_edges(self):
+
+        e_in, e_out, e_reduce = self.e_in, self.e_out, self.e_reduce
+        multi_in_nodes = {}
+        multi_out_nodes = {}
+        for n in self.node_order:
+            out_nodes = [e_out[e] for e in self.out_edges_of(n) if not e_reduce[e]]
+            in_nodes = [e_in[e] for e in self.in_edges_of(n) if not e_reduce[e]]
+
+            if len(out_nodes) >= 2:
+                multi_out_nodes[n] = out_nodes
+            if len(in_nodes) >= 2:
+                multi_in_nodes[n] = in_nodes
+
+        out_set = set()
+        in_set = set()
+        for n in multi_out_nodes:
+            out_set |= set(multi_out_nodes[n])
+
+        for n in multi_in_nodes:
+            in_set |= set(multi_in_nodes[n])
+
+        chimer_candidates = out_set & in_set
+
+        chimer_nodes = []
+        chimer_edges = set()
+        for n in chimer_candidates:
+            out_nodes = set([e_out[e] for e in self.out_edges_of(n)])
+            test_set = set()
+            for in_node in [e_in[e] for e in self.in_edges_of(n)]:
+                test_set = test_set | set(
+                    [e_out[e] for e in self.out_edges_of(in_node)])
+            test_set -= set([n])
+            if len(out_nodes & test_set) == 0:
+                flow_node1 = set()
+                flow_node2 = set()
+                for v in list(out_nodes):
+                    flow_node1 |= self.bfs_nodes(v, exclude=n)
+                for v in list(test_set):
+                    flow_node2 |= self.bfs_nodes(v, exclude=n)
+                if len(flow_node1 & flow_node2) == 0:
+                    for e in self.out_edges_of(n):
+                        if not e_reduce[e]:
+                            self.mark_edge_and_dual(e, chimer_edges)
+                    for e in self.in_edges_of(n):
+                        if not e_reduce[e]:
+                            self.mark_edge_and_dual(e, chimer_edges)
+                    chimer_nodes.append(n)
+                    chimer_nodes.append(n ^ 1)
+
+        return chimer_nodes, chimer_edges
+
+    def mark_spur_edge(self):
+
+        e_in, e_out, e_reduce = self.e_in, self.e_out, self.e_reduce
+        out_start, in_start = self.out_start, self.in_start
+        removed_edges = set()
+        for v in self.node_order:
+            out_edges = self.out_edges_of(v)
+            if len([e for e in out_edges if not e_reduce[e]]) > 1:
+                for e in out_edges:
+                    w = e_out[e]
+                    if out_start[w + 1] == out_start[w] and not e_reduce[e]:
+                        self.mark_edge_and_dual(e, removed_edges)
+
+            in_edges = self.in_edges_of(v)
+            if len([e for e in in_edges if not e_reduce[e]]) > 1:
+                for e in in_edges:
+                    w = e_in[e]
+                    if in_start[w + 1] == in_start[w] and not e_reduce[e]:
+                        self.mark_edge_and_dual(e, removed_edges)
+        return removed_edges
+
+    def mark_tr_edges(self, workers=1):
+        """
+        transitive reduction
+
+        With workers > 1, batches of nodes are reduced by a pool of processes,
+        which share the adjacency through shared memory.
+        """
+        e_out, e_length = self.e_out, self.e_length
+        out_start, out_edges = self.out_start, self.out_edges
+        # out neighbours and edge lengths, aligned with out_edges
+        out_nbr = array.array('l', map(e_out.__getitem__, out_edges))
+        out_len = array.array('l', map(e_length.__getitem__, out_edges))
+
+        node_order = self.node_order
+        if workers > 1 and len(node_order) > TR_BATCH_SIZE:
+            batches = parallel_tr_reduced_positions(
+                workers, node_order, out_start, out_nbr, out_len, len(self.node_seen))
+        else:
+            n_mark = bytearray(len(self.node_seen))
+            batches = (tr_reduced_positions(node_order[b:b + TR_BATCH_SIZE], out_start, out_nbr, out_len, n_mark)
+                       for b in range(0, len(node_order), TR_BATCH_SIZE))
+
+        # The reductions of a node do not depend on the flags set for other
+        # nodes, so the batches can be merged in any order.
+        reduce_edge = self.reduce_edge
+        for reduced in batches:
+            for i in reduced:
+                reduce_edge(out_edges[i])
+
+    def mark_best_overlap(self):
+        """
+        find the best overlapped edges
+        """
+
+        e_in, e_score, e_reduce = self.e_in, self.e_score, self.e_reduce
+        best_edges = bytearray(len(e_in))
+        removed_edges = set()
+
+        # The best edge is the first non-reduced edge with the highest score,
+        # in adjacency order.
+        for v in self.node_order:
+            best = -1
+            for e in self.out_edges_of(v):
+                if not e_reduce[e] and (best < 0 or e_score[e] > e_score[best]):
+                    best = e
+            if best >= 0:
+                best_edges[best] = 1
+
+            best = -1
+            for e in self.in_edges_of(v):
+                if not e_reduce[e] and (best < 0 or e_score[e] > e_score[best]):
+                    best = e
+            if best >= 0:
+                best_edges[best] = 1
+                self.best_in[v] = e_in[best]
+
+        LOG.debug(f"X {sum(best_edges)}")
+
+        e_alive = self.e_alive
+        for e in range(len(e_in)):
+            if e_alive[e] and not e_reduce[e] and not best_edges[e]:
+                self.mark_edge_and_dual(e, removed_edges)
+
+        return removed_edges
+
+    def resolve_repeat_edges(self):
+
+        e_in, e_out, e_reduce = self.e_in, self.e_out, self.e_reduce
+        edges_to_reduce = []
+        nodes_to_test = set()
+        for v in self.node_order:
+            out_nodes = [e_out[e] for e in self.out_edges_of(v) if not e_reduce[e]]
+            in_nodes = [e_in[e] for e in self.in_edges_of(v) if not e_reduce[e]]
+            if len(out_nodes) == 1 and len(in_nodes) == 1:
+                nodes_to_test.add(v)
+
+        for v in list(nodes_to_test):
+
+            out_nodes = [e_out[e] for e in self.out_edges_of(v) if not e_reduce[e]]
+            in_nodes = [e_in[e] for e in self.in_edges_of(v) if not e_reduce[e]]
+
+            v_out_nodes = frozenset([e_out[e] for e in self.out_edges_of(v)])
+            for e in self.out_edges_of(in_nodes[0]):
+                ww = e_out[e]
+                ww_out_nodes = frozenset([e_out[e2] for e2 in self.out_edges_of(ww)])
+                o_overlap = len(ww_out_nodes & v_out_nodes)
+                ww_in_count = len([e2 for e2 in self.in_edges_of(ww) if not e_reduce[e2]])
+
+                if ww != v and\
+                   not e_reduce[e] and\
+                   ww_in_count > 1 and\
+                   ww not in nodes_to_test and\
+                   o_overlap == 0:
+                    edges_to_reduce.append(e)
+
+            v_in_nodes = frozenset([e_in[e] for e in self.in_edges_of(v)])
+            for e in self.in_edges_of(out_nodes[0]):
+                vv = e_in[e]
+                vv_in_nodes = frozenset([e_in[e2] for e2 in self.in_edges_of(vv)])
+                i_overlap = len(vv_in_nodes & v_in_nodes)
+                vv_out_count = len([e2 for e2 in self.out_edges_of(vv) if not e_reduce[e2]])
+
+                if vv != v and\
+                   not e_reduce[e] and\
+                   vv_out_count > 1 and\
+                   vv not in nodes_to_test and\
+                   i_overlap == 0:
+                    edges_to_reduce.append(e)
+
+        removed_edges = set()
+        for e in edges_to_reduce:
+            e_reduce[e] = 1
+            removed_edges.add(e)
+
+        return removed_edges
+
+
+def tr_reduced_positions(nodes, out_start, out_nbr, out_len, n_mark):
+    """
+    transitive reduction of the out edges of a batch of nodes
+
+    out_start/out_nbr/out_len is the out adjacency in CSR form, with each
+    node's out edges sorted by length, and n_mark is a VACANT byte per node.
+    Return the positions (in out_nbr) of the transitive redundant edges.
+    """
+    FUZZ = TR_FUZZ
+    bisect_left = bisect.bisect_left
+    reduced = []
+    for n in nodes:
+        s, t = out_start[n], out_start[n + 1]
+        if s == t:
+            continue
+
+        nbrs = out_nbr[s:t]
+        for w in nbrs:
+            n_mark[w] = INPLAY
+
+        max_len = out_len[t - 1] + FUZZ
+
+        for i in range(s, t):
+            w = out_nbr[i]
+            if n_mark[w] == INPLAY:
+                # out edges of w with length + e_len < max_len
+                ws = out_start[w]
+                we = bisect_left(out_len, max_len - out_len[i], ws, out_start[w + 1])
+                for x in out_nbr[ws:we]:
+                    if n_mark[x] == INPLAY:
+                        n_mark[x] = ELIMINATED
+
+        for w in nbrs:
+            ws, wt = out_start[w], out_start[w + 1]
+            if ws < wt:
+                x = out_nbr[ws]
+                if n_mark[x] == INPLAY:
+                    n_mark[x] = ELIMINATED
+                # out edges of w with length < FUZZ
+                for x in out_nbr[ws:bisect_left(out_len, FUZZ, ws, wt)]:
+                    if n_mark[x] == INPLAY:
+                        n_mark[x] = ELIMINATED
+
+        for i in range(s, t):
+            w = out_nbr[i]
+            if n_mark[w] == ELIMINATED:
+                reduced.append(i)
+            n_mark[w] = VACANT
+
+    return reduced
+
+
+class Bitset(object):
+    """
+    fixed size array of flags, stored one bit per flag
+    """
+
+    __slots__ = ('bits',)
+
+    def __init__(self, size):
+        self.bits = bytearray((size + 7) >> 3)
+
+    def __getitem__(self, i):
+        return (self.bits[i >> 3] >> (i & 7)) & 1
+
+    def __setitem__(self, i, value):
+        if value:
+            self.bits[i >> 3] |= 1 << (i & 7)
+        else:
+            self.bits[i >> 3] &= ~(1 << (i & 7)) & 0xff
+
+    def count(self):
+        """
+        number of flags that are set
+        """
+        return bin(int.from_bytes(self.bits, 'little')).count('1')
+
+
+# adjacency of the string graph, as seen by the transitive reduction workers
+tr_shared = {}
+
+def share_array(a):
+    """
+    copy an array into a new shared memory block
+    """
+    from multiprocessing import shared_memory
+    nbytes = len(a) * a.itemsize
+    shm = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+    shm.buf[:nbytes] = memoryview(a).cast('B')
+    return shm
+
+def tr_worker_init(arrays, n_nodes):
+    from multiprocessing import shared_memory
+    for key, (shm_name, typecode, length) in arrays.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        itemsize = array.array(typecode).itemsize
+        tr_shared[key] = shm.buf[:length * itemsize].cast(typecode)
+        tr_shared[key + '_shm'] = shm  # keep the block mapped
+    tr_shared['n_mark'] = bytearray(n_nodes)
+
+def tr_worker(node_range):
+    b, e = node_range
+    reduced = tr_reduced_positions(tr_shared['node_order'][b:e], tr_shared['out_start'],
+                                   tr_shared['out_nbr'], tr_shared['out_len'], tr_shared['n_mark'])
+    return array.array('l', reduced)
+
+def parallel_tr_reduced_positions(workers, node_order, out_start, out_nbr, out_len, n_nodes):
+    """
+    run tr_reduced_positions() over batches of node_order in a pool of processes;
+    return the list of the reduced positions of each batch, in node order
+    """
+    import multiprocessing
+    columns = {
+        'node_order': node_order,
+        'out_start': out_start,
+        'out_nbr': out_nbr,
+        'out_len': out_len,
+    }
+    blocks = []
+    try:
+        arrays = {}
+        for key, a in columns.items():
+            shm = share_array(a)
+            blocks.append(shm)
+            arrays[key] = (shm.name, a.typecode, len(a))
+        node_ranges = [(b, min(b + TR_BATCH_SIZE, len(node_order)))
+                       for b in range(0, len(node_order), TR_BATCH_SIZE)]
+        LOG.info('Transitive reduction of {} nodes in {} batches, with {} workers.'.format(
+            len(node_order), len(node_ranges), workers))
+        with multiprocessing.Pool(workers, initializer=tr_worker_init, initargs=(arrays, n_nodes)) as pool:
+            return pool.map(tr_worker, node_ranges)
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+
+def build_csr(keys, n_nodes, alive):
+    """
+    group the (alive) edge ids by keys[edge], keeping the edge order within each group;
+    return (start, edges), where the edges of node v are edges[start[v]:start[v + 1]]
+    """
+    start = array.array('l', [0]) * (n_nodes + 1)
+    for e, v in enumerate(keys):
+        if alive[e]:
+            start[v + 1] += 1
+    for v in range(n_nodes):
+        start[v + 1] += start[v]
+    pos = start[:-1]
+    edges = array.array('l', [0]) * start[n_nodes]
+    for e, v in enumerate(keys):
+        if alive[e]:
+            edges[pos[v]] = e
+            pos[v] += 1
+    return start, edges
+
+
 def reverse_edge(e):
     e1, e2 = e
     return reverse_end(e2), reverse_end(e1)
@@ -563,15 +1206,122 @@ def ego_dfs_with_convergence(ug, u_edge_data, start_node, depth_cutoff, width_cu
 
     return local_graph
 
-def find_bundle(ug, u_edge_data, start_node, depth_cutoff, width_cutoff, length_cutoff, no_out_edge_printed):
+class EgoGraphView(object):
+    """
+    lazy view of the part of a MultiDiGraph within radius out-edge hops of a start node
+
+    It has the nodes and edges of nx.ego_graph(ug, start_node, radius), in
+    the order of ug, but nothing is copied: the BFS distances from the
+    start node are only computed as far as the queries need them. The
+    predecessors looked at by in_edges are checked by a search back to the
+    current BFS level (see in_view()), so that the in edges from outside
+    the view do not extend the BFS to the full radius. The out_edges/in_edges
+    of a node are only defined for nodes within the view.
+    """
+
+    def __init__(self, ug, start_node, radius, node_rank=None):
+        self.succ = ug.succ
+        self.pred = ug.pred
+        self.radius = radius
+        # the position of each node in ug, which orders the in edges
+        if node_rank is None:
+            node_rank = {n: i for (i, n) in enumerate(ug)}
+        self.node_rank = node_rank
+        self.dist = {start_node: 0}
+        self.frontier = [start_node]
+        self.level = 0  # all the nodes up to this distance were found
+        self.far_dist = {}  # in_view() distances beyond the level (None if further than radius)
+
+    def distance(self, n):
+        """
+        return the distance of n from the start node, or None if it is more than radius
+        """
+        dist = self.dist
+        while n not in dist and self.frontier and self.level < self.radius:
+            succ = self.succ
+            level = self.level + 1
+            frontier = []
+            for v in self.frontier:
+                for w in succ[v]:
+                    if w not in dist:
+                        dist[w] = level
+                        frontier.append(w)
+            self.frontier = frontier
+            self.level = level
+        return dist.get(n)
+
+    def __contains__(self, n):
+        return self.distance(n) is not None
+
+    def in_view(self, n):
+        """
+        tell if n is within the view, like n in self, but without extending the BFS
+
+        A node beyond the current level has a shortest path from a node at
+        that level, through nodes beyond the level only. So it is searched
+        back from n over at most radius - level in edges, through the nodes
+        which were not found yet.
+        """
+        if n in self.dist or not self.frontier or self.level == self.radius:
+            # The BFS has nothing more to find, or n was found already.
+            return n in self.dist
+        if n not in self.far_dist:
+            self.far_dist[n] = self.search_back(n)
+        return self.far_dist[n] is not None
+
+    def search_back(self, n):
+        """
+        return the distance of n, a node beyond the current level, or None if it is more than radius
+        """
+        pred = self.pred
+        dist = self.dist
+        level = self.level
+        seen = {n}
+        layer = [n]
+        for k in range(1, self.radius - level + 1):
+            next_layer = []
+            for v in layer:
+                for u in pred[v]:
+                    if u in dist:
+                        # A node beyond the level has no predecessor before the level.
+                        return level + k
+                    if u not in seen:
+                        seen.add(u)
+                        next_layer.append(u)
+            if not next_layer:
+                break
+            layer = next_layer
+        return None
+
+    def out_edges(self, v, keys=True):
+        succ_v = self.succ[v]
+        if self.distance(v) < self.radius:
+            # All the successors of v are within the radius.
+            return [(v, w, k) for w in succ_v for k in succ_v[w]]
+        return [(v, w, k) for w in succ_v if w in self for k in succ_v[w]]
+
+    def in_edges(self, v, keys=True):
+        pred_v = self.pred[v]
+        in_nodes = [u for u in pred_v if self.in_view(u)]
+        in_nodes.sort(key=self.node_rank.__getitem__)
+        return [(u, v, k) for u in in_nodes for k in pred_v[u]]
+
+
+def find_bundle(ug, u_edge_data, start_node, depth_cutoff, width_cutoff, length_cutoff, dead_end_nodes, node_rank=None):
+    """
+    search for a bundle (a bubble-like compound path) starting at start_node
+
+    The tips without out edges that the search runs into are added to dead_end_nodes.
+    """
 
     tips = set()
     bundle_edges = set()
     bundle_nodes = set()
 
-    # Almost the entire runtime of this script is spent in the nx.ego_graph function when
-    # the depth_cutoff is large.
-    # The local_graph is used in several places in the code belo. In a couple of places
+    # Almost the entire runtime of this script used to be spent in the nx.ego_graph function when
+    # the depth_cutoff is large. The EgoGraphView has the same nodes and edges, but only
+    # explores the neighbourhood of start_node as far as the bundle search below needs it.
+    # The local_graph is used in several places in the code below. In a couple of places
     # the out edges of each node are looked at. All out edges of ug are present in the
     # local graph (given that the depth_cutoff is satisfied), so this condition is ok.
     # There are two places where the in-edges are looked up. In one place, any in-edge
@@ -584,7 +1334,7 @@ def find_bundle(ug, u_edge_data, start_node, depth_cutoff, width_cutoff, length_
     # bubbles that are not clean. By removing the ego_graph we actually make it more
     # stringent, and generate bubbles which shouldn't be able to connect to other places internally.
     #
-    local_graph = nx.ego_graph(ug, start_node, depth_cutoff, undirected=False)
+    local_graph = EgoGraphView(ug, start_node, depth_cutoff, node_rank)
     # local_graph = ego_dfs_with_convergence(ug, u_edge_data, start_node, depth_cutoff, width_cutoff, length_cutoff, stop_on_convergence = True, undirected = False)
     # local_graph = ug
     length_to_node = {start_node: 0}
@@ -593,7 +1343,9 @@ def find_bundle(ug, u_edge_data, start_node, depth_cutoff, width_cutoff, length_
     v = start_node
     end_node = start_node
 
-    LOG.debug(f"\n\nstart {start_node}")
+    trace = TRACE.find_bundle
+    if trace:
+        TRACE('find_bundle', 'start', node=start_node)
 
     bundle_nodes.add(v)
     for vv, ww, kk in local_graph.out_edges(v, keys=True):
@@ -614,7 +1366,8 @@ def find_bundle(ug, u_edge_data, start_node, depth_cutoff, width_cutoff, length_
     converage = False
 
     while 1:
-        LOG.debug(f"# of tips {len(tips)}")
+        if trace:
+            TRACE('find_bundle', 'tips', count=len(tips))
 
         if len(tips) > 4:
             converage = False
@@ -623,7 +1376,8 @@ def find_bundle(ug, u_edge_data, start_node, depth_cutoff, width_cutoff, length_
         if len(tips) == 1:
             end_node = tips.pop()
 
-            LOG.debug(f"end {end_node}")
+            if trace:
+                TRACE('find_bundle', 'end', node=end_node)
 
             if end_node not in length_to_node:
                 v = end_node
@@ -668,12 +1422,11 @@ def find_bundle(ug, u_edge_data, start_node, depth_cutoff, width_cutoff, length_
         length_limit_reached = False
 
         for v in tips_list:
-            LOG.debug(f"process {v}")
+            if trace:
+                TRACE('find_bundle', 'process', node=v)
 
             if len(local_graph.out_edges(v, keys=True)) == 0:  # dead end route
-                if v not in no_out_edge_printed:
-                    print("no out edge", v)
-                    no_out_edge_printed.add(v)
+                dead_end_nodes.add(v)
                 continue
 
             max_score_edge = None
@@ -682,8 +1435,8 @@ def find_bundle(ug, u_edge_data, start_node, depth_cutoff, width_cutoff, length_
             extend_tip = True
 
             for uu, vv, kk in local_graph.in_edges(v, keys=True):
-                LOG.debug(f"in_edges {uu} {vv} {kk}")
-                LOG.debug(f"{uu} in length_to_node {uu in length_to_node}")
+                if trace:
+                    TRACE('find_bundle', 'in_edge', edge=(uu, vv, kk), reached=uu in length_to_node)
 
                 # A predecessor of this node was not processed before!
                 # Node has incoming edges outside of bundle, or tips which are
@@ -714,17 +1467,20 @@ def find_bundle(ug, u_edge_data, start_node, depth_cutoff, width_cutoff, length_
                 v_updated = False
                 for vv, ww, kk in local_graph.out_edges(v, keys=True):
 
-                    LOG.debug(f"test {vv} {ww} {kk}")
+                    if trace:
+                        TRACE('find_bundle', 'test', edge=(vv, ww, kk))
 
                     if ww in length_to_node:
                         loop_detect = True
-                        LOG.debug(f"loop_detect {ww}")
+                        if trace:
+                            TRACE('find_bundle', 'loop_detect', node=ww)
                         break
 
                     if (vv, ww, kk) not in bundle_edges and\
                             reverse_end(ww) not in bundle_nodes:
 
-                        LOG.debug(f"add {ww}")
+                        if trace:
+                            TRACE('find_bundle', 'add', node=ww)
 
                         tips.add(ww)
                         bundle_edges.add((vv, ww, kk))
@@ -733,7 +1489,8 @@ def find_bundle(ug, u_edge_data, start_node, depth_cutoff, width_cutoff, length_
 
                 if v_updated:
 
-                    LOG.debug(f"remove {v}")
+                    if trace:
+                        TRACE('find_bundle', 'remove', node=v)
 
                     tips.remove(v)
 
@@ -764,32 +1521,51 @@ def find_bundle(ug, u_edge_data, start_node, depth_cutoff, width_cutoff, length_
 
     data_r = None
 
-    LOG.debug(f"{converage} {data} {data_r}")
+    if trace:
+        TRACE('find_bundle', 'result', coverage=converage, data=data)
     return converage, data, data_r
 
-def init_string_graph(overlap_data):
-    sg = StringGraph()
+STRING_GRAPH_ENGINES = {
+    'compact': CompactStringGraph,
+    'object': StringGraph,
+}
+
+def init_string_graph(overlap_blocks, engine='compact', tr_workers=1):
+    """
+    build the string graph from batches of overlaps (OverlapBlock), and mark the transitive redundant edges
+
+    The overlap_blocks are usually read lazily (see read_overlaps()), so
+    the reading and parsing time is in the read_overlaps stage.
+    """
+    time_read_overlaps = REPORT.start()
+    sg = STRING_GRAPH_ENGINES[engine]()
 
+    reads = sg.reads
     overlap_set = set()
-    for od in overlap_data:
-        f_id, g_id, score, identity = od[:4]
-        f_s, f_b, f_e, f_l = od[4:8]
-        g_s, g_b, g_e, g_l = od[8:12]
+    overlap_data = itertools.chain.from_iterable(block.indexed_records(reads) for block in overlap_blocks)
+    for (f_index, g_index, score, identity,
+         f_s, f_b, f_e, f_l,
+         g_s, g_b, g_e, g_l, inphase) in overlap_data:
         # Valid in-phase options:
         #     i: in phase (keepers)
         #     x: not in phase (scraps)
         #     f: five prime overlaps were all phased - turns off phasing  (keepers)
         #     t: three prime overlaps were all phased - turns off phasing (keepers)
         #     n: no cross phase overlaps were removed (keepers)
-        inphase = od[12]
-        overlap_pair = [f_id, g_id]
-        overlap_pair.sort()
-        overlap_pair = tuple(overlap_pair)
+        if f_index < g_index:
+            overlap_pair = (f_index, g_index)
+        else:
+            overlap_pair = (g_index, f_index)
         if overlap_pair in overlap_set:  # don't allow duplicated records
             continue
         else:
             overlap_set.add(overlap_pair)
 
+        f_B = f_index * 2
+        f_E = f_B + 1
+        g_B = g_index * 2
+        g_E = g_B + 1
+
         if g_s == 1:  # revered alignment, swapping the begin and end coordinates
             g_b, g_e = g_e, g_b
 
@@ -804,12 +1580,12 @@ def init_string_graph(overlap_data):
                 """
                 if f_b == 0 or g_e - g_l == 0:
                     continue
-                sg.add_edge("%s:B" % g_id, "%s:B" % f_id, label="%s:%d-%d"%(f_id, f_b, 0),
+                sg.add_edge(g_B, f_B, rid=f_index, sp=f_b, tp=0,
                             length=abs(f_b - 0),
                             score=-score,
                             identity=identity,
                             inphase=inphase)
-                sg.add_edge("%s:E" % f_id, "%s:E" % g_id, label="%s:%d-%d"%(g_id, g_e, g_l),
+                sg.add_edge(f_E, g_E, rid=g_index, sp=g_e, tp=g_l,
                             length=abs(g_e - g_l),
                             score=-score,
                             identity=identity,
@@ -823,12 +1599,12 @@ def init_string_graph(overlap_data):
                 """
                 if f_b == 0 or g_e == 0:
                     continue
-                sg.add_edge("%s:E" % g_id, "%s:B" % f_id, label="%s:%d-%d"%(f_id, f_b, 0),
+                sg.add_edge(g_E, f_B, rid=f_index, sp=f_b, tp=0,
                             length=abs(f_b - 0),
                             score=-score,
                             identity=identity,
                             inphase=inphase)
-                sg.add_edge("%s:E" % f_id, "%s:B" % g_id, label="%s:%d-%d"%(g_id, g_e, 0),
+                sg.add_edge(f_E, g_B, rid=g_index, sp=g_e, tp=0,
                             length=abs(g_e - 0),
                             score=-score,
                             identity=identity,
@@ -843,12 +1619,12 @@ def init_string_graph(overlap_data):
                 """
                 if g_b == 0 or f_e - f_l == 0:
                     continue
-                sg.add_edge("%s:B" % f_id, "%s:B" % g_id, label="%s:%d-%d"%(g_id, g_b, 0),
+                sg.add_edge(f_B, g_B, rid=g_index, sp=g_b, tp=0,
                             length=abs(g_b - 0),
                             score=-score,
                             identity=identity,
                             inphase=inphase)
-                sg.add_edge("%s:E" % g_id, "%s:E" % f_id, label="%s:%d-%d"%(f_id, f_e, f_l),
+                sg.add_edge(g_E, f_E, rid=f_index, sp=f_e, tp=f_l,
                             length=abs(f_e - f_l),
                             score=-score,
                             identity=identity,
@@ -862,102 +1638,108 @@ def init_string_graph(overlap_data):
                 """
                 if g_b - g_l == 0 or f_e - f_l == 0:
                     continue
-                sg.add_edge("%s:B" % f_id, "%s:E" % g_id, label="%s:%d-%d"%(g_id, g_b, g_l),
+                sg.add_edge(f_B, g_E, rid=g_index, sp=g_b, tp=g_l,
                             length=abs(g_b - g_l),
                             score=-score,
                             identity=identity,
                             inphase=inphase)
-                sg.add_edge("%s:B" % g_id, "%s:E" % f_id, label="%s:%d-%d"%(f_id, f_e, f_l),
+                sg.add_edge(g_B, f_E, rid=f_index, sp=f_e, tp=f_l,
                             length=abs(f_e - f_l),
                             score=-score,
                             identity=identity,
                             inphase=inphase)
 
+    REPORT.end('read_overlaps', time_read_overlaps, overlaps=len(overlap_set))
+
+    time_mark_tr_edges = REPORT.start()
     sg.init_reduce_dict()
-    sg.mark_tr_edges()  # mark those edges that transitive redundant
+    sg.mark_tr_edges(tr_workers)  # mark those edges that transitive redundant
+    REPORT.end('mark_tr_edges', time_mark_tr_edges)
     return sg
 
-re_label = re.compile(r"(.*):(\d+)-(\d+)")
+class BufferedTextWriter(object):
+    """
+    text output file, which collects the written strings and writes them in large chunks
+
+    With compress=True, the file is written with gzip, and ".gz" is added to its name.
+    """
 
-def init_digraph(sg, chimer_edges, removed_edges, spur_edges):
+    def __init__(self, fn, compress=False, buffer_size=OUTPUT_BUFFER_SIZE):
+        if compress:
+            import gzip
+            self.fn = fn + '.gz'
+            self.file = gzip.open(self.fn, 'wt', compresslevel=6)
+        else:
+            self.fn = fn
+            self.file = open(fn, 'w')
+        self.buffer_size = buffer_size
+        self.parts = []
+        self.size = 0
+
+    def write(self, text):
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        self.file.write(''.join(self.parts))
+        self.parts = []
+        self.size = 0
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def init_digraph(sg, chimer_edges, removed_edges, spur_edges, compress=False):
     nxsg = nx.DiGraph()
     edge_data = {}
-    with open("sg_edges_list", "w") as out_f:
-        for v, w in sg.edges: # sort, or OrderedDict
-            e = sg.edges[(v, w)]
-            label = e.attr["label"]
-            score = e.attr["score"]
-            identity = e.attr["identity"]
-            length = e.attr["length"]
-            inphase = e.attr["inphase"]
-            try:
-                mo = re_label.search(label)
-                rid = mo.group(1)
-                sp = int(mo.group(2))
-                tp = int(mo.group(3))
-            except Exception:
-                msg = 'parsing label="{}"'.format(label)
-                LOG.exception(msg)
-                raise
-            assert length == abs(sp - tp)
-
-            if not sg.e_reduce[(v, w)]:
+    node_name = sg.reads.node_name
+    read_names = sg.reads.names
+    with BufferedTextWriter("sg_edges_list", compress) as out_f:
+        write = out_f.write
+        for key, v, w, read_index, sp, tp, length, score, identity, inphase, reduced in sg.iter_edges():
+            rid = read_names[read_index]
+
+            if not reduced:
                 type_ = "G"
-            elif (v, w) in chimer_edges:
+            elif key in chimer_edges:
                 type_ = "C"
-            elif (v, w) in removed_edges:
+            elif key in removed_edges:
                 type_ = "R"
-            elif (v, w) in spur_edges:
+            elif key in spur_edges:
                 type_ = "S"
             else:
-                assert sg.e_reduce[(v, w)]
                 type_ = "TR"
 
-            if not sg.e_reduce[(v, w)]:
-                assert label == "%s:%d-%d" % (rid, sp, tp)
-                nxsg.add_edge(v, w, label=label, length=length, score=score)
+            if not reduced:
+                nxsg.add_edge(v, w, length=length, score=score)
                 edge_data[(v, w)] = (rid, sp, tp, length, score, identity, type_, inphase)
                 if w in sg.best_in:
                     nxsg.nodes[w]["best_in"] = v
 
-            line = '%s %s %s %5d %5d %5d %5.2f %s %s' % (
-                v, w, rid, sp, tp, score, identity, type_, inphase)
-            print(line, file=out_f)
+            write('%s %s %s %5d %5d %5d %5.2f %s %s\n' % (
+                node_name(v), node_name(w), rid, sp, tp, score, identity, type_, inphase))
 
     return nxsg, edge_data
 
 
-def yield_from_overlap_file(overlap_file):
-    # loop through the overlapping data to load the data in the a python array
-
-    with open(overlap_file) as f:
-        for line in f:
-            if line.startswith('-'):
-                break
-            l = line.strip().split()
-            f_id, g_id, score, identity = l[:4]
-
-            score = int(score)
-            identity = float(identity)
-            #contained_etc = l[12]
-            f_strand, f_start, f_end, f_len = (int(c) for c in l[4:8])
-            g_strand, g_start, g_end, g_len = (int(c) for c in l[8:12])
-            inphase = 'u' if len(l) < 15 else l[14]
-
-            yield (f_id, g_id, score, identity,
-                                f_strand, f_start, f_end, f_len,
-                                g_strand, g_start, g_end, g_len, inphase)
-
-def generate_nx_string_graph(sg, lfc=False, disable_chimer_bridge_removal=False):
-    LOG.debug("{}".format(sum([1 for c in sg.e_reduce.values() if c])))
-    LOG.debug("{}".format(sum([1 for c in sg.e_reduce.values() if not c])))
+def generate_nx_string_graph(sg, lfc=False, disable_chimer_bridge_removal=False, compress=False):
+    LOG.debug("{}".format(sg.count_reduced()))
+    LOG.debug("{}".format(sg.count_not_reduced()))
 
     if not disable_chimer_bridge_removal:
         chimer_nodes, chimer_edges = sg.mark_chimer_edges()
 
-        with open("chimers_nodes", "w") as f:
+        with BufferedTextWriter("chimers_nodes", compress) as f:
             for n in chimer_nodes:
-                print(n, file=f)
+                f.write(sg.reads.node_name(n) + '\n')
         del chimer_nodes
     else:
         chimer_edges = set()  # empty set
@@ -973,9 +1755,9 @@ def generate_nx_string_graph(sg, lfc=False, disable_chimer_bridge_removal=False)
 
     spur_edges.update(sg.mark_spur_edge())
 
-    LOG.debug('{}'.format(sum([1 for c in sg.e_reduce.values() if not c])))
+    LOG.debug('{}'.format(sg.count_not_reduced()))
 
-    nxsg, edge_data = init_digraph(sg, chimer_edges, removed_edges, spur_edges)
+    nxsg, edge_data = init_digraph(sg, chimer_edges, removed_edges, spur_edges, compress)
     return nxsg, edge_data
 
 def identify_branch_nodes(ug):
@@ -989,135 +1771,207 @@ def identify_branch_nodes(ug):
 
     return branch_nodes
 
-def construct_compound_paths_0(ug, u_edge_data, branch_nodes, depth_cutoff, width_cutoff, length_cutoff):
+# arguments of find_bundle() shared with the bundle search workers
+bundle_search_shared = {}
+
+def bundle_search_worker_init(ug, u_edge_data, depth_cutoff, width_cutoff, length_cutoff, node_rank):
+    bundle_search_shared['args'] = (ug, u_edge_data, depth_cutoff, width_cutoff, length_cutoff, node_rank)
+
+def bundle_search_worker(start_node):
+    ug, u_edge_data, depth_cutoff, width_cutoff, length_cutoff, node_rank = bundle_search_shared['args']
+    dead_end_nodes = set()
+    coverage, data, data_r = find_bundle(
+        ug, u_edge_data, start_node, depth_cutoff, width_cutoff, length_cutoff, dead_end_nodes, node_rank)
+    return coverage, data, dead_end_nodes
+
+def construct_compound_paths_0(ug, u_edge_data, branch_nodes, depth_cutoff, width_cutoff, length_cutoff, node_name=str, workers=1):
+    """
+    With workers > 1, the bundles are searched by a pool of processes (which
+    inherit ug when forked). The results are used in branch node order, so
+    they do not depend on the number of workers.
+    """
     no_out_edge_printed = set()
+    node_rank = {n: i for (i, n) in enumerate(ug)}
+
+    start_nodes = [p for p in branch_nodes if ug.out_degree(p) > 1]
+    worker_args = (ug, u_edge_data, depth_cutoff, width_cutoff, length_cutoff, node_rank)
+    if workers > 1 and len(start_nodes) > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(workers, initializer=bundle_search_worker_init, initargs=worker_args)
+        chunksize = max(1, min(64, len(start_nodes) // (4 * workers)))
+        results = pool.imap(bundle_search_worker, start_nodes, chunksize)
+    else:
+        pool = None
+        bundle_search_worker_init(*worker_args)
+        results = map(bundle_search_worker, start_nodes)
 
     compound_paths_0 = []
-    for p in list(branch_nodes):
-        if ug.out_degree(p) > 1:
-            coverage, data, data_r = find_bundle(
-                ug, u_edge_data, p, depth_cutoff, width_cutoff, length_cutoff, no_out_edge_printed)
+    try:
+        for coverage, data, dead_end_nodes in results:
+            for v in dead_end_nodes:
+                if v not in no_out_edge_printed:
+                    print("no out edge", node_name(v))
+                    no_out_edge_printed.add(v)
             if coverage == True:
                 start_node, end_node, bundle_edges, length, score, depth = data
                 compound_paths_0.append(
-                    (start_node, "NA", end_node, 1.0 * len(bundle_edges) / depth, length, score, bundle_edges))
+                    (start_node, NA, end_node, 1.0 * len(bundle_edges) / depth, length, score, bundle_edges))
+    finally:
+        bundle_search_shared.clear()
+        if pool is not None:
+            pool.close()
+            pool.join()
 
     compound_paths_0.sort(key=lambda x: -len(x[6]))
     return compound_paths_0
 
-def construct_compound_paths_1(compound_paths_0):
+class UnitigEdgeIndex(object):
+    """
+    integer ids of the edges of the unitig graph, for the compound path construction
 
-    edge_to_cpath = {}
+    twin[i] is the id of the reverse complement of edge i, or -1 if it is not
+    in the graph. claimed[i] is set for the edges of the accepted bundles, and
+    n_cpaths[i] counts the compound paths through edge i (up to 2).
+    """
+
+    def __init__(self, ug):
+        ids = {}
+        for e in ug.edges(keys=True):
+            ids[e] = len(ids)
+        twin = array.array('l', [-1]) * len(ids)
+        for (v, w, k), i in ids.items():
+            twin[i] = ids.get((reverse_end(w), reverse_end(v), reverse_end(k)), -1)
+        self.ids = ids
+        self.twin = twin
+        self.claimed = bytearray(len(ids))
+        self.n_cpaths = bytearray(len(ids))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def edge_ids(self, edges):
+        ids = self.ids
+        return [ids[e] for e in edges]
+
+
+def construct_compound_paths_1(compound_paths_0, index):
+
+    trace = TRACE.compound_paths
+    twin = index.twin
+    claimed = index.claimed
     compound_paths_1 = {}
     for s, v, t, width, length, score, bundle_edges in compound_paths_0:
-        LOG.debug(f"constructing utg, test  {s} {v} {t}")
+        if trace:
+            TRACE('compound_paths', 'test', path=(s, v, t))
 
+        edge_ids = index.edge_ids(bundle_edges)
         overlapped = False
-        for vv, ww, kk in list(bundle_edges):
-            if (vv, ww, kk) in edge_to_cpath:
-                LOG.debug(f"remove overlapped utg {(s, v, t)} {(vv, ww, kk)}")
+        for (i, e) in zip(edge_ids, bundle_edges):
+            if claimed[i]:
+                if trace:
+                    TRACE('compound_paths', 'overlapped', path=(s, v, t), edge=e)
                 overlapped = True
                 break
-            rvv = reverse_end(vv)
-            rww = reverse_end(ww)
-            rkk = reverse_end(kk)
-            if (rww, rvv, rkk) in edge_to_cpath:
-                LOG.debug(f"remove overlapped r utg {(s, v, t)} {(rww, rvv, rkk)}")
+            if twin[i] >= 0 and claimed[twin[i]]:
+                if trace:
+                    vv, ww, kk = e
+                    TRACE('compound_paths', 'overlapped_r', path=(s, v, t),
+                          edge=(reverse_end(ww), reverse_end(vv), reverse_end(kk)))
                 overlapped = True
                 break
 
         if not overlapped:
-            LOG.debug(f"constructing {s} {v} {t}")
+            if trace:
+                TRACE('compound_paths', 'construct', path=(s, v, t))
 
             bundle_edges_r = []
             rs = reverse_end(t)
             rt = reverse_end(s)
 
-            for vv, ww, kk in list(bundle_edges):
-                edge_to_cpath.setdefault((vv, ww, kk), set())
-                edge_to_cpath[(vv, ww, kk)].add((s, t, v))
-                rvv = reverse_end(ww)
-                rww = reverse_end(vv)
-                rkk = reverse_end(kk)
-                edge_to_cpath.setdefault((rvv, rww, rkk), set())
-                edge_to_cpath[(rvv, rww, rkk)].add(
-                    (rs, rt, v))  # assert v == "NA"
-                bundle_edges_r.append((rvv, rww, rkk))
+            for (i, (vv, ww, kk)) in zip(edge_ids, bundle_edges):
+                claimed[i] = 1
+                if twin[i] >= 0:
+                    claimed[twin[i]] = 1
+                bundle_edges_r.append((reverse_end(ww), reverse_end(vv), reverse_end(kk)))
 
             compound_paths_1[(s, v, t)] = width, length, score, bundle_edges
             compound_paths_1[(rs, v, rt)
                              ] = width, length, score, bundle_edges_r
     return compound_paths_1
 
-def construct_compound_paths_2(compound_paths_1):
+def construct_compound_paths_2(compound_paths_1, index):
+    trace = TRACE.compound_paths
+    ids = index.ids
+    n_cpaths = index.n_cpaths
     compound_paths_2 = {}
-    edge_to_cpath = {}
     for s, v, t in compound_paths_1:
         rs = reverse_end(t)
         rt = reverse_end(s)
-        if (rs, "NA", rt) not in compound_paths_1:
-            LOG.debug(f"non_compliment bundle {s} {v} {t} {len(compound_paths_1[(s, v, t)][-1])}")
+        if (rs, NA, rt) not in compound_paths_1:
+            if trace:
+                TRACE('compound_paths', 'non_compliment', path=(s, v, t), n_edges=len(compound_paths_1[(s, v, t)][-1]))
             continue
         width, length, score, bundle_edges = compound_paths_1[(s, v, t)]
         compound_paths_2[(s, v, t)] = width, length, score, bundle_edges
-        for vv, ww, kk in list(bundle_edges):
-            edge_to_cpath.setdefault((vv, ww, kk), set())
-            edge_to_cpath[(vv, ww, kk)].add((s, t, v))
-    return compound_paths_2, edge_to_cpath
-
-def construct_compound_paths_3(ug, compound_paths_2, edge_to_cpath):
+        # the reverse complement edges missing from the graph are not counted, only graph edges are looked up
+        for i in frozenset(ids[e] for e in bundle_edges if e in ids):
+            if n_cpaths[i] < 2:
+                n_cpaths[i] += 1
+    return compound_paths_2
+
+def construct_compound_paths_3(ug, compound_paths_2, index):
+    trace = TRACE.compound_paths
+    ids = index.ids
+    n_cpaths = index.n_cpaths
     compound_paths_3 = {}
     for (k, val) in compound_paths_2.items():
 
-        start_node, NA, end_node = k
+        start_node, v, end_node = k
         rs = reverse_end(end_node)
         rt = reverse_end(start_node)
-        assert (rs, "NA", rt) in compound_paths_2
+        assert (rs, v, rt) in compound_paths_2
 
         contained = False
-        for vv, ww, kk in ug.out_edges(start_node, keys=True):
-            if len(edge_to_cpath.get((vv, ww, kk), [])) > 1:
+        for e in ug.out_edges(start_node, keys=True):
+            if n_cpaths[ids[e]] > 1:
                 contained = True
 
         if not contained:
             compound_paths_3[k] = val
-            LOG.debug(f"compound {k}")
+            if trace:
+                TRACE('compound_paths', 'compound', path=k)
     return compound_paths_3
 
-def construct_compound_paths(ug, u_edge_data, depth_cutoff, width_cutoff, length_cutoff):
+def construct_compound_paths(ug, u_edge_data, depth_cutoff, width_cutoff, length_cutoff, node_name=str, workers=1):
 
     branch_nodes = identify_branch_nodes(ug)
 
-    time_compound_paths_0 = [time.time()]
-    compound_paths_0 = construct_compound_paths_0(ug, u_edge_data, branch_nodes, depth_cutoff, width_cutoff, length_cutoff)
-    time_compound_paths_0 += [time.time()]
-    log_time('  - compound_paths_0', time_compound_paths_0)
+    time_compound_paths_0 = REPORT.start()
+    compound_paths_0 = construct_compound_paths_0(ug, u_edge_data, branch_nodes, depth_cutoff, width_cutoff, length_cutoff, node_name, workers)
+    REPORT.end('  - compound_paths_0', time_compound_paths_0, bundles=len(compound_paths_0))
 
-    time_compound_paths_1 = [time.time()]
-    compound_paths_1 = construct_compound_paths_1(compound_paths_0)
-    time_compound_paths_1 += [time.time()]
-    log_time('  - compound_paths_1', time_compound_paths_1)
+    time_compound_paths_1 = REPORT.start()
+    index = UnitigEdgeIndex(ug)
+    compound_paths_1 = construct_compound_paths_1(compound_paths_0, index)
+    REPORT.end('  - compound_paths_1', time_compound_paths_1, edges=len(index))
 
-    time_compound_paths_2 = [time.time()]
-    compound_paths_2, edge_to_cpath = construct_compound_paths_2(compound_paths_1)
-    time_compound_paths_2 += [time.time()]
-    log_time('  - compound_paths_2', time_compound_paths_2)
+    time_compound_paths_2 = REPORT.start()
+    compound_paths_2 = construct_compound_paths_2(compound_paths_1, index)
+    REPORT.end('  - compound_paths_2', time_compound_paths_2)
 
-    time_compound_paths_3 = [time.time()]
-    compound_paths_3 = construct_compound_paths_3(ug, compound_paths_2, edge_to_cpath)
-    time_compound_paths_3 += [time.time()]
-    log_time('  - compound_paths_3', time_compound_paths_3)
+    time_compound_paths_3 = REPORT.start()
+    compound_paths_3 = construct_compound_paths_3(ug, compound_paths_2, index)
+    REPORT.end('  - compound_paths_3', time_compound_paths_3)
 
-    time_compound_paths_update = [time.time()]
+    time_compound_paths_update = REPORT.start()
     compound_paths = {}
     for s, v, t in compound_paths_3:
         rs = reverse_end(t)
         rt = reverse_end(s)
-        if (rs, "NA", rt) not in compound_paths_3:
+        if (rs, NA, rt) not in compound_paths_3:
             continue
         compound_paths[(s, v, t)] = compound_paths_3[(s, v, t)]
-    time_compound_paths_update += [time.time()]
-    log_time('  - compound_paths_update', time_compound_paths_update)
+    REPORT.end('  - compound_paths_update', time_compound_paths_update)
 
     return compound_paths
 
@@ -1142,28 +1996,25 @@ def identify_simple_paths(sg2, edge_data):
 
     free_edges = set(sg2.edges())
 
-    if LOG.getEffectiveLevel() >= logging.DEBUG:
-        for s in list(simple_nodes):
-            LOG.debug(f"simple_node {s}")
-        for s in list(s_nodes):
-            LOG.debug(f"s_node {s}")
-        for s in list(t_nodes):
-            LOG.debug(f"t_node {s}")
+    trace = TRACE.simple_paths
+    if trace:
+        TRACE('simple_paths', 'nodes', simple_nodes=simple_nodes, s_nodes=s_nodes, t_nodes=t_nodes)
 
         for v, w in free_edges:
             if (reverse_end(w), reverse_end(v)) not in free_edges:
-                LOG.debug(f"bug {v} {w}")
-                print(reverse_end(w), reverse_end(v))
+                TRACE('simple_paths', 'bug', edge=(v, w), missing=(reverse_end(w), reverse_end(v)))
 
     while free_edges:
         if s_nodes:
             n = s_nodes.pop()
-            LOG.debug(f"initial utg 1 {n}")
+            if trace:
+                TRACE('simple_paths', 'initial_utg_1', node=n)
         else:
             e = free_edges.pop()
             free_edges.add(e)
             n = e[0]
-            LOG.debug(f"initial utg 2 {n}")
+            if trace:
+                TRACE('simple_paths', 'initial_utg_2', node=n)
 
         path = []
         path_length = 0
@@ -1225,58 +2076,83 @@ def identify_simple_paths(sg2, edge_data):
             simple_paths[(r_path[0], rw0, rv0)
                          ] = r_path_length, r_path_score, r_path
 
-            LOG.debug(f"{path_length} {path_score} {path}")
+            if trace:
+                TRACE('simple_paths', 'path', length=path_length, score=path_score, path=path)
 
             #dual_path[ (r_path[0], rw0, rv0) ] = (v0, w0, path[-1])
             #dual_path[ (v0, w0, path[-1]) ] = (r_path[0], rw0, rv0)
     return simple_paths
 
 
-def identify_spurs(ug, u_edge_data, spur_len):
+def forward_bfs(succ, n, radius):
+    """
+    return the nodes within radius edges from n, in breadth first order, as a
+    dict of their parents in the BFS tree (None for n)
+    """
+    parent = {n: None}
+    level = [n]
+    for _ in range(radius):
+        next_level = []
+        for v in level:
+            for w in succ[v]:
+                if w not in parent:
+                    parent[w] = v
+                    next_level.append(w)
+        if not next_level:
+            break
+        level = next_level
+    return parent
+
+
+def identify_spurs(ug, u_edge_data, spur_len, radius=10):
     # identify spurs in the utg graph
     # Currently, we use ad-hoc logic filtering out shorter utg, but we can
     # add proper alignment comparison later to remove redundant utgs
-    # Side-effect: Modifies u_edge_data
+    # Side-effect: Modifies ug (the spurs are removed in place, and ug is returned) and u_edge_data
+    #
+    # The in-degrees are counted once and updated as the spur edges are
+    # removed. The neighbourhood of a candidate is a bounded BFS, and its
+    # branch nodes are visited in BFS order. The path to a branch node is the
+    # one of the BFS tree, which is a shortest path.
 
-    ug2 = ug.copy()
+    ug2 = ug
+    succ = ug2.succ
+    pred = ug2.pred
 
+    in_degree = {}
     s_candidates = set()
-    for v in ug2.nodes():
-        if ug2.in_degree(v) == 0:
+    for v, pred_v in pred.items():
+        in_degree[v] = sum(len(keydict) for keydict in pred_v.values())
+        if in_degree[v] == 0:
             s_candidates.add(v)
 
     while len(s_candidates) > 0:
         n = s_candidates.pop()
-        if ug2.in_degree(n) != 0:
+        if in_degree[n] != 0:
             continue
-        n_ego_graph = nx.ego_graph(ug2, n, radius=10)
-        n_ego_node_set = set(n_ego_graph.nodes())
-        for b_node in n_ego_graph.nodes():
-            if ug2.in_degree(b_node) <= 1:
+        parent = forward_bfs(succ, n, radius)
+        for b_node in parent:
+            if in_degree[b_node] <= 1:
                 continue
 
             with_extern_node = False
-            b_in_nodes = [e[0] for e in ug2.in_edges(b_node)]
-
-            if len(b_in_nodes) == 1:
-                continue
-
-            for v in b_in_nodes:
-                if v not in n_ego_node_set:
+            for v in pred[b_node]:
+                if v not in parent:
                     with_extern_node = True
                     break
 
             if not with_extern_node:
                 continue
 
-            s_path = nx.shortest_path(ug2, n, b_node)
+            s_path = [b_node]
+            while parent[s_path[-1]] is not None:
+                s_path.append(parent[s_path[-1]])
+            s_path.reverse()
             v1 = s_path[0]
             total_length = 0
             for v2 in s_path[1:]:
-                for s, t, v in ug2.out_edges(v1, keys=True):
-                    if t != v2:
-                        continue
-                    length, score, edges, type_ = u_edge_data[(s, t, v)]
+                for v in succ[v1][v2]:
+                    length, score, edges, type_ = u_edge_data[(v1, v2, v)]
                     total_length += length
                 v1 = v2
 
@@ -1285,34 +2161,35 @@ def identify_spurs(ug, u_edge_data, spur_len):
 
             v1 = s_path[0]
             for v2 in s_path[1:]:
-                for s, t, v in list(ug2.out_edges(v1, keys=True)):
-                    if t != v2:
-                        continue
+                s, t = v1, v2
+                for v in list(succ[s].get(t, ())):
                     length, score, edges, type_ = u_edge_data[(s, t, v)]
                     rs = reverse_end(t)
                     rt = reverse_end(s)
-                    rv = reverse_end(v)
+                    rv = reverse_via(v)
                     try:
                         ug2.remove_edge(s, t, key=v)
+                        in_degree[t] -= 1
                         ug2.remove_edge(rs, rt, key=rv)
+                        in_degree[rt] -= 1
                         u_edge_data[(s, t, v)] = length, score, edges, "spur:2"
                         u_edge_data[(rs, rt, rv)
                                     ] = length, score, edges, "spur:2"
                     except Exception:
                         pass
 
-                if ug2.in_degree(v2) == 0:
+                if in_degree[v2] == 0:
                     s_candidates.add(v2)
                 v1 = v2
             break
     return ug2
 
 
-def remove_dup_simple_path(ug, u_edge_data):
+def remove_dup_simple_path(ug, u_edge_data, node_name=str):
     # identify simple dup path
     # if there are many multiple simple path of length connect s and t, e.g.  s->v1->t, and s->v2->t, we will only keep one
-    # Side-effect: Modifies u_edge_data
-    ug2 = ug.copy()
+    # Side-effect: Modifies ug (the dup edges are removed in place, and ug is returned) and u_edge_data
+    ug2 = ug
     simple_edges = set()
     dup_edges = {}
     for s, t, v in u_edge_data:
@@ -1327,7 +2204,7 @@ def remove_dup_simple_path(ug, u_edge_data):
                 dup_edges[(s, t)] = [v]
     for (s, t) in dup_edges.keys():
         vl = dup_edges[(s, t)]
-        vl.sort()
+        vl.sort(key=node_name)
         for v in vl[1:]:
             ug2.remove_edge(s, t, key=v)
             length, score, edges, type_ = u_edge_data[(s, t, v)]
@@ -1360,6 +2237,7 @@ def construct_c_path_from_utgs(ug, u_edge_data, best_in_dict, use_bestin_heurist
         if in_degree > 0 and out_degree == 0:
             sinks.add(n)
 
+    trace = TRACE.c_paths
     c_path = []
 
     free_edges = set()
@@ -1382,7 +2260,8 @@ def construct_c_path_from_utgs(ug, u_edge_data, best_in_dict, use_bestin_heurist
             path_score = 0
             path_nodes = set()
             path_nodes.add(s)
-            LOG.debug(f"check 1 {s} {t} {v}")
+            if trace:
+                TRACE('c_paths', 'check', edge=(s, t, v))
             path_key = t
             t0 = s
             while t in simple_out:
@@ -1440,15 +2319,22 @@ def construct_c_path_from_utgs(ug, u_edge_data, best_in_dict, use_bestin_heurist
 
             c_path.append((path_start, path_key, path_end,
                            path_length, path_score, path, len(path), is_spur))
-            LOG.debug(f"c_path {path_start} {path_key} {path_end} {path_length} {path_score} {len(path)}")
+            if trace:
+                TRACE('c_paths', 'c_path', start=path_start, key=path_key, end=path_end,
+                      length=path_length, score=path_score, n_edges=len(path))
             for e in path:
                 if e in free_edges:
                     free_edges.remove(e)
 
-    LOG.debug(f"left over edges: {len(free_edges)}")
+    if trace:
+        TRACE('c_paths', 'left_over_edges', count=len(free_edges))
     return c_path
 
 def extract_contigs(ug, u_edge_data, c_path, circular_path, ctg_prefix):
+    """
+    yield (ctg_name, type_, first_utg_edge, end_node, length, score, utg_edges),
+    see write_ctg_paths() for the text format
+    """
     free_edges = set()
     for s, t, v in ug.edges(keys=True):
         free_edges.add((s, t, v))
@@ -1464,10 +2350,7 @@ def extract_contigs(ug, u_edge_data, c_path, circular_path, ctg_prefix):
         non_overlapped_path = []
         non_overlapped_path_r = []
         for s, t, v in path:
-            if v != "NA":
-                rs, rt, rv = reverse_end(t), reverse_end(s), reverse_end(v)
-            else:
-                rs, rt, rv = reverse_end(t), reverse_end(s), "NA"
+            rs, rt, rv = reverse_end(t), reverse_end(s), reverse_via(v)
             if (s, t, v) in free_edges and (rs, rt, rv) in free_edges:
                 non_overlapped_path.append((s, t, v))
                 non_overlapped_path_r.append((rs, rt, rv))
@@ -1486,9 +2369,7 @@ def extract_contigs(ug, u_edge_data, c_path, circular_path, ctg_prefix):
         c_type_ = "ctg_linear" if (end_node != s0) else "ctg_circular"
 
         ctg_name = '%s%06dF' % (ctg_prefix, ctg_id)
-        new_contig = (ctg_name, c_type_, s0 + "~" + v0 + "~" + \
-                        t0, end_node, length, score, "|".join(
-                        [c[0] + "~" + c[2] + "~" + c[1] for c in non_overlapped_path]))
+        new_contig = (ctg_name, c_type_, (s0, t0, v0), end_node, length, score, non_overlapped_path)
         yield new_contig
 
         non_overlapped_path_r.reverse()
@@ -1496,9 +2377,7 @@ def extract_contigs(ug, u_edge_data, c_path, circular_path, ctg_prefix):
         end_node = non_overlapped_path_r[-1][1]
 
         ctg_name = '%s%06dR' % (ctg_prefix, ctg_id)
-        new_contig = (ctg_name, c_type_, s0 + "~" + v0 + "~" + \
-                        t0, end_node, length_r, score_r, "|".join(
-                        [c[0] + "~" + c[2] + "~" + c[1] for c in non_overlapped_path_r]))
+        new_contig = (ctg_name, c_type_, (s0, t0, v0), end_node, length_r, score_r, non_overlapped_path_r)
         yield new_contig
 
         ctg_id += 1
@@ -1512,41 +2391,54 @@ def extract_contigs(ug, u_edge_data, c_path, circular_path, ctg_prefix):
     for s, t, v in list(circular_path):
         length, score, path, type_ = u_edge_data[(s, t, v)]
         ctg_name = '%s%d' % (ctg_prefix, ctg_id)
-        new_contig = (ctg_name, "ctg_circular", s + \
-                        "~" + v + "~" + t, t, length, score, s + "~" + v + "~" + t)
+        new_contig = (ctg_name, "ctg_circular", (s, t, v), t, length, score, [(s, t, v)])
         yield new_contig
         ctg_id += 1
 
-def identify_edges_to_remove(compound_paths, ug2):
+def write_ctg_paths(fp_out, contigs, reads):
+    """
+    return the number of contigs
+    """
+    utg_name = reads.utg_name
+    n_contigs = 0
+    for ctg_name, c_type_, first_edge, end_node, length, score, path in contigs:
+        fp_out.write('%s %s %s %s %s %s %s\n' % (
+            ctg_name, c_type_, utg_name(*first_edge), reads.node_name(end_node), length, score,
+            '|'.join([utg_name(*e) for e in path])))
+        n_contigs += 1
+    return n_contigs
+
+def identify_edges_to_remove(compound_paths, ug2, reads, compress=False):
     ug2_edges = set(ug2.edges(keys=True))
     edges_to_remove = set()
-    with open("c_path", "w") as f:
+    node_name = reads.node_name
+    with BufferedTextWriter("c_path", compress) as f:
         for s, v, t in compound_paths:
             width, length, score, bundle_edges = compound_paths[(s, v, t)]
-            print(s, v, t, width, length, score, "|".join(
-                [e[0] + "~" + e[2] + "~" + e[1] for e in bundle_edges]), file=f)
+            f.write('%s %s %s %s %s %s %s\n' % (node_name(s), reads.via_name(v), node_name(t), width, length, score, "|".join(
+                [reads.utg_name(*e) for e in bundle_edges])))
             for ss, tt, vv in bundle_edges:
                 if (ss, tt, vv) in ug2_edges:
                     edges_to_remove.add((ss, tt, vv))
     return edges_to_remove
 
-def generic_nx_to_gfa(fp_out, graph, use_keys=False, node_len_dict=None):
+def generic_nx_to_gfa(fp_out, graph, use_keys=False, node_len_dict=None, node_name=str):
     line = 'H\tVN:Z:1.0'
     fp_out.write(line + '\n')
 
     if node_len_dict != None:
         for v in graph.nodes():
-            line = 'S\t%s\t%s\tLN:i:%d' % (v, '*', node_len_dict[v])
+            line = 'S\t%s\t%s\tLN:i:%d' % (node_name(v), '*', node_len_dict[v])
             fp_out.write(line + '\n')
     else:
         for v in graph.nodes():
-            line = 'S\t%s\t%s\tLN:i:%d' % (v, '*', 1000)
+            line = 'S\t%s\t%s\tLN:i:%d' % (node_name(v), '*', 1000)
             fp_out.write(line + '\n')
     for v, w in graph.edges():
-        line = 'L\t%s\t+\t%s\t+\t0M' % (v, w)
+        line = 'L\t%s\t+\t%s\t+\t0M' % (node_name(v), node_name(w))
         fp_out.write(line + '\n')
 
-def unitig_nx_to_gfa(fp_out, ug, u_edge_data):
+def unitig_nx_to_gfa(fp_out, ug, u_edge_data, reads):
     # Create a dual graph where ug edges are represented as nodes,
     # and they are connected via edges which connect the first/last nodes
     # each unitig.
@@ -1555,7 +2447,7 @@ def unitig_nx_to_gfa(fp_out, ug, u_edge_data):
     nodes = collections.defaultdict(list)
     for s, t, v in ug.edges(keys = True):
         length, score, edges, type_ = u_edge_data[(s, t, v)]
-        node_name = '~'.join([s, v, t])
+        node_name = reads.utg_name(s, t, v)
         new_node = (s, v, t, length, score, edges, type_)
         nodes[node_name] = new_node
         inlets[s].append(node_name)
@@ -1568,7 +2460,7 @@ def unitig_nx_to_gfa(fp_out, ug, u_edge_data):
 
     edges = {}
     for s, t, v in ug.edges(keys = True):
-        node_name = '~'.join([s, v, t])
+        node_name = reads.utg_name(s, t, v)
 
         for w in inlets[t]:
             edges[(node_name, w)] = 'L\t%s\t+\t%s\t+\t0M' % (node_name, w)
@@ -1588,7 +2480,7 @@ def identify_short_edges_to_remove(ug2, u_edge_data):
             if length < 60000:
                 rs = reverse_end(t)
                 rt = reverse_end(s)
-                rv = reverse_end(v)
+                rv = reverse_via(v)
                 edges_to_remove.add((s, t, v))
                 edges_to_remove.add((rs, rt, rv))
     return edges_to_remove
@@ -1602,77 +2494,100 @@ def init_sg2(edge_data):
         rid, sp, tp, length, score, identity, type_, inphase = edge_data[(v, w)]
         if type_ != "G":
             continue
-        label = "%s:%d-%d" % (rid, sp, tp)
-        sg2.add_edge(v, w, label=label, length=length, score=score)
+        sg2.add_edge(v, w, length=length, score=score)
     return sg2
 
-def print_edge_data(u_edge_data):
-    with open("utg_data", "w") as f:
+CHECKPOINT_STAGES = ('string_graph', 'unitig_graph')
+CHECKPOINT_VERSION = 1
+
+def checkpoint_fn(prefix, stage):
+    return '{}.{}.pickle'.format(prefix, stage)
+
+def write_checkpoint(fn, stage, params, state):
+    """
+    write the state after a stage, with the parameters it depends on
+
+    The file is written under a temporary name first (unique to the
+    process), so that an interrupted run does not leave a truncated
+    checkpoint, and concurrent runs do not write into the same file.
+    """
+    tmp_fn = '{}.{}.tmp'.format(fn, os.getpid())
+    with open(tmp_fn, 'wb') as f:
+        pickle.dump((CHECKPOINT_VERSION, stage, params, state), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_fn, fn)
+
+def read_checkpoint(fn, stage, params):
+    """
+    return the state written by write_checkpoint()
+    """
+    with open(fn, 'rb') as f:
+        version, saved_stage, saved_params, state = pickle.load(f)
+    if version != CHECKPOINT_VERSION or saved_stage != stage:
+        raise Exception('Not a checkpoint of stage {!r} (version {}): {!r}'.format(stage, CHECKPOINT_VERSION, fn))
+    for key in params:
+        if saved_params.get(key) != params[key]:
+            LOG.warning('The checkpoint {!r} was written with {}={!r}, not {!r}.'.format(
+                fn, key, saved_params.get(key), params[key]))
+    return state
+
+def print_edge_data(u_edge_data, reads, compress=False):
+    node_name = reads.node_name
+    with BufferedTextWriter("utg_data", compress) as f:
         for s, t, v in u_edge_data:
             length, score, path_or_edges, type_ = u_edge_data[(s, t, v)]
 
-            if v == "NA":
+            if v == NA:
                 path_or_edges = "|".join(
-                    [ss + "~" + vv + "~" + tt for ss, tt, vv in path_or_edges])
+                    [reads.utg_name(ss, tt, vv) for ss, tt, vv in path_or_edges])
             else:
-                path_or_edges = "~".join(path_or_edges)
-            print(s, v, t, type_, length, score, path_or_edges, file=f)
+                path_or_edges = "~".join([node_name(n) for n in path_or_edges])
+            f.write('%s %s %s %s %s %s %s\n' % (node_name(s), reads.via_name(v), node_name(t), type_, length, score, path_or_edges))
 
-def print_utg_data0(u_edge_data):
-    with open("utg_data0", "w") as f:
+def print_utg_data0(u_edge_data, reads, compress=False):
+    node_name = reads.node_name
+    with BufferedTextWriter("utg_data0", compress) as f:
         for s, t, v in u_edge_data:
             rs = reverse_end(t)
             rt = reverse_end(s)
-            rv = reverse_end(v)
+            rv = reverse_via(v)
             assert (rs, rt, rv) in u_edge_data
             length, score, path_or_edges, type_ = u_edge_data[(s, t, v)]
 
             if type_ == "compound":
                 path_or_edges = "|".join(
-                    [ss + "~" + vv + "~" + tt for ss, tt, vv in path_or_edges])
+                    [reads.utg_name(ss, tt, vv) for ss, tt, vv in path_or_edges])
             else:
-                path_or_edges = "~".join(path_or_edges)
-            print(s, v, t, type_, length, score, path_or_edges, file=f)
-
-def time_diff_to_str(time_list):
-    elapsed_time = time_list[1] - time_list[0]
-    return time.strftime("%H:%M:%S", time.gmtime(elapsed_time))
-
-def log_time(label, time_list):
-    LOG.info('Time for "{}": {}'.format(label, time_diff_to_str(time_list)))
+                path_or_edges = "~".join([node_name(n) for n in path_or_edges])
+            f.write('%s %s %s %s %s %s %s\n' % (node_name(s), reads.via_name(v), node_name(t), type_, length, score, path_or_edges))
 
-def ovlp_to_graph(args):
-    time_total = [time.time()]
+REPORT = StageReport()
 
-    time_yield_from_overlap = [time.time()]
-    overlap_data = yield_from_overlap_file(args.overlap_file)
-    time_yield_from_overlap += [time.time()]
-    log_time('yield_from_overlap_file', time_yield_from_overlap)
-
-    # transitivity reduction
-    time_init_sg = [time.time()]
-    sg = init_string_graph(overlap_data)
-    time_init_sg += [time.time()]
-    log_time('init_string_graph', time_init_sg)
-
-    # remove spurs, remove putative edges caused by repeats
-    time_generate_nx = [time.time()]
-    nxsg, edge_data = generate_nx_string_graph(sg, args.lfc, args.disable_chimer_bridge_removal)
-    del sg, overlap_data
-    time_generate_nx += [time.time()]
-    log_time('generate_nx_string_graph', time_generate_nx)
+def load_string_graph(args):
+    """
+    read the overlaps, and return the string graph with the transitive edges reduced
+    """
+    # The overlaps are read as they are added to the string graph, then the
+    # transitivity reduction is done.
+    time_init_sg = REPORT.start()
+    overlap_blocks = read_overlaps(args.overlap_file, args.overlap_format, args.parse_workers)
+    sg = init_string_graph(overlap_blocks, args.string_graph_engine, args.tr_workers)
+    REPORT.end('init_string_graph', time_init_sg, reads=len(sg.reads), edges=sg.count_reduced() + sg.count_not_reduced(),
+               reduced_edges=sg.count_reduced())
+    return sg
 
+def build_unitig_graph(args, nxsg, edge_data, reads):
+    """
+    return (ug, u_edge_data, circular_path), the unitig graph of the simple
+    paths of the string graph nxsg, without the spurs and the duplicated
+    simple paths
+    """
     #dual_path = {}
-    time_init_sg2 = [time.time()]
-    nxsg2 = init_sg2(edge_data)
-    time_init_sg2 += [time.time()]
-    log_time('init_sg2', time_init_sg2)
-
-    time_ug_simple_paths = [time.time()]
+    time_ug_simple_paths = REPORT.start()
     ug = nx.MultiDiGraph()
     u_edge_data = {}
     circular_path = set()
-    simple_paths = identify_simple_paths(nxsg2, edge_data)
+    # The simple paths are found in the string graph itself (it has the "G" edges).
+    simple_paths = identify_simple_paths(nxsg, edge_data)
     for s, v, t in simple_paths:
         length, score, path = simple_paths[(s, v, t)]
         u_edge_data[(s, t, v)] = (length, score, path, "simple")
@@ -1681,51 +2596,54 @@ def ovlp_to_graph(args):
                         via=v, length=length, score=score)
         else:
             circular_path.add((s, t, v))
-    if LOG.getEffectiveLevel() >= logging.DEBUG:
-        print_utg_data0(u_edge_data)
-    time_ug_simple_paths += [time.time()]
-    log_time('ug_simple_paths', time_ug_simple_paths)
+    if LOG.isEnabledFor(logging.DEBUG):
+        print_utg_data0(u_edge_data, reads, args.compress_outputs)
+    REPORT.end('ug_simple_paths', time_ug_simple_paths, simple_paths=len(simple_paths), circular_paths=len(circular_path))
 
-    time_identify_spurs_1 = [time.time()]
+    time_identify_spurs_1 = REPORT.start()
     ug2 = identify_spurs(ug, u_edge_data, 50000)
-    time_identify_spurs_1 += [time.time()]
-    log_time('identify_spurs-1', time_identify_spurs_1)
+    REPORT.end('identify_spurs-1', time_identify_spurs_1, nodes=ug2.number_of_nodes(), edges=ug2.number_of_edges())
 
-    time_remove_dup_simple = [time.time()]
-    ug2 = remove_dup_simple_path(ug2, u_edge_data)
-    time_remove_dup_simple += [time.time()]
-    log_time('remove_dup_simple_path', time_remove_dup_simple)
+    time_remove_dup_simple = REPORT.start()
+    ug2 = remove_dup_simple_path(ug2, u_edge_data, reads.node_name)
+    REPORT.end('remove_dup_simple_path', time_remove_dup_simple, nodes=ug2.number_of_nodes(), edges=ug2.number_of_edges())
+    return ug2, u_edge_data, circular_path
 
+def build_contigs(args, nxsg, reads, best_in_dict, ug2, u_edge_data, circular_path):
+    """
+    add the compound paths to the unitig graph ug2, and return its contigs
+    (the extract_contigs() generator); writes utg_data, c_path and the
+    ug.final GFA files
+
+    ug2, u_edge_data and best_in_dict are modified.
+    """
     # phase 2, finding all "consistent" compound paths
-    time_construct_compound_paths = [time.time()]
-    compound_paths = construct_compound_paths(ug2, u_edge_data, args.depth_cutoff, args.width_cutoff, args.length_cutoff)
-    time_construct_compound_paths += [time.time()]
-    log_time('construct_compound_paths', time_construct_compound_paths)
+    time_construct_compound_paths = REPORT.start()
+    compound_paths = construct_compound_paths(ug2, u_edge_data, args.depth_cutoff, args.width_cutoff, args.length_cutoff, reads.node_name, args.bundle_workers)
+    REPORT.end('construct_compound_paths', time_construct_compound_paths, compound_paths=len(compound_paths))
 
-    time_edges_to_remove = [time.time()]
-    edges_to_remove = identify_edges_to_remove(compound_paths, ug2)
+    time_edges_to_remove = REPORT.start()
+    edges_to_remove = identify_edges_to_remove(compound_paths, ug2, reads, args.compress_outputs)
     for s, t, v in edges_to_remove:
         ug2.remove_edge(s, t, v)
         length, score, edges, type_ = u_edge_data[(s, t, v)]
         if type_ != "spur":
             u_edge_data[(s, t, v)] = length, score, edges, "contained"
-    time_edges_to_remove += [time.time()]
-    log_time('edges_to_remove', time_edges_to_remove)
+    REPORT.end('edges_to_remove', time_edges_to_remove, edges=len(edges_to_remove))
 
-    time_compound_add_edges = [time.time()]
+    time_compound_add_edges = REPORT.start()
     for s, v, t in compound_paths:
         width, length, score, bundle_edges = compound_paths[(s, v, t)]
         u_edge_data[(s, t, v)] = (length, score, bundle_edges, "compound")
         ug2.add_edge(s, t, key=v, via=v, type_="compound",
                      length=length, score=score)
-        assert v == "NA"
+        assert v == NA
         rs = reverse_end(t)
         rt = reverse_end(s)
         assert (rs, v, rt) in compound_paths
         #dual_path[ (s, v, t) ] = (rs, v, rt)
         #dual_path[ (rs, v, rt) ] = (s, v, t)
-    time_compound_add_edges += [time.time()]
-    log_time('compound_add_edges', time_compound_add_edges)
+    REPORT.end('compound_add_edges', time_compound_add_edges)
 
     # remove short utg using local flow consistent rule
     r"""
@@ -1734,61 +2652,41 @@ def ovlp_to_graph(args):
            \__UTG_>__/
       <____/         \_____<
     """
-    time_short_edges_to_remove = [time.time()]
+    time_short_edges_to_remove = REPORT.start()
     short_edges_to_remove = identify_short_edges_to_remove(ug2, u_edge_data)
     for s, t, v in list(short_edges_to_remove):
         ug2.remove_edge(s, t, key=v)
         length, score, edges, type_ = u_edge_data[(s, t, v)]
         u_edge_data[(s, t, v)] = length, score, edges, "repeat_bridge"
-    time_short_edges_to_remove += [time.time()]
-    log_time('short_edges_to_remove', time_short_edges_to_remove)
+    REPORT.end('short_edges_to_remove', time_short_edges_to_remove, edges=len(short_edges_to_remove))
 
     # Repeat the aggresive spur filtering with slightly larger spur length.
-    time_identify_spurs_2 = [time.time()]
+    time_identify_spurs_2 = REPORT.start()
     ug = identify_spurs(ug2, u_edge_data, 80000)
-    print_edge_data(u_edge_data)
-    time_identify_spurs_2 += [time.time()]
-    log_time('identify_spurs-2', time_short_edges_to_remove)
-
-    time_write_ug = [time.time()]
-    with open('ug.final.gfa', 'w') as fp_out:
-        generic_nx_to_gfa(fp_out, ug, False, None)
-    with open('ug.final.dual.gfa', 'w') as fp_out:
-        unitig_nx_to_gfa(fp_out, ug, u_edge_data)
-    time_write_ug += [time.time()]
-    log_time('write-ug', time_write_ug)
-
-    # Create a dict for every non-trivial unitig node, where the key is the
-    # node and the value is the best input node. This is stored in the
-    # string graph in the legacy code.
-    # This is used to resolve ambiguities during contig extraction by
-    # prefering the best scoring path.
-    # Here we simply copy the best_in node as it is in the nxsg.
-    # For the legacy code, this dict will be used as is.
-    # For the haplospur feature, some nodes in this dict will be updated
-    # to represent the new best_in node.
-    best_in_dict = {}
-    for v in nxsg.nodes():
-        v_data = nxsg.nodes[v]
-        if 'best_in' in v_data:
-            best_in_dict[v] = v_data["best_in"]
+    print_edge_data(u_edge_data, reads, args.compress_outputs)
+    REPORT.end('identify_spurs-2', time_identify_spurs_2, nodes=ug.number_of_nodes(), edges=ug.number_of_edges())
+
+    time_write_ug = REPORT.start()
+    with BufferedTextWriter('ug.final.gfa') as fp_out:
+        generic_nx_to_gfa(fp_out, ug, False, None, reads.node_name)
+    with BufferedTextWriter('ug.final.dual.gfa') as fp_out:
+        unitig_nx_to_gfa(fp_out, ug, u_edge_data, reads)
+    REPORT.end('write-ug', time_write_ug)
 
     if args.haplospur:
         # Contig construction without extending through ambiguous regions to identify forks.
         # These would be simple contigs.
         # This is needed to figure out the path lengths for each branch in an ambiguous node.
-        time_haplospur_construct_ctg_paths_1 = [time.time()]
+        time_haplospur_construct_ctg_paths_1 = REPORT.start()
         simple_ctg_paths = construct_c_path_from_utgs(ug, u_edge_data, None, False)
-        time_haplospur_construct_ctg_paths_1 += [time.time()]
-        log_time('haplospur_construct_c_path_from_utgs_1', time_haplospur_construct_ctg_paths_1)
+        REPORT.end('haplospur_construct_c_path_from_utgs_1', time_haplospur_construct_ctg_paths_1, c_paths=len(simple_ctg_paths))
 
         # Create a graph of simple contigs, and find ambiguous connections with short spurs.
         # If these are found, then modify the best_in scores for the adjacent reads to prevent
         # primary contig extraction into the spurs.
-        time_haplospur_find_best_in = [time.time()]
-        find_best_in_for_simple_ctg_paths(simple_ctg_paths, ug, u_edge_data, nxsg, best_in_dict)
-        time_haplospur_find_best_in += [time.time()]
-        log_time('haplospur_find_best_in_for_simple_ctg_paths', time_haplospur_find_best_in)
+        time_haplospur_find_best_in = REPORT.start()
+        find_best_in_for_simple_ctg_paths(simple_ctg_paths, ug, u_edge_data, nxsg, best_in_dict, reads.node_name)
+        REPORT.end('haplospur_find_best_in_for_simple_ctg_paths', time_haplospur_find_best_in)
 
         # for key in sorted(best_in_dict.keys()):
         #     sys.stderr.write('(haplospur) v = {} -> best_in = {}\n'.format(key, best_in_dict[key]))
@@ -1796,40 +2694,468 @@ def ovlp_to_graph(args):
         # Find the final contig paths using the best_in dict filter.
         # This should prevent small spurs (unmerged haplotig bubbles) in the middle
         # of long contigs to break those contigs.
-        time_haplospur_construct_ctg_paths_2 = [time.time()]
+        time_haplospur_construct_ctg_paths_2 = REPORT.start()
         c_path = construct_c_path_from_utgs(ug, u_edge_data, best_in_dict, True)
         # Sorting contig paths by length.
         c_path.sort(key=lambda x: -x[3])
-        time_haplospur_construct_ctg_paths_2 += [time.time()]
-        log_time('haplospur_construct_c_path_from_utgs_2', time_haplospur_construct_ctg_paths_2)
+        REPORT.end('haplospur_construct_c_path_from_utgs_2', time_haplospur_construct_ctg_paths_2, c_paths=len(c_path))
     else:
         # contig construction from utgs
-        time_construct_c_path_from_utgs = [time.time()]
+        time_construct_c_path_from_utgs = REPORT.start()
         c_path = construct_c_path_from_utgs(ug, u_edge_data, best_in_dict, True)
         # Sorting contig paths by length.
         c_path.sort(key=lambda x: -x[3])
-        time_construct_c_path_from_utgs += [time.time()]
-        log_time('construct_c_path_from_utgs', time_construct_c_path_from_utgs)
+        REPORT.end('construct_c_path_from_utgs', time_construct_c_path_from_utgs, c_paths=len(c_path))
 
     # Construct the contigs (based on unitigs).
-    time_extract_contigs = [time.time()]
+    time_extract_contigs = REPORT.start()
     contigs = extract_contigs(ug, u_edge_data, c_path, circular_path, args.ctg_prefix)
-    time_extract_contigs += [time.time()]
-    log_time('extract_contigs', time_extract_contigs)
-
-    # Write contigs to file.
-    time_write_ctg_paths = [time.time()]
-    with open('ctg_paths', 'w') as fp_out:
-        for contig_tuple in contigs:
-            fp_out.write(' '.join([str(val) for val in contig_tuple]))
-            fp_out.write('\n')
-    time_write_ctg_paths += [time.time()]
-    log_time('ctg_paths', time_write_ctg_paths)
-
-    time_total += [time.time()]
-    log_time('TOTAL', time_total)
-
-def find_best_in_for_simple_ctg_paths(simple_ctg_paths, ug, u_edge_data, sg, best_in_dict):
+    REPORT.end('extract_contigs', time_extract_contigs)
+    return contigs
+
+def find_shards(sg, n_shards):
+    """
+    split the string graph sg into at most n_shards groups of its weakly
+    connected components; return the lists of the nodes of the groups, in
+    the node order of sg
+
+    A component is in the same group as its reverse complement. The
+    components are assigned by decreasing size to the group with the
+    fewest nodes, so the groups depend only on sg and n_shards. An empty
+    graph has a single empty group, so that its (empty) outputs are written.
+    """
+    succ = sg._succ
+    pred = sg._pred
+    component = {}
+    sizes = []
+    for n in sg:
+        if n in component:
+            continue
+        c = len(sizes)
+        component[n] = c
+        stack = [n]
+        size = 0
+        while stack:
+            v = stack.pop()
+            size += 1
+            for w in itertools.chain(succ[v], pred[v], (reverse_end(v),)):
+                if w not in component and w in succ:
+                    component[w] = c
+                    stack.append(w)
+        sizes.append(size)
+
+    group_of = [0] * len(sizes)
+    groups = [(0, i) for i in range(n_shards)]  # heap of (number of nodes, group)
+    for c in sorted(range(len(sizes)), key=lambda c: -sizes[c]):
+        n_nodes, g = heapq.heappop(groups)
+        group_of[c] = g
+        heapq.heappush(groups, (n_nodes + sizes[c], g))
+
+    shards = [[] for _ in range(n_shards)]
+    for n in sg:
+        shards[group_of[component[n]]].append(n)
+    return [nodes for nodes in shards if nodes] or [[]]
+
+def induced_subgraph(g, nodes):
+    """
+    return a copy of the subgraph of the DiGraph g on nodes (closed under
+    the edges of g), with the nodes, and the in and out edges of each node,
+    in the order of g
+    """
+    h = g.__class__()
+    g_nodes = g.nodes
+    h.add_nodes_from((n, g_nodes[n]) for n in nodes)
+    g_succ = g._succ
+    for v in nodes:
+        for w, data in g_succ[v].items():
+            h.add_edge(v, w, **data)
+    g_pred = g._pred
+    h_pred = h._pred
+    for v in nodes:
+        h_pred_v = h_pred[v]
+        for u in g_pred[v]:
+            h_pred_v[u] = h_pred_v.pop(u)
+    return h
+
+# ovlp_to_graph() state shared with the shard workers (inherited when forked)
+shard_shared = {}
+
+def shard_worker(shard):
+    """
+    build the contigs of a shard (index, nodes) of the string graph in the
+    directory of the shard; return them as a list
+    """
+    index, nodes = shard
+    args = shard_shared['args']
+    nxsg = induced_subgraph(shard_shared['nxsg'], nodes)
+    reads = shard_shared['reads']
+    shard_dir = shard_dir_name(args, index)
+    os.makedirs(shard_dir, exist_ok=True)
+    cwd = os.getcwd()
+    os.chdir(shard_dir)
+    try:
+        ug2, u_edge_data, circular_path = build_unitig_graph(args, nxsg, shard_shared['edge_data'], reads)
+        return list(build_contigs(args, nxsg, reads, shard_shared['best_in_dict'], ug2, u_edge_data, circular_path))
+    finally:
+        os.chdir(cwd)
+
+def shard_dir_name(args, index):
+    return '{}{}'.format(args.shard_prefix, index)
+
+def build_shard_contigs(args, nxsg, edge_data, reads, best_in_dict, shards):
+    """
+    build the contigs of each shard (see find_shards()) on its own, with
+    args.shard_workers processes; merge their outputs, and return their
+    contigs renumbered (see renumber_contigs())
+    """
+    shard_args = argparse.Namespace(**vars(args))
+    if args.shard_workers > 1:
+        # The pool workers cannot start their own pool.
+        shard_args.bundle_workers = 1
+    shard_shared.update(args=shard_args, nxsg=nxsg, edge_data=edge_data, reads=reads, best_in_dict=best_in_dict)
+    try:
+        if args.shard_workers > 1 and len(shards) > 1:
+            import multiprocessing
+            with multiprocessing.get_context('fork').Pool(args.shard_workers) as pool:
+                shard_contigs = pool.map(shard_worker, enumerate(shards), 1)
+        else:
+            shard_contigs = [shard_worker(shard) for shard in enumerate(shards)]
+    finally:
+        shard_shared.clear()
+
+    shard_dirs = [shard_dir_name(args, i) for i in range(len(shards))]
+    suffix = '.gz' if args.compress_outputs else ''
+    for fn in ('utg_data' + suffix, 'utg_data0' + suffix, 'c_path' + suffix, 'ug.final.gfa', 'ug.final.dual.gfa'):
+        merge_shard_outputs(shard_dirs, fn)
+    for shard_dir in shard_dirs:
+        shutil.rmtree(shard_dir)
+    return renumber_contigs(shard_contigs, args.ctg_prefix)
+
+def merge_shard_outputs(shard_dirs, fn):
+    """
+    concatenate the fn files of the shard directories into fn (keeping only the first GFA header)
+    """
+    shard_fns = [os.path.join(d, fn) for d in shard_dirs if os.path.exists(os.path.join(d, fn))]
+    if not shard_fns:
+        return
+    with open(fn, 'wb') as out:
+        for i, shard_fn in enumerate(shard_fns):
+            with open(shard_fn, 'rb') as f:
+                if i > 0 and fn.endswith('.gfa'):
+                    line = f.readline()
+                    if not line.startswith(b'H\t'):
+                        out.write(line)
+                shutil.copyfileobj(f, out, OUTPUT_BUFFER_SIZE)
+
+def contig_order(shard_contigs, ctg_prefix):
+    """
+    yield (shard, index, name) for the contigs of the shards (lists of
+    extract_contigs() contigs), in their merged order, with their merged
+    names (as by extract_contigs())
+
+    The linear contigs (F/R pairs) come first, merged by decreasing length
+    of the F contig (ties in shard order) while keeping the order of each
+    shard, then the circular unitigs. The order of a shard is kept because
+    ipa2_graph_to_contig lays out the first of two contigs on opposite strands.
+    """
+    linear = []
+    circular = []
+    for i, contigs in enumerate(shard_contigs):
+        shard_linear = []
+        j = 0
+        while j < len(contigs):
+            if contigs[j][0].endswith('F'):
+                shard_linear.append((-contigs[j][4], i, j))
+                j += 2
+            else:
+                circular.append((i, j))
+                j += 1
+        linear.append(shard_linear)
+
+    ctg_id = 0
+    for (_, i, j) in heapq.merge(*linear):
+        yield i, j, '%s%06dF' % (ctg_prefix, ctg_id)
+        yield i, j + 1, '%s%06dR' % (ctg_prefix, ctg_id)
+        ctg_id += 1
+    for (i, j) in circular:
+        yield i, j, '%s%d' % (ctg_prefix, ctg_id)
+        ctg_id += 1
+
+def renumber_contigs(shard_contigs, ctg_prefix):
+    """
+    yield the contigs of the shards, renamed and ordered by contig_order()
+    """
+    for i, j, name in contig_order(shard_contigs, ctg_prefix):
+        yield (name,) + shard_contigs[i][j][1:]
+
+def write_shards(args, edge_data, reads, best_in_dict, shards, checkpoint_params):
+    """
+    write the string graph of each shard (see find_shards()) as a
+    string_graph checkpoint with the prefix <shard-prefix><index>, and its
+    edges as <shard-prefix><index>.sg_edges_list (for ipa2_graph_to_contig)
+
+    A shard is run with --resume-from string_graph, and the runs are merged
+    with --merge-shards.
+    """
+    node_name = reads.node_name
+    for i, nodes in enumerate(shards):
+        nodes = frozenset(nodes)
+        shard_edge_data = dict((e, data) for (e, data) in edge_data.items() if e[0] in nodes)
+        shard_best_in_dict = dict((v, u) for (v, u) in best_in_dict.items() if v in nodes)
+        prefix = shard_dir_name(args, i)
+        write_checkpoint(checkpoint_fn(prefix, 'string_graph'), 'string_graph', checkpoint_params,
+                         (reads, shard_edge_data, shard_best_in_dict))
+        with BufferedTextWriter(prefix + '.sg_edges_list') as out_f:
+            write = out_f.write
+            for (v, w), (rid, sp, tp, length, score, identity, type_, inphase) in shard_edge_data.items():
+                write('%s %s %s %5d %5d %5d %5.2f %s %s\n' % (
+                    node_name(v), node_name(w), rid, sp, tp, score, identity, type_, inphase))
+
+def read_ctg_paths(fn):
+    """
+    return the contigs of a ctg_paths file, as tuples of its fields (with an int length)
+    """
+    if fn.endswith('.gz'):
+        import gzip
+        f = gzip.open(fn, 'rt')
+    else:
+        f = open(fn)
+    contigs = []
+    with f:
+        for line in f:
+            fields = line.split()
+            fields[4] = int(fields[4])
+            contigs.append(tuple(fields))
+    return contigs
+
+def merge_shard_runs(shard_dirs, ctg_prefix, compress=False):
+    """
+    merge the outputs of the runs of ipa2_ovlp_to_graph and
+    ipa2_graph_to_contig on the shards written by write_shards(), in
+    shard_dirs, into the working directory; the contigs are renumbered (see
+    contig_order()) in ctg_paths and in the tiling paths; return the number
+    of contigs
+    """
+    suffix = '.gz' if compress else ''
+    shard_contigs = [read_ctg_paths(os.path.join(d, 'ctg_paths' + suffix)) for d in shard_dirs]
+    names = dict()  # (shard, name in the shard) -> merged name, in the merged order
+    with BufferedTextWriter('ctg_paths', compress) as fp_out:
+        for i, j, name in contig_order(shard_contigs, ctg_prefix):
+            contig = shard_contigs[i][j]
+            names[(i, contig[0])] = name
+            fp_out.write('%s %s %s %s %s %s %s\n' % ((name,) + contig[1:]))
+
+    for fn in ('utg_data' + suffix, 'utg_data0' + suffix, 'c_path' + suffix, 'ug.final.gfa', 'ug.final.dual.gfa'):
+        merge_shard_outputs(shard_dirs, fn)
+    merge_tiling_paths(shard_dirs, 'p_ctg_tiling_path', names, lambda ctg_id: ctg_id)
+    # The associate contigs are named <primary contig>-<index>-<index>.
+    merge_tiling_paths(shard_dirs, 'a_ctg_all_tiling_path', names, lambda ctg_id: ctg_id.rsplit('-', 2)[0])
+    return len(names)
+
+def merge_tiling_paths(shard_dirs, fn, names, primary_ctg_id):
+    """
+    concatenate the tiling paths in the fn files of the shard directories
+    into fn, by primary contig in the order of names, renamed as in names
+    """
+    lines = {}  # (shard, primary contig in the shard) -> lines
+    for i, shard_dir in enumerate(shard_dirs):
+        with open(os.path.join(shard_dir, fn)) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                ctg_id, rest = line.split(' ', 1)
+                key = (i, primary_ctg_id(ctg_id))
+                lines.setdefault(key, []).append((ctg_id[len(key[1]):], rest))
+    with BufferedTextWriter(fn) as fp_out:
+        for key, name in names.items():
+            for ctg_suffix, rest in lines.get(key, ()):
+                fp_out.write('%s%s %s' % (name, ctg_suffix, rest))
+
+def merge_shards(args):
+    """
+    the --merge-shards mode
+    """
+    time_total = REPORT.start()
+    with open(args.merge_shards) as f:
+        shard_dirs = [line.strip() for line in f if line.strip()]
+    time_merge = REPORT.start()
+    n_contigs = merge_shard_runs(shard_dirs, args.ctg_prefix, args.compress_outputs)
+    REPORT.end('merge_shards', time_merge, shards=len(shard_dirs), contigs=n_contigs)
+    REPORT.end('TOTAL', time_total)
+    if args.report_fn:
+        REPORT.write(args.report_fn, program='ipa2_ovlp_to_graph', args=vars(args))
+    if args.profile:
+        REPORT.write_profile_summary()
+
+def ovlp_to_graph(args, sg=None):
+    """
+    sg is the string graph from load_string_graph(args), which is loaded here if not given.
+    It is modified.
+    """
+    time_total = REPORT.start()
+
+    if args.trace:
+        # The shard workers run in their own directories.
+        TRACE.enable(TRACE_STAGES if 'all' in args.trace else args.trace, os.path.abspath(args.trace_fn))
+    if (args.shards > 1 or args.write_shards) and args.resume_from == 'unitig_graph':
+        raise Exception('The unitig graph is not checkpointed with --shards, so it cannot be resumed from.')
+
+    # The parameters of the stages that are checkpointed.
+    # (Not the overlap file, which is not read when resuming.)
+    checkpoint_params = {
+        'lfc': args.lfc,
+        'disable_chimer_bridge_removal': args.disable_chimer_bridge_removal,
+    }
+    # The checkpoints are written with checkpoint_prefix, but resumed from
+    # resume_prefix (the sweep runs share the checkpoints of the sweep).
+    resume_prefix = args.resume_prefix or args.checkpoint_prefix
+
+    if args.resume_from is None:
+        if sg is None:
+            sg = load_string_graph(args)
+
+        # remove spurs, remove putative edges caused by repeats
+        time_generate_nx = REPORT.start()
+        nxsg, edge_data = generate_nx_string_graph(sg, args.lfc, args.disable_chimer_bridge_removal, args.compress_outputs)
+        reads = sg.reads
+        del sg
+        REPORT.end('generate_nx_string_graph', time_generate_nx, nodes=nxsg.number_of_nodes(), edges=nxsg.number_of_edges())
+
+        # Create a dict for every non-trivial unitig node, where the key is the
+        # node and the value is the best input node. This is stored in the
+        # string graph in the legacy code.
+        # This is used to resolve ambiguities during contig extraction by
+        # prefering the best scoring path.
+        # Here we simply copy the best_in node as it is in the nxsg.
+        # For the legacy code, this dict will be used as is.
+        # For the haplospur feature, some nodes in this dict will be updated
+        # to represent the new best_in node.
+        best_in_dict = {}
+        for v in nxsg.nodes():
+            v_data = nxsg.nodes[v]
+            if 'best_in' in v_data:
+                best_in_dict[v] = v_data["best_in"]
+
+        if args.checkpoint:
+            time_checkpoint = REPORT.start()
+            write_checkpoint(checkpoint_fn(args.checkpoint_prefix, 'string_graph'), 'string_graph', checkpoint_params,
+                             (reads, edge_data, best_in_dict))
+            REPORT.end('checkpoint-string_graph', time_checkpoint)
+    elif args.resume_from == 'string_graph':
+        time_checkpoint = REPORT.start()
+        reads, edge_data, best_in_dict = read_checkpoint(
+            checkpoint_fn(resume_prefix, 'string_graph'), 'string_graph', checkpoint_params)
+        # The string graph has the same edges as sg2 (the best_in nodes are in best_in_dict).
+        nxsg = init_sg2(edge_data)
+        REPORT.end('resume-string_graph', time_checkpoint)
+
+    if args.write_shards:
+        time_shards = REPORT.start()
+        shards = find_shards(nxsg, args.shards)
+        write_shards(args, edge_data, reads, best_in_dict, shards, checkpoint_params)
+        contigs = None
+        REPORT.end('write_shards', time_shards, shards=len(shards))
+    elif args.shards > 1:
+        time_shards = REPORT.start()
+        if args.checkpoint:
+            LOG.warning('The unitig graph is not checkpointed with --shards.')
+        shards = find_shards(nxsg, args.shards)
+        contigs = build_shard_contigs(args, nxsg, edge_data, reads, best_in_dict, shards)
+        REPORT.end('shards', time_shards, shards=len(shards))
+    else:
+        if args.resume_from != 'unitig_graph':
+            ug2, u_edge_data, circular_path = build_unitig_graph(args, nxsg, edge_data, reads)
+
+            if args.checkpoint:
+                time_checkpoint = REPORT.start()
+                write_checkpoint(checkpoint_fn(args.checkpoint_prefix, 'unitig_graph'), 'unitig_graph', checkpoint_params,
+                                 (reads, edge_data, best_in_dict, u_edge_data, circular_path, ug2))
+                REPORT.end('checkpoint-unitig_graph', time_checkpoint)
+        else:
+            time_checkpoint = REPORT.start()
+            reads, edge_data, best_in_dict, u_edge_data, circular_path, ug2 = read_checkpoint(
+                checkpoint_fn(resume_prefix, 'unitig_graph'), 'unitig_graph', checkpoint_params)
+            nxsg = init_sg2(edge_data)
+            REPORT.end('resume-unitig_graph', time_checkpoint)
+
+        contigs = build_contigs(args, nxsg, reads, best_in_dict, ug2, u_edge_data, circular_path)
+
+    if contigs is not None:
+        # Write contigs to file.
+        time_write_ctg_paths = REPORT.start()
+        with BufferedTextWriter('ctg_paths', args.compress_outputs) as fp_out:
+            n_contigs = write_ctg_paths(fp_out, contigs, reads)
+        REPORT.end('ctg_paths', time_write_ctg_paths, contigs=n_contigs)
+
+    TRACE.close()
+    REPORT.end('TOTAL', time_total)
+    if args.report_fn:
+        REPORT.write(args.report_fn, program='ipa2_ovlp_to_graph', args=vars(args))
+    if args.profile:
+        REPORT.write_profile_summary()
+
+# The options of load_string_graph(), which are the same for all the runs of a sweep.
+SWEEP_SHARED_OPTIONS = ('overlap_file', 'overlap_format', 'string_graph_engine', 'parse_workers', 'tr_workers', 'resume_from')
+
+def sweep_worker(args, sg, out_dir):
+    os.makedirs(out_dir, exist_ok=True)
+    os.chdir(out_dir)
+    # Everything that the run prints goes to its own log.
+    sys.stdout.flush()
+    sys.stderr.flush()
+    with open('ovlp_to_graph.log', 'w') as log_f:
+        os.dup2(log_f.fileno(), 1)
+        os.dup2(log_f.fileno(), 2)
+    ovlp_to_graph(args, sg)
+
+def ovlp_to_graph_sweep(args, sweep_args, workers=1):
+    """
+    run ovlp_to_graph() for each of sweep_args (the args of a run), in the subdirectories
+    args.sweep_prefix + index
+
+    The string graph is loaded once, and each run gets it in a forked process
+    (so its memory is shared, copy-on-write). At most workers runs go at once.
+    """
+    import multiprocessing
+
+    for i, run_args in enumerate(sweep_args):
+        for option in SWEEP_SHARED_OPTIONS:
+            if getattr(run_args, option) != getattr(args, option):
+                raise Exception('The sweep runs must have the same --{}: run {} has {!r}, not {!r}.'.format(
+                    option.replace('_', '-'), i, getattr(run_args, option), getattr(args, option)))
+        if args.resume_from is not None:
+            # The runs go in subdirectories, and read the checkpoint here. Their
+            # own checkpoints (with --checkpoint) go in their subdirectories.
+            run_args.resume_prefix = os.path.abspath(run_args.resume_prefix or run_args.checkpoint_prefix)
+
+    sg = load_string_graph(args) if args.resume_from is None else None
+
+    context = multiprocessing.get_context('fork')
+    running = []
+    failed = []
+    for i, run_args in enumerate(sweep_args):
+        out_dir = '{}{}'.format(args.sweep_prefix, i)
+        if len(running) >= workers:
+            wait_sweep_run(running.pop(0), failed)
+        LOG.info('Sweep run {} in {!r}: {}'.format(i, out_dir, args.sweep[i]))
+        process = context.Process(target=sweep_worker, args=(run_args, sg, out_dir))
+        process.start()
+        running.append((i, out_dir, process))
+    while running:
+        wait_sweep_run(running.pop(0), failed)
+    if failed:
+        raise Exception('Failed sweep runs (see their ovlp_to_graph.log): {}'.format(', '.join(failed)))
+
+def wait_sweep_run(run, failed):
+    i, out_dir, process = run
+    process.join()
+    if process.exitcode != 0:
+        LOG.error('Sweep run {} in {!r} failed (exit code {}).'.format(i, out_dir, process.exitcode))
+        failed.append(out_dir)
+    else:
+        LOG.info('Sweep run {} in {!r} is done.'.format(i, out_dir))
+
+def find_best_in_for_simple_ctg_paths(simple_ctg_paths, ug, u_edge_data, sg, best_in_dict, node_name=str):
     def print_cg_edge_data(ss, tt, vv):
         e_data = cg.get_edge_data(ss, tt, key=vv)
         ss, vv, tt, p_len, p_score, path, n_edges, is_spur = e_data['data']
@@ -1867,62 +3193,86 @@ def find_best_in_for_simple_ctg_paths(simple_ctg_paths, ug, u_edge_data, sg, bes
         cg.add_edge(s, t, key=v, type_="simple_ctg",
                     via=v, length=p_len, score=p_score, is_spur=is_spur, data=vals)
 
+    # The edges of cg by id, with their lengths in a flat list, and the ids of
+    # the in and out edges of each node (in the order of cg).
+    edges = list(cg.edges(keys=True))
+    edge_ids = {e: i for (i, e) in enumerate(edges)}
+    edge_length = [cg.edges[e]['length'] for e in edges]
+    edge_is_spur = [cg.edges[e]['is_spur'] for e in edges]
+    node_in_edges = {}
+    node_out_edges = {}
+    for v in cg.nodes():
+        node_in_edges[v] = [edge_ids[e] for e in cg.in_edges(v, keys=True)]
+        node_out_edges[v] = [edge_ids[e] for e in cg.out_edges(v, keys=True)]
+
     # Collect all non-trivial nodes which will require the best in-edge in the dict.
     nontrivial_nodes = set()
     for v in cg.nodes():
-        if len(cg.in_edges(v, keys=True)) > 1 and len(cg.out_edges(v, keys=True)) == 1:
+        if len(node_in_edges[v]) > 1 and len(node_out_edges[v]) == 1:
             nontrivial_nodes.add(v)
-
-    for key in sorted(nontrivial_nodes):
-        LOG.debug('(before) v = {} -> best_in = {}'.format(key, best_in_dict[key]))
-
+    node_rank = {v: i for (i, v) in enumerate(nontrivial_nodes)}
+
+    debug = LOG.isEnabledFor(logging.DEBUG)
+    if debug:
+        for key in sorted(nontrivial_nodes, key=node_name):
+            LOG.debug('(before) v = {} -> best_in = {}'.format(node_name(key), node_name(best_in_dict[key])))
+
+    # The nodes are resolved in passes over nontrivial_nodes, until a pass
+    # removes no edge (at most 100 passes). A node only needs another visit
+    # if the lengths of its in edges changed, so each pass only visits the
+    # nodes queued for it: a length change queues the target node for the
+    # current pass if it comes later in the order, else for the next pass.
+    # This visits the nodes in the same order, with the same results, as
+    # visiting every node in every pass.
+    this_pass = list(range(len(node_rank)))  # heap of node ranks
+    next_pass = []
+    queued = bytearray([1]) * len(this_pass)  # flags of the ranks in this_pass or next_pass
+    nodes = list(nontrivial_nodes)
     num_iterations = 0
-    converged = False
-    while num_iterations < 100 and converged == False:
-        converged = True
+    while num_iterations < 100 and this_pass:
         num_removed_edges = 0
-        for v in nontrivial_nodes:
-            in_edges = cg.in_edges(v, keys=True)
-            out_edges = cg.out_edges(v, keys=True)
-            edges_to_remove = []
+        while this_pass:
+            rank = heapq.heappop(this_pass)
+            queued[rank] = 0
+            v = nodes[rank]
+            in_edges = node_in_edges[v]
 
-            LOG.debug('[it = {}, v = {}] len(in_edges) = {}'.format(num_iterations, v, len(in_edges), len(out_edges)))
+            if debug:
+                LOG.debug('[it = {}, v = {}] len(in_edges) = {}'.format(num_iterations, v, len(in_edges), len(node_out_edges[v])))
 
             # Only focus on nodes which are still non-trivial.
             # If we reached here, then this node was already resolved at an earlier iteration.
             if len(in_edges) <= 1:
-                LOG.debug('    => Not interesting, len(in_edges) <= 1.')
+                if debug:
+                    LOG.debug('    => Not interesting, len(in_edges) <= 1.')
                 continue
 
-            # Sort by length in descending order.
-            in_edges = sorted(in_edges, key = lambda x: cg.get_edge_data(x[0], x[1], key=x[2])['length'], reverse = True)
-
             # Longest contig entering this node.
-            ss, tt, vv = in_edges[0]
-            max_e_data = cg.get_edge_data(ss, tt, key=vv)
-            max_len = max_e_data['length']
+            max_len = max(edge_length[i] for i in in_edges)
 
             # Find other spur contigs which are shorter than the max one and mark
             # them for removal.
-            for e in in_edges:
-                ss, tt, vv = e
-                e_data = cg.get_edge_data(ss, tt, key=vv)
-
-                ### DEBUG.
-                LOG.debug('    - in_edge: {}'.format(print_cg_edge_data(ss, tt, vv)))
-                pred_nodes_in_sg = get_next_to_last_nodes_from_cg_edge(cg, ss, tt, vv)
-                LOG.debug('        => pred_nodes_in_sg: {}'.format(str(pred_nodes_in_sg)))
-
-                if e_data['is_spur'] and e_data['length'] < (max_len / 2.0):
-                    edges_to_remove.append(e)
-                    converged = False
-                    ### DEBUG.
-                    LOG.debug('        => To remove.')
+            edges_to_remove = []
+            for i in sorted(in_edges, key=edge_length.__getitem__, reverse=True):
+                if debug:
+                    ss, tt, vv = edges[i]
+                    LOG.debug('    - in_edge: {}'.format(print_cg_edge_data(ss, tt, vv)))
+                    pred_nodes_in_sg = get_next_to_last_nodes_from_cg_edge(cg, ss, tt, vv)
+                    LOG.debug('        => pred_nodes_in_sg: {}'.format(str(pred_nodes_in_sg)))
+
+                if edge_is_spur[i] and edge_length[i] < (max_len / 2.0):
+                    edges_to_remove.append(i)
+                    if debug:
+                        LOG.debug('        => To remove.')
 
             # Remove the edges from the graph.
-            LOG.debug('    => Removing {} edges.'.format(len(edges_to_remove)))
-            for ss, tt, vv in edges_to_remove:
+            if debug:
+                LOG.debug('    => Removing {} edges.'.format(len(edges_to_remove)))
+            for i in edges_to_remove:
+                ss, tt, vv = edges[i]
                 cg.remove_edge(ss, tt, key=vv)
+                in_edges.remove(i)
+                node_out_edges[ss].remove(i)
                 num_removed_edges += 1
 
             # If the current positon converged so that there is exactly one
@@ -1940,31 +3290,40 @@ def find_best_in_for_simple_ctg_paths(simple_ctg_paths, ug, u_edge_data, sg, bes
             #     so that they have the sum of the lengths of them both.
             #   - This allows us to propagate the new contig length up or down
             #     to the next spur in the next iteration.
-            v_in_edges = list(cg.in_edges(v, keys=True))
-            v_out_edges = list(cg.out_edges(v, keys=True))
-            LOG.debug('    => len(in_edges) = {}'.format(len(v_in_edges)))
-            LOG.debug('    => len(out_edges) = {}'.format(len(v_out_edges)))
-            if len(v_in_edges) == 1 and len(v_out_edges) == 1:
-                LOG.debug('    => out_edges = {}'.format(str(v_out_edges)))
-                ss, tt, vv = v_out_edges[0]
-                curr_out_e_data = cg.get_edge_data(ss, tt, key=vv)
-                len_out_before = curr_out_e_data['length']
-
-                LOG.debug('    => in_edges = {}'.format(str(v_in_edges)))
-                ss, tt, vv = v_in_edges[0]
-                curr_in_e_data = cg.get_edge_data(ss, tt, key=vv)
-                len_in_before = curr_in_e_data['length']
+            out_edges = node_out_edges[v]
+            if debug:
+                LOG.debug('    => len(in_edges) = {}'.format(len(in_edges)))
+                LOG.debug('    => len(out_edges) = {}'.format(len(out_edges)))
+            if len(in_edges) == 1 and len(out_edges) == 1:
+                i_out = out_edges[0]
+                i_in = in_edges[0]
+                len_out_before = edge_length[i_out]
+                len_in_before = edge_length[i_in]
 
                 new_len = len_out_before + len_in_before
 
-                curr_out_e_data['length'] = new_len
-                curr_in_e_data['length'] = new_len
+                edge_length[i_out] = new_len
+                edge_length[i_in] = new_len
 
                 ### DEBUG.
-                LOG.debug('        => Increasing length of the single out edge. len_out_before = {}, len_in_before = {}, new_len = {}.'.format(len_out_before, len_in_before, new_len))
-
-        LOG.debug('num_iterations = {}, num_removed_edges = {}, converged = {}'.format(num_iterations, num_removed_edges, converged))
+                if debug:
+                    LOG.debug('    => out_edges = {}'.format(str([edges[i_out]])))
+                    LOG.debug('    => in_edges = {}'.format(str([edges[i_in]])))
+                    LOG.debug('        => Increasing length of the single out edge. len_out_before = {}, len_in_before = {}, new_len = {}.'.format(len_out_before, len_in_before, new_len))
+
+                # The in edges of the target of the out edge changed length.
+                next_rank = node_rank.get(edges[i_out][1])
+                if next_rank is not None and not queued[next_rank]:
+                    queued[next_rank] = 1
+                    heapq.heappush(this_pass if next_rank > rank else next_pass, next_rank)
+
+        converged = num_removed_edges == 0
+        if debug:
+            LOG.debug('num_iterations = {}, num_removed_edges = {}, converged = {}'.format(num_iterations, num_removed_edges, converged))
         num_iterations += 1
+        if converged:
+            break
+        this_pass, next_pass = next_pass, []
 
     changed = {}
 
@@ -2003,9 +3362,9 @@ def find_best_in_for_simple_ctg_paths(simple_ctg_paths, ug, u_edge_data, sg, bes
     #     LOG.info('(after) v = {} -> best_in = {}'.format(key, best_in_dict[key]))
 
     LOG.info('Haplospur changed best_in preferences:')
-    for key in sorted(changed.keys()):
+    for key in sorted(changed.keys(), key=node_name):
         vals = changed[key]
-        LOG.info('(changed) v = {}: {} -> {}'.format(key, vals[0], vals[1]))
+        LOG.info('(changed) v = {}: {} -> {}'.format(node_name(key), node_name(vals[0]), node_name(vals[1])))
 
     return best_in_dict
 
@@ -2024,6 +3383,10 @@ Outputs:
     - chimer_nodes (if not --disable-chimer-bridge-removal)
     - utg_data
     - utg_data0 (maybe)
+    - ovlp_to_graph_report.json
+    - sweep.0/, sweep.1/, ... (with --sweep: the outputs of each run)
+    - shard.0/, shard.1/, ... (with --shards: removed after their outputs are merged)
+    - shard.0.string_graph.pickle, shard.0.sg_edges_list, ... (with --write-shards, instead of the contigs)
 """
     parser = argparse.ArgumentParser(
             description='example string graph assembler that is desinged for handling diploid genomes',
@@ -2056,6 +3419,18 @@ Outputs:
     parser.add_argument(
         '--disable-chimer-bridge-removal', action="store_true", default=False,
         help='disable chimer induced bridge removal')
+    parser.add_argument(
+        '--string-graph-engine', choices=list(STRING_GRAPH_ENGINES), default='compact',
+        help='string graph implementation: "compact" keeps the edges in arrays, "object" keeps one object per node and edge')
+    parser.add_argument(
+        '--overlap-format', choices=['m4', 'ovb'], default='m4',
+        help='format of the overlap file: m4 text, or the binary columnar format written by ipa2_m4_to_ovb')
+    parser.add_argument(
+        '--parse-workers', type=int, default=1,
+        help='number of processes for parsing the overlap file')
+    parser.add_argument(
+        '--tr-workers', type=int, default=1,
+        help='number of processes for the transitive reduction of the "compact" string graph')
     parser.add_argument(
         '--ctg-prefix', default='',
         help='Prefix for contig names.')
@@ -2073,10 +3448,90 @@ Outputs:
     parser.add_argument(
         '--length-cutoff', type=int, default=500000,
         help='Depth cutoff threshold (number of nodes) for bundle finding.')
+    parser.add_argument(
+        '--bundle-workers', type=int, default=1,
+        help='Number of processes for bundle finding.')
+    parser.add_argument(
+        '--shards', type=int, default=1,
+        help='Split the string graph into this many groups of connected components (each with its reverse complement), '
+             'and build the unitigs and contigs of each group on its own, in <shard-prefix><index> directories. '
+             'The outputs are merged, with the contigs renumbered by decreasing length. Not with --resume-from unitig_graph.')
+    parser.add_argument(
+        '--shard-workers', type=int, default=1,
+        help='Number of processes for the --shards groups.')
+    parser.add_argument(
+        '--shard-prefix', default='shard.',
+        help='Prefix of the directories of the --shards groups (removed once merged).')
+    parser.add_argument(
+        '--write-shards', action="store_true", default=False,
+        help='Instead of building the contigs, write the string graph of each of the --shards groups as a checkpoint '
+             '<shard-prefix><index>.string_graph.pickle (to run with --resume-from string_graph and --checkpoint-prefix '
+             '<shard-prefix><index>), with its edges in <shard-prefix><index>.sg_edges_list (for ipa2_graph_to_contig).')
+    parser.add_argument(
+        '--merge-shards', default=None, metavar='FOFN',
+        help='Instead of running, merge the outputs of ipa2_ovlp_to_graph and ipa2_graph_to_contig on the --write-shards shards, '
+             'in the directories listed in this file, into the working directory, with the contigs renumbered by decreasing length.')
+    parser.add_argument(
+        '--compress-outputs', action="store_true", default=False,
+        help='Write the text outputs except the GFA files with gzip, adding ".gz" to their names.')
+    parser.add_argument(
+        '--report-fn', default='ovlp_to_graph_report.json',
+        help='JSON report of the time, memory and counts of each stage (empty to skip it).')
+    parser.add_argument(
+        '--trace-malloc', action="store_true", default=False,
+        help='Add the peak of the Python allocations of each stage to the report (slow).')
+    parser.add_argument(
+        '--profile', action="store_true", default=False,
+        help='Profile each stage with cProfile, into <profile-prefix>.<index>.<stage>.pstats files, '
+             'merged into <profile-prefix>.pstats with a summary of the top functions in <profile-prefix>.txt. '
+             'The worker processes are not profiled.')
+    parser.add_argument(
+        '--profile-prefix', default='ovlp_to_graph.profile',
+        help='Prefix of the profile files.')
+    parser.add_argument(
+        '--checkpoint', action="store_true", default=False,
+        help='Write the state after the string graph and the unitig graph stages to checkpoint files.')
+    parser.add_argument(
+        '--resume-from', choices=list(CHECKPOINT_STAGES), default=None,
+        help='Resume from the checkpoint of a stage, written by an earlier run with --checkpoint. '
+             'The files of the skipped stages (sg_edges_list, chimers_nodes) are not written again.')
+    parser.add_argument(
+        '--checkpoint-prefix', default='ovlp_to_graph.checkpoint',
+        help='Prefix of the checkpoint file names.')
+    parser.add_argument(
+        '--resume-prefix', default=None,
+        help='Prefix of the names of the checkpoint files to resume from, if not --checkpoint-prefix.')
+    parser.add_argument(
+        '--sweep', action='append', default=[], metavar='OPTIONS',
+        help='Options of a run in a parameter sweep (for example --sweep="--depth-cutoff 100 --lfc"), added to the other options. '
+             'Can be repeated: the overlaps are read and reduced once, then each run goes in its own subdirectory.')
+    parser.add_argument(
+        '--sweep-prefix', default='sweep.',
+        help='Prefix of the subdirectories of the sweep runs, which are numbered from 0.')
+    parser.add_argument(
+        '--sweep-workers', type=int, default=1,
+        help='Number of sweep runs at once.')
+    parser.add_argument(
+        '--trace', action='append', choices=list(TRACE_STAGES) + ['all'], default=[],
+        help='Write trace records of the inner loops of a stage to the trace file (can be repeated).')
+    parser.add_argument(
+        '--trace-fn', default='trace.jsonl',
+        help='File for the trace records (JSON lines).')
 
     args = parser.parse_args(argv[1:])
     logging.basicConfig(level=logging.INFO, stream=sys.stdout, format='[%(asctime)s %(levelname)s] %(msg)s', datefmt='%Y-%m-%d %H:%M:%S')
-    ovlp_to_graph(args)
+    if args.trace_malloc:
+        REPORT.enable_trace_malloc()
+    if args.profile:
+        REPORT.enable_profile(args.profile_prefix)
+    if args.merge_shards:
+        merge_shards(args)
+    elif args.sweep:
+        # The options of each run, on top of the others.
+        sweep_args = [parser.parse_args(argv[1:] + shlex.split(options)) for options in args.sweep]
+        ovlp_to_graph_sweep(args, sweep_args, args.sweep_workers)
+    else:
+        ovlp_to_graph(args)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,133 @@
+"""
+the stage measurements (time, CPU, memory) shared by the ipa2 scripts
+"""
+
+import json
+import logging
+import os
+import resource
+import time
+
+LOG = logging.getLogger(__name__)
+
+def time_diff_to_str(time_list):
+    elapsed_time = time_list[1] - time_list[0]
+    return time.strftime("%H:%M:%S", time.gmtime(elapsed_time))
+
+def log_time(label, time_list):
+    LOG.info('Time for "{}": {}'.format(label, time_diff_to_str(time_list)))
+
+class StageReport(object):
+    """
+    measurements of the stages of a run, for a JSON report
+
+    For each stage: the wall and CPU times (of this process, and of the
+    child processes which were waited for), the peak RSS at the end and
+    its increase during the stage, the peak of the Python allocations
+    (with trace_malloc) and the counts given to end(). Stages can be
+    nested, if they end in the reverse order of their start.
+
+    With a profile prefix, each stage is also run under cProfile, and its
+    pstats file is written when it ends. The time of a nested stage is
+    only in its own profile, not in the profile of the enclosing stage.
+    """
+
+    def __init__(self):
+        self.stages = []
+        self.n_open = 0  # stages started and not ended
+        self.trace_malloc = False
+        self.open_peaks = []  # Python allocation peaks of the open stages
+        self.profile_prefix = None
+        self.profilers = []  # of the open stages
+        self.profile_fns = []
+
+    def enable_trace_malloc(self):
+        import tracemalloc
+        tracemalloc.start()
+        self.trace_malloc = True
+
+    def enable_profile(self, prefix):
+        self.profile_prefix = prefix
+
+    def start(self):
+        """
+        return the measurements at the start of a stage, for end()
+        """
+        if self.trace_malloc:
+            import tracemalloc
+            peak = tracemalloc.get_traced_memory()[1]
+            self.open_peaks = [max(p, peak) for p in self.open_peaks]
+            self.open_peaks.append(0)
+            tracemalloc.reset_peak()
+        self.n_open += 1
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        start = (time.time(), time.process_time(), children.ru_utime + children.ru_stime,
+                 resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+        if self.profile_prefix is not None:
+            import cProfile
+            if self.profilers:
+                self.profilers[-1].disable()
+            profiler = cProfile.Profile()
+            self.profilers.append(profiler)
+            profiler.enable()
+        return start
+
+    def end(self, label, start, **counts):
+        """
+        log the time of a stage, and add its measurements to the report
+        """
+        if self.profile_prefix is not None:
+            profiler = self.profilers.pop()
+            profiler.disable()
+        wall_time, cpu_time, children_cpu_time, peak_rss = start
+        self.n_open -= 1
+        now = time.time()
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        stage = {
+            'name': label.lstrip(' -'),
+            'level': self.n_open,
+            'wall_s': round(now - wall_time, 3),
+            'cpu_s': round(time.process_time() - cpu_time, 3),
+            'children_cpu_s': round(children.ru_utime + children.ru_stime - children_cpu_time, 3),
+            'peak_rss_kb': max_rss,
+            'peak_rss_delta_kb': max_rss - peak_rss,
+        }
+        if self.trace_malloc:
+            import tracemalloc
+            peak = max(self.open_peaks.pop(), tracemalloc.get_traced_memory()[1])
+            self.open_peaks = [max(p, peak) for p in self.open_peaks]
+            stage['py_alloc_peak_bytes'] = peak
+        stage.update(counts)
+        if self.profile_prefix is not None:
+            fn = os.path.abspath('{}.{:02d}.{}.pstats'.format(self.profile_prefix, len(self.stages), stage['name']))
+            profiler.dump_stats(fn)
+            self.profile_fns.append(fn)
+            stage['profile'] = fn
+            if self.profilers:
+                self.profilers[-1].enable()
+        self.stages.append(stage)
+        log_time(label, [wall_time, now])
+
+    def write_profile_summary(self, n_lines=40):
+        """
+        merge the profiles of the stages into <prefix>.pstats, and write the
+        top functions by own time and by cumulative time into <prefix>.txt
+        """
+        import pstats
+        if not self.profile_fns:
+            return
+        merged_fn = self.profile_prefix + '.pstats'
+        pstats.Stats(*self.profile_fns).dump_stats(merged_fn)
+        with open(self.profile_prefix + '.txt', 'w') as f:
+            stats = pstats.Stats(merged_fn, stream=f)
+            stats.sort_stats('tottime').print_stats(n_lines)
+            stats.sort_stats('cumulative').print_stats(n_lines)
+
+    def write(self, fn, **info):
+        report = {}
+        report.update(info)
+        report['stages'] = self.stages
+        with open(fn, 'w') as f:
+            json.dump(report, f, indent=1)
+            f.write('\n')
@@ -0,0 +1,212 @@
+#! /usr/bin/env python3
+
+"""
+Time the stages of ipa2_ovlp_to_graph and ipa2_graph_to_contig on synthetic
+overlaps (see synth_ovlp.py) at several scales of the genome size.
+
+Each scale runs in <work-dir>/x<scale>. The stage timings and peak memory
+of the stage reports of both programs are collected into --summary-fn, and
+printed as a table. With --baseline-fn, the wall times are compared to a
+previous summary, and the exit code is 1 if a stage got slower than
+--tolerance allows.
+"""
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+
+import synth_ovlp
+
+LOG = logging.getLogger(__name__)
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'scripts')
+PROGRAMS = (
+    ('ovlp_to_graph', 'ipa2_ovlp_to_graph.py'),
+    ('graph_to_contig', 'ipa2_graph_to_contig.py'),
+)
+
+
+def run_program(cmd, log_fn):
+    """
+    run cmd, with its stdout and stderr in log_fn; return the peak RSS of the process in KB
+    """
+    with open(log_fn, 'w') as log:
+        proc = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT)
+        _, status, rusage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode:
+        raise Exception('Failed ({}): {} (see "{}")'.format(proc.returncode, ' '.join(cmd), log_fn))
+    return rusage.ru_maxrss
+
+
+def run_scale(scale, genome_size, generator_options, program_options, scripts_dir, work_dir):
+    """
+    generate the overlaps of the genome_size*scale genome, and run both programs on them in their own directory
+    """
+    run_dir = os.path.join(work_dir, 'x{}'.format(scale))
+    os.makedirs(run_dir, exist_ok=True)
+    m4_fn = os.path.join(run_dir, 'overlaps.m4')
+    start = time.time()
+    n_reads, n_records = synth_ovlp.generate(m4_fn, genome_size * scale, **generator_options)
+    result = {
+        'scale': scale,
+        'genome_size': genome_size * scale,
+        'reads': n_reads,
+        'overlap_records': n_records,
+        'generate_s': time.time() - start,
+        'programs': {},
+    }
+    for (name, script) in PROGRAMS:
+        report_fn = os.path.join(run_dir, '{}_report.json'.format(name))
+        cmd = [sys.executable, os.path.join(scripts_dir, script), '--report-fn', report_fn] + program_options[name]
+        if name == 'ovlp_to_graph':
+            cmd += ['--overlap-file', m4_fn]
+        LOG.info('Running: {}'.format(' '.join(cmd)))
+        cwd = os.getcwd()
+        os.chdir(run_dir)
+        try:
+            peak_rss_kb = run_program(cmd, '{}.log'.format(name))
+        finally:
+            os.chdir(cwd)
+        with open(report_fn) as f:
+            report = json.load(f)
+        result['programs'][name] = {'peak_rss_kb': peak_rss_kb, 'stages': report['stages']}
+    return result
+
+
+def stage_times(result):
+    """
+    return {(program, stage): (wall_s, peak_rss_kb, level)} for a scale
+    """
+    times = {}
+    for (name, _) in PROGRAMS:
+        for stage in result['programs'][name]['stages']:
+            times[(name, stage['name'])] = (stage['wall_s'], stage['peak_rss_kb'], stage['level'])
+    return times
+
+
+def format_table(results):
+    """
+    the wall time and peak RSS of each stage (rows) at each scale (columns)
+    """
+    rows = []
+    levels = {}
+    for result in results:
+        for key, (_, _, level) in stage_times(result).items():
+            if key not in levels:
+                rows.append(key)
+                levels[key] = level
+    lines = ['{:<16} {:<48}'.format('program', 'stage') +
+             ''.join('{:>22}'.format('x{} s / MB'.format(r['scale'])) for r in results)]
+    for key in rows:
+        cells = []
+        for result in results:
+            wall_s, peak_rss_kb, _ = stage_times(result).get(key, (None, None, None))
+            cells.append('{:>22}'.format('-' if wall_s is None else '{:.2f} / {:.0f}'.format(wall_s, peak_rss_kb / 1024)))
+        lines.append('{:<16} {:<48}'.format(key[0], '  ' * levels[key] + key[1]) + ''.join(cells))
+    for (name, _) in PROGRAMS:
+        lines.append('{:<16} {:<48}'.format(name, 'peak RSS (MB)') +
+                     ''.join('{:>22.0f}'.format(r['programs'][name]['peak_rss_kb'] / 1024) for r in results))
+    return '\n'.join(lines)
+
+
+def find_regressions(results, baseline, tolerance, min_wall_s):
+    """
+    return the (scale, program, stage, wall_s, baseline wall_s) of the stages slower than the baseline
+    by more than the tolerance; stages faster than min_wall_s in the baseline are ignored
+    """
+    baseline_times = dict((r['scale'], stage_times(r)) for r in baseline['results'])
+    regressions = []
+    for result in results:
+        previous = baseline_times.get(result['scale'], {})
+        for key, (wall_s, _, _) in stage_times(result).items():
+            if key not in previous:
+                continue
+            previous_wall_s = previous[key][0]
+            if previous_wall_s >= min_wall_s and wall_s > previous_wall_s * (1 + tolerance):
+                regressions.append((result['scale'],) + key + (wall_s, previous_wall_s))
+    return regressions
+
+
+def run(scales, genome_size, generator_options, program_options, scripts_dir, work_dir, summary_fn,
+        baseline_fn=None, tolerance=0.2, min_wall_s=1.0):
+    """
+    run the benchmark, and write its summary; return the number of regressions
+    """
+    results = []
+    for scale in scales:
+        results.append(run_scale(scale, genome_size, generator_options, program_options, scripts_dir, work_dir))
+    summary = {
+        'genome_size': genome_size,
+        'generator_options': generator_options,
+        'program_options': program_options,
+        'results': results,
+    }
+    with open(summary_fn, 'w') as f:
+        json.dump(summary, f, indent=1)
+    print(format_table(results))
+
+    if not baseline_fn:
+        return 0
+    with open(baseline_fn) as f:
+        baseline = json.load(f)
+    regressions = find_regressions(results, baseline, tolerance, min_wall_s)
+    for (scale, name, stage, wall_s, previous_wall_s) in regressions:
+        print('SLOWER x{} {} {}: {:.2f}s, was {:.2f}s'.format(scale, name, stage, wall_s, previous_wall_s))
+    return len(regressions)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--scales', default='1,10,100',
+                        help='Comma-separated multiples of --genome-size to run.')
+    parser.add_argument('--genome-size', type=int, default=200000,
+                        help='Genome size of the 1x scale.')
+    parser.add_argument('--coverage', type=float, default=30.0, help='See synth_ovlp.py.')
+    parser.add_argument('--read-length', type=int, default=15000, help='See synth_ovlp.py.')
+    parser.add_argument('--heterozygosity', type=float, default=0.001, help='See synth_ovlp.py.')
+    parser.add_argument('--repeat-fraction', type=float, default=0.02, help='See synth_ovlp.py.')
+    parser.add_argument('--repeat-length', type=int, default=5000, help='See synth_ovlp.py.')
+    parser.add_argument('--repeat-copies', type=int, default=3, help='See synth_ovlp.py.')
+    parser.add_argument('--seed', type=int, default=42, help='See synth_ovlp.py.')
+    parser.add_argument('--ovlp-to-graph-options', default='--haplospur',
+                        help='Options of ipa2_ovlp_to_graph, as one string (use --ovlp-to-graph-options="...").')
+    parser.add_argument('--graph-to-contig-options', default='',
+                        help='Options of ipa2_graph_to_contig, as one string.')
+    parser.add_argument('--scripts-dir', default=SCRIPTS_DIR,
+                        help='Directory of the ipa2_ovlp_to_graph.py and ipa2_graph_to_contig.py to run.')
+    parser.add_argument('--work-dir', default='bench', help='Output. Directory of the runs.')
+    parser.add_argument('--summary-fn', default='bench_summary.json', help='Output. The timings of all runs.')
+    parser.add_argument('--baseline-fn', default=None,
+                        help='Input. The --summary-fn of a previous benchmark, to compare the wall times with.')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Fraction by which a stage may be slower than in the baseline.')
+    parser.add_argument('--min-wall-s', type=float, default=1.0,
+                        help='Ignore the stages shorter than this in the baseline.')
+    return parser.parse_args(argv[1:])
+
+
+def main(argv=sys.argv):
+    import shlex
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s %(levelname)s] %(message)s')
+    args = parse_args(argv)
+    generator_options = dict((k, getattr(args, k)) for k in (
+        'coverage', 'read_length', 'heterozygosity', 'repeat_fraction', 'repeat_length', 'repeat_copies', 'seed'))
+    program_options = {
+        'ovlp_to_graph': shlex.split(args.ovlp_to_graph_options),
+        'graph_to_contig': shlex.split(args.graph_to_contig_options),
+    }
+    n_regressions = run([int(s) for s in args.scales.split(',')], args.genome_size,
+                        generator_options, program_options, os.path.abspath(args.scripts_dir),
+                        os.path.abspath(args.work_dir), args.summary_fn,
+                        args.baseline_fn, args.tolerance, args.min_wall_s)
+    sys.exit(1 if n_regressions else 0)
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main(sys.argv)  # pragma: no cover
@@ -0,0 +1,202 @@
+#! /usr/bin/env python3
+
+"""
+Generate the overlaps of reads simulated from a synthetic diploid genome, as
+an m4 file for ipa2_ovlp_to_graph.
+
+Only the read positions are simulated, not their sequences. Two reads overlap
+if their positions on the genome overlap by at least --min-overlap bases, and
+if they are on the same haplotype or no heterozygous site is in the overlap.
+Only the dovetail overlaps are written: the reads contained in a read of the
+same haplotype are not simulated, and the containments between the
+haplotypes are left out.
+The copies of a repeat family are identical, so the reads ending in one copy
+also overlap the reads starting in the other copies.
+"""
+
+import argparse
+import bisect
+import logging
+import random
+import sys
+
+LOG = logging.getLogger(__name__)
+
+
+class Genome(object):
+    """
+    the heterozygous sites and the repeat copies of a diploid genome
+    """
+
+    def __init__(self, size, het_sites, repeat_families, repeat_length):
+        self.size = size
+        self.het_sites = het_sites  # sorted positions
+        self.repeat_families = repeat_families  # lists of the start positions of the copies
+        self.repeat_length = repeat_length
+
+    def has_het_site(self, start, end):
+        i = bisect.bisect_left(self.het_sites, start)
+        return i < len(self.het_sites) and self.het_sites[i] < end
+
+
+def simulate_genome(size, heterozygosity, repeat_fraction, repeat_length, repeat_copies, rnd):
+    het_sites = sorted(rnd.randrange(size) for _ in range(int(size * heterozygosity)))
+    n_families = int(size * repeat_fraction / (repeat_length * repeat_copies))
+    repeat_families = []
+    for _ in range(n_families):
+        repeat_families.append(sorted(rnd.randrange(size - repeat_length) for _ in range(repeat_copies)))
+    return Genome(size, het_sites, repeat_families, repeat_length)
+
+
+def simulate_reads(genome, coverage, read_length, min_read_length, rnd):
+    """
+    return the reads as (start, end, strand, haplotype) tuples sorted by start,
+    without the reads contained in a read of the same haplotype
+    """
+    n_reads = int(genome.size * coverage / read_length)
+    reads = []
+    for _ in range(n_reads):
+        length = min(genome.size, max(min_read_length, int(rnd.gauss(read_length, read_length * 0.2))))
+        start = rnd.randrange(genome.size - length + 1)
+        reads.append((start, start + length, rnd.randint(0, 1), rnd.randint(0, 1)))
+    reads.sort(key=lambda r: (r[0], -r[1]))
+    kept = []
+    max_end = [0, 0]
+    for read in reads:
+        if read[1] > max_end[read[3]]:
+            kept.append(read)
+            max_end[read[3]] = read[1]
+    return kept
+
+
+def read_coords(read, start, end):
+    """
+    the coordinates of the genome interval [start, end) on the forward strand of the read
+    """
+    r_start, r_end, strand = read[:3]
+    if strand == 0:
+        return start - r_start, end - r_start
+    return r_end - end, r_end - start
+
+
+def find_overlaps(genome, reads, min_overlap):
+    """
+    yield (i, j, start, end, shift) for the overlaps of reads i and j, where
+    [start, end) is the overlap on the genome, and the positions of read j are
+    shifted by shift for the overlaps between the copies of a repeat
+    """
+    for i, read_i in enumerate(reads):
+        for j in range(i + 1, len(reads)):
+            read_j = reads[j]
+            if read_j[0] > read_i[1] - min_overlap:
+                break
+            if read_j[1] <= read_i[1]:
+                # read j is contained in read i, which is on the other haplotype
+                continue
+            if read_i[3] != read_j[3] and genome.has_het_site(read_j[0], read_i[1]):
+                continue
+            yield i, j, read_j[0], read_i[1], 0
+
+    starts = [r[0] for r in reads]
+    max_length = max([r[1] - r[0] for r in reads] or [0])
+    length = genome.repeat_length
+
+    def reads_at(position):
+        """the indices of the reads which intersect [position, position + length)"""
+        lo = bisect.bisect_left(starts, position - max_length)
+        hi = bisect.bisect_left(starts, position + length)
+        return [k for k in range(lo, hi) if reads[k][1] > position]
+
+    for copies in genome.repeat_families:
+        for a in copies:
+            left = [i for i in reads_at(a) if reads[i][0] < a + length - min_overlap]
+            for b in copies:
+                if a == b:
+                    continue
+                shift = a - b
+                for j in reads_at(b):
+                    j_start, j_end = reads[j][0] + shift, reads[j][1] + shift
+                    for i in left:
+                        i_start, i_end = reads[i][:2]
+                        # a dovetail overlap, with the read i on the left, within the repeat copy
+                        if not (i_start < j_start and i_end < j_end):
+                            continue
+                        if j_start < a or i_end > a + length or i_end - j_start < min_overlap:
+                            continue
+                        if i != j:
+                            yield i, j, j_start, i_end, shift
+
+
+def write_m4(genome, reads, overlaps, fn, rnd):
+    """
+    write the overlaps as m4 records in both directions, sorted by read id; return the number of records
+    """
+    read_ids = list(range(len(reads)))
+    rnd.shuffle(read_ids)
+    records = []
+    seen = set()
+    for i, j, start, end, shift in overlaps:
+        if (i, j) in seen or (j, i) in seen:
+            continue
+        seen.add((i, j))
+        read_i = reads[i]
+        read_j = reads[j]
+        shifted_j = (read_j[0] + shift, read_j[1] + shift) + read_j[2:]
+        identity = 99.0 + rnd.random()
+        for (f, g, read_f, read_g) in ((i, j, read_i, shifted_j), (j, i, shifted_j, read_i)):
+            f_start, f_end = read_coords(read_f, start, end)
+            g_start, g_end = read_coords(read_g, start, end)
+            records.append((read_ids[f], read_ids[g], '%09d %09d %d %.2f 0 %d %d %d %d %d %d %d u u n\n' % (
+                read_ids[f], read_ids[g], -(end - start), identity,
+                f_start, f_end, read_f[1] - read_f[0],
+                read_f[2] ^ read_g[2], g_start, g_end, read_g[1] - read_g[0])))
+    records.sort()
+    with open(fn, 'w') as f:
+        for record in records:
+            f.write(record[2])
+        f.write('-\n')
+    return len(records)
+
+
+def generate(m4_fn, genome_size, coverage=30.0, read_length=15000, min_read_length=1000,
+             heterozygosity=0.001, repeat_fraction=0.02, repeat_length=5000, repeat_copies=3,
+             min_overlap=1000, seed=42):
+    """
+    simulate a genome and its reads, and write their overlaps to m4_fn; return (number of reads, number of records)
+    """
+    rnd = random.Random(seed)
+    genome = simulate_genome(genome_size, heterozygosity, repeat_fraction, repeat_length, repeat_copies, rnd)
+    reads = simulate_reads(genome, coverage, read_length, min_read_length, rnd)
+    n_records = write_m4(genome, reads, find_overlaps(genome, reads, min_overlap), m4_fn, rnd)
+    LOG.info('Wrote {} overlap records of {} reads into "{}".'.format(n_records, len(reads), m4_fn))
+    return len(reads), n_records
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('m4_fn', help='Output. The overlaps, in m4 format.')
+    parser.add_argument('--genome-size', type=int, default=1000000, help='Length of the genome.')
+    parser.add_argument('--coverage', type=float, default=30.0, help='Total coverage of both haplotypes.')
+    parser.add_argument('--read-length', type=int, default=15000, help='Mean length of the reads.')
+    parser.add_argument('--min-read-length', type=int, default=1000, help='Minimum length of the reads.')
+    parser.add_argument('--heterozygosity', type=float, default=0.001,
+                        help='Fraction of the genome positions which differ between the haplotypes.')
+    parser.add_argument('--repeat-fraction', type=float, default=0.02,
+                        help='Fraction of the genome in the copies of repeats.')
+    parser.add_argument('--repeat-length', type=int, default=5000, help='Length of the repeat copies.')
+    parser.add_argument('--repeat-copies', type=int, default=3, help='Number of copies of each repeat.')
+    parser.add_argument('--min-overlap', type=int, default=1000, help='Minimum overlap length.')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of the random generator.')
+    return parser.parse_args(argv[1:])
+
+
+def main(argv=sys.argv):
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s %(levelname)s] %(message)s')
+    args = parse_args(argv)
+    generate(**vars(args))
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main(sys.argv)  # pragma: no cover
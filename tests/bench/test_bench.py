@@ -0,0 +1,104 @@
+import json
+
+import ipa2_overlaps
+import run_bench
+import synth_ovlp
+
+
+def check_synth_ovlp(m4_fn, n_reads, n_records):
+    records = list(ipa2_overlaps.yield_from_overlap_file(m4_fn))
+    assert(len(records) == n_records)
+    assert(len(set(r[0] for r in records)) <= n_reads)
+    pairs = set((r[0], r[1]) for r in records)
+    assert(all((g, f) in pairs for (f, g) in pairs))
+    for (f_id, g_id, score, identity, f_s, f_b, f_e, f_l, g_s, g_b, g_e, g_l, inphase) in records:
+        assert(f_s == 0)
+        assert(0 <= f_b < f_e <= f_l)
+        assert(0 <= g_b < g_e <= g_l)
+        assert(-score == f_e - f_b == g_e - g_b)
+
+
+def test_synth_ovlp(tmpdir):
+    """
+    Overlaps of a small synthetic genome.
+
+    Setup:
+        - A genome with heterozygous sites and repeats.
+    Expected:
+        m4 records readable by ipa2_ovlp_to_graph, each overlap given in
+        both directions, with the read lengths and coordinates in range.
+    """
+    # Inputs.
+    m4_fn = str(tmpdir.join('overlaps.m4'))
+
+    # Run unit under test.
+    n_reads, n_records = synth_ovlp.generate(m4_fn, 300000, heterozygosity=0.0005, repeat_fraction=0.05)
+
+    # Evaluate.
+    check_synth_ovlp(m4_fn, n_reads, n_records)
+
+
+def test_synth_ovlp_low_heterozygosity(tmpdir):
+    """
+    Overlaps of a synthetic genome with few heterozygous sites.
+
+    Setup:
+        - A genome with few heterozygous sites, so that many reads are
+          contained in a read of the other haplotype with no heterozygous
+          site between them.
+    Expected:
+        Only dovetail overlaps, with the coordinates in range.
+    """
+    # Inputs.
+    m4_fn = str(tmpdir.join('overlaps.m4'))
+
+    # Run unit under test.
+    n_reads, n_records = synth_ovlp.generate(m4_fn, 300000, heterozygosity=0.00005)
+
+    # Evaluate.
+    check_synth_ovlp(m4_fn, n_reads, n_records)
+
+
+def test_run_bench(tmpdir):
+    """
+    Benchmark of two scales.
+
+    Setup:
+        - Scales 1 and 2 of a small genome, and a baseline summary with
+          an init_string_graph stage which took no time.
+    Expected:
+        The stages of both programs in the summary, larger inputs at the
+        larger scale, and a regression of init_string_graph against the
+        baseline.
+    """
+    # Inputs.
+    generator_options = {'coverage': 20.0, 'heterozygosity': 0.0}
+    program_options = {'ovlp_to_graph': [], 'graph_to_contig': []}
+    summary_fn = str(tmpdir.join('summary.json'))
+
+    # Run unit under test.
+    n_regressions = run_bench.run([1, 2], 100000, generator_options, program_options,
+                                  run_bench.SCRIPTS_DIR, str(tmpdir.join('work')), summary_fn)
+
+    # Evaluate.
+    with open(summary_fn) as f:
+        summary = json.load(f)
+    assert(n_regressions == 0)
+    results = summary['results']
+    assert([r['scale'] for r in results] == [1, 2])
+    assert(results[1]['overlap_records'] > results[0]['overlap_records'])
+    for result in results:
+        times = run_bench.stage_times(result)
+        assert(('ovlp_to_graph', 'TOTAL') in times)
+        assert(('graph_to_contig', 'TOTAL') in times)
+        assert(result['programs']['ovlp_to_graph']['peak_rss_kb'] > 0)
+
+    # Run unit under test.
+    baseline = json.loads(json.dumps(summary))
+    for stage in baseline['results'][0]['programs']['ovlp_to_graph']['stages']:
+        if stage['name'] == 'init_string_graph':
+            stage['wall_s'] = 1e-6
+    regressions = run_bench.find_regressions(results, baseline, 0.2, 0.0)
+
+    # Evaluate.
+    assert((1, 'ovlp_to_graph', 'init_string_graph') in [r[:3] for r in regressions])
@@ -1,5 +1,9 @@
+import array
 import pytest
+import random
 import ipa2_ovlp_to_graph as uut
+import ipa2_graph_to_contig
+import ipa2_overlaps
 import networkx as nx
 
 ### Test data 1: Linear chain.
@@ -125,6 +129,17 @@ def build_ug(ug_edge_data):
                     via=v, length=length, score=score)
     return ug
 
+def to_int_nodes(ug_edge_data):
+    """
+    Renumber the nodes to even integers, as find_bundle() needs the
+    reverse end of node n at n ^ 1.
+    """
+    node_ids = {}
+    for s, t, v in ug_edge_data:
+        node_ids.setdefault(s, 2 * len(node_ids))
+        node_ids.setdefault(t, 2 * len(node_ids))
+    return node_ids, {(node_ids[s], node_ids[t], v): vals for ((s, t, v), vals) in ug_edge_data.items()}
+
 def test_ego_dfs_with_convergence_1():
     """
     Test empty input graph.
@@ -545,3 +560,987 @@ def test_ego_dfs_with_convergence_10():
 
     # Evaluate.
     assert(result_ego_edges == expected_ego_edges)
+
+TEST_DATA_M4 = """\
+000000001 000000002 -9000 99.50 0 1000 10000 12000 0 0 9000 15000 u u i
+000000001 000000003 -5000 99.10 0 7000 12000 12000 1 3000 8000 9000 u u n
+000000002 000000004 -4000 99.90 0 11000 15000 15000 0 0 4000 20000 u u x
+"""
+
+TEST_DATA_M4__expected_records = [
+    ('000000001', '000000002', -9000, 99.5, 0, 1000, 10000, 12000, 0, 0, 9000, 15000, 'i'),
+    ('000000001', '000000003', -5000, 99.1, 0, 7000, 12000, 12000, 1, 3000, 8000, 9000, 'n'),
+    ('000000002', '000000004', -4000, 99.9, 0, 11000, 15000, 15000, 0, 0, 4000, 20000, 'x'),
+]
+
+def test_read_overlap_blocks_1(tmpdir):
+    """
+    Bulk parsing of m4 blocks.
+
+    Setup:
+        - All the lines have 15 columns, the file is terminated by a "-" line.
+        - The block size is small, so the records are split across several blocks.
+    Expected:
+        The same records as parsing the file line by line, and nothing after the terminator.
+    """
+    # Inputs.
+    overlap_file = tmpdir.join('preads.m4')
+    overlap_file.write(TEST_DATA_M4 + '-\n000000005 000000006 -1 99 0 0 1 1 0 0 1 1 u u i\n')
+
+    # Run unit under test.
+    blocks = list(ipa2_overlaps.read_overlap_blocks(str(overlap_file), block_size=100))
+    result_records = [r for b in blocks for r in b.records()]
+
+    # Evaluate.
+    assert(len(blocks) == 2)
+    assert(result_records == TEST_DATA_M4__expected_records)
+
+def test_read_overlap_blocks_2(tmpdir):
+    """
+    Lines with and without the optional inphase column.
+
+    Setup:
+        - The last line has no inphase column, and no line end.
+    Expected:
+        The inphase code of the last record defaults to "u".
+    """
+    # Inputs.
+    lines = TEST_DATA_M4.splitlines()
+    overlap_file = tmpdir.join('preads.m4')
+    overlap_file.write('\n'.join(lines[:2] + [lines[2][:-2]]))
+
+    # Expected results.
+    expected_records = TEST_DATA_M4__expected_records[:2] + [TEST_DATA_M4__expected_records[2][:-1] + ('u',)]
+
+    # Run unit under test.
+    result_records = list(ipa2_overlaps.yield_from_overlap_file(str(overlap_file)))
+
+    # Evaluate.
+    assert(result_records == expected_records)
+
+def test_read_overlap_blocks_3(tmpdir):
+    """
+    Parallel parsing of m4 blocks.
+
+    Setup:
+        - Many small blocks, parsed by 2 worker processes.
+    Expected:
+        The records are returned in file order, up to the terminator.
+    """
+    # Inputs.
+    overlap_file = tmpdir.join('preads.m4')
+    overlap_file.write(TEST_DATA_M4 * 10 + '-\n' + TEST_DATA_M4)
+
+    # Run unit under test.
+    blocks = list(ipa2_overlaps.read_overlap_blocks(str(overlap_file), block_size=200, workers=2))
+    result_records = [r for b in blocks for r in b.records()]
+
+    # Evaluate.
+    assert(result_records == TEST_DATA_M4__expected_records * 10)
+
+def test_write_overlap_binary(tmpdir):
+    """
+    Round trip of the binary overlap format.
+
+    Setup:
+        - Convert the m4 test data to the binary format, in small blocks.
+    Expected:
+        Reading the binary file gives back the m4 records.
+    """
+    # Inputs.
+    overlap_file = tmpdir.join('preads.m4')
+    overlap_file.write(TEST_DATA_M4)
+    ovb_file = str(tmpdir.join('preads.ovb'))
+
+    # Run unit under test.
+    n_records = ipa2_overlaps.write_overlap_binary(ipa2_overlaps.read_overlap_blocks(str(overlap_file)), ovb_file)
+    blocks = list(ipa2_overlaps.read_overlaps(ovb_file, 'ovb'))
+    result_records = [r for b in blocks for r in b.records()]
+
+    # Evaluate.
+    assert(n_records == 3)
+    assert(blocks[0].read_names == ['000000001', '000000002', '000000003', '000000004'])
+    assert(result_records == TEST_DATA_M4__expected_records)
+
+def test_overlap_block_read_indices(tmpdir):
+    """
+    Read index columns of binary overlap blocks.
+
+    Setup:
+        - A binary overlap file, read into an empty ReadIndex and into one
+          which already has other reads.
+    Expected:
+        The read id columns are used as they are for the empty ReadIndex, and
+        mapped to the indices of the other one.
+    """
+    # Inputs.
+    overlap_file = tmpdir.join('preads.m4')
+    overlap_file.write(TEST_DATA_M4)
+    ovb_file = str(tmpdir.join('preads.ovb'))
+    ipa2_overlaps.write_overlap_binary(ipa2_overlaps.read_overlap_blocks(str(overlap_file)), ovb_file)
+    block = list(ipa2_overlaps.read_overlaps(ovb_file, 'ovb'))[0]
+    reads_1 = ipa2_overlaps.ReadIndex()
+    reads_2 = ipa2_overlaps.ReadIndex()
+    reads_2.get_index('000000003')
+    reads_2.get_index('000000009')
+
+    # Run unit under test.
+    f_index_1, g_index_1 = block.read_indices(reads_1)
+    f_index_2, g_index_2 = block.read_indices(reads_2)
+
+    # Evaluate.
+    assert(f_index_1 is block.f_id and g_index_1 is block.g_id)
+    assert(reads_1.names == block.read_names)
+    assert(list(f_index_2) == [2, 2, 3])
+    assert(list(g_index_2) == [3, 0, 4])
+    assert(reads_2.names == ['000000003', '000000009', '000000001', '000000002', '000000004'])
+
+### Test data: overlaps of reads made of 100 bp units, where a read is
+### the list of its unit ids (negative on the reverse strand).
+def reverse_units(units):
+    return [-u for u in reversed(units)]
+
+def tile_reads(units, rnd):
+    """
+    reads across the units, on random strands, none of them contained in another
+    """
+    reads = []
+    start, end = 0, 0
+    while end < len(units):
+        start += rnd.randint(2, 4)
+        end = max(end + 1, min(len(units), start + rnd.randint(12, 18)))
+        read = units[start:end]
+        reads.append(read if rnd.random() < 0.5 else reverse_units(read))
+    return reads
+
+def overlaps_to_m4(reads, min_overlap=3):
+    """
+    m4 records of the longest dovetail overlap of each pair of reads
+    """
+    lines = []
+    for f, f_units in enumerate(reads):
+        f_l = len(f_units)
+        for g, g_units in enumerate(reads):
+            g_l = len(g_units)
+            best = None
+            for g_s, g_seq in ((0, g_units), (1, reverse_units(g_units))):
+                for k in range(min(f_l, g_l) - 1, min_overlap - 1, -1):
+                    if f != g and f_units[-k:] == g_seq[:k]:
+                        overlap = (k, f_l - k, f_l, g_s) + ((0, k) if g_s == 0 else (g_l - k, g_l))
+                    elif f != g and g_seq[-k:] == f_units[:k]:
+                        overlap = (k, 0, k, g_s) + ((g_l - k, g_l) if g_s == 0 else (0, k))
+                    else:
+                        continue
+                    if best is None or k > best[0]:
+                        best = overlap
+                    break
+            if best is not None:
+                k, f_b, f_e, g_s, g_b, g_e = best
+                lines.append('%09d %09d %d 99.90 0 %d %d %d %d %d %d %d u u n\n' % (
+                    f + 1, g + 1, -k * 100, f_b * 100, f_e * 100, f_l * 100, g_s, g_b * 100, g_e * 100, g_l * 100))
+    return ''.join(lines) + '-\n'
+
+def units(first, n):
+    return list(range(first, first + n))
+
+def string_graph_test_m4():
+    """
+    overlaps with a bubble, a repeat, a spur and a chimer
+    """
+    rnd = random.Random(1)
+    # The haplotypes differ in the middle.
+    hap_1 = units(1000, 60) + units(1100, 30) + units(1200, 60)
+    hap_2 = units(1000, 60) + units(1300, 30) + units(1200, 60)
+    # Two copies of a repeat, longer than the reads.
+    repeat = units(2000, 50) + units(2100, 25) + units(2200, 50) + units(2100, 25) + units(2300, 50)
+    other = units(3000, 100)
+    reads = tile_reads(hap_1, rnd) + tile_reads(hap_2, rnd) + tile_reads(repeat, rnd) + tile_reads(other, rnd)
+    reads.append(units(1020, 10) + units(9000, 8))  # spur
+    reads.append(units(3030, 9) + units(2225, 9))  # chimer
+    return overlaps_to_m4(reads)
+
+def test_compact_string_graph(tmpdir, monkeypatch):
+    """
+    The compact string graph engine marks the same edges as the object one.
+
+    Setup:
+        - Overlaps of reads across a bubble, a repeat, a spur and a chimer.
+        - Both engines run the marking steps of generate_nx_string_graph,
+          with the best overlap and with the repeat bridge (lfc) removal.
+    Expected:
+        The same edges, attributes and reduce flags after each step, the
+        same chimer nodes, marked edges and best in edges, and the same
+        string graph edges and types from init_digraph.
+    """
+    # Inputs.
+    overlap_file = tmpdir.join('preads.m4')
+    overlap_file.write(string_graph_test_m4())
+
+    def mark_edges(engine, lfc):
+        monkeypatch.chdir(tmpdir.mkdir('{}.{}'.format(engine, lfc)))
+        sg = uut.init_string_graph(uut.read_overlaps(str(overlap_file)), engine=engine)
+        edge_names = {key: (v, w) for (key, v, w, *_) in sg.iter_edges()}
+        def names(edges):
+            return set(edge_names[e] for e in edges)
+        steps = [[e[1:] for e in sg.iter_edges()]]
+        chimer_nodes, chimer_edges = sg.mark_chimer_edges()
+        steps.append([e[1:] for e in sg.iter_edges()])
+        spur_edges = sg.mark_spur_edge()
+        steps.append([e[1:] for e in sg.iter_edges()])
+        removed_edges = sg.resolve_repeat_edges() if lfc else sg.mark_best_overlap()
+        steps.append([e[1:] for e in sg.iter_edges()])
+        spur_edges.update(sg.mark_spur_edge())
+        steps.append([e[1:] for e in sg.iter_edges()])
+        nxsg, edge_data = uut.init_digraph(sg, chimer_edges, removed_edges, spur_edges)
+        marked = (chimer_nodes, names(chimer_edges), names(spur_edges), names(removed_edges), dict(sg.best_in))
+        return steps, marked, edge_data, tmpdir.join('{}.{}'.format(engine, lfc), 'sg_edges_list').read()
+
+    for lfc in (False, True):
+        # Expected results.
+        expected_steps, expected_marked, expected_edge_data, expected_sg_edges_list = mark_edges('object', lfc)
+
+        # Run unit under test.
+        steps, marked, edge_data, sg_edges_list = mark_edges('compact', lfc)
+
+        # Evaluate.
+        assert(all(expected_marked[:4]))
+        assert(any(e[-1] for e in expected_steps[0]))
+        assert(steps == expected_steps)
+        assert(marked == expected_marked)
+        assert(edge_data == expected_edge_data)
+        assert(sg_edges_list == expected_sg_edges_list)
+
+def test_bitset():
+    """
+    Flags set, cleared and counted across byte boundaries.
+
+    Setup:
+        - A bitset of 20 flags, with flags set in all three bytes, one of
+          them set twice and one of them cleared.
+    Expected:
+        Only the flags left set are set, and they are counted once.
+    """
+    # Inputs.
+    bitset = uut.Bitset(20)
+
+    # Run unit under test.
+    for i in (0, 7, 8, 15, 19, 7):
+        bitset[i] = 1
+    bitset[8] = 0
+    bitset[3] = 0
+
+    # Evaluate.
+    assert(len(bitset.bits) == 3)
+    assert([i for i in range(20) if bitset[i]] == [0, 7, 15, 19])
+    assert(bitset.count() == 4)
+
+def test_compact_string_graph_twin_edges():
+    """
+    Each edge is indexed to its reverse complement edge.
+
+    Setup:
+        - Edges 0 -> 2 and its reverse complement 3 -> 1, a self-reverse
+          edge 4 -> 5, and an edge 6 -> 8 without its reverse complement.
+    Expected:
+        The twin of 0 -> 2 is 3 -> 1 and back, the self-reverse edge is its
+        own twin, and 6 -> 8 has none. Reducing an edge also reduces its
+        twin, and the self-reverse edge is counted once.
+    """
+    # Inputs.
+    sg = uut.CompactStringGraph()
+    for (v, w) in ((0, 2), (3, 1), (4, 5), (6, 8)):
+        sg.add_edge(v, w, rid=0, sp=0, tp=1, length=1, score=1, identity=99.0, inphase='n')
+
+    # Run unit under test.
+    sg.init_reduce_dict()
+    twin_0 = sg.reduce_edge(0)
+    twin_2 = sg.reduce_edge(2)
+    twin_3 = sg.reduce_edge(3)
+
+    # Evaluate.
+    assert(list(sg.e_twin) == [1, 0, 2, -1])
+    assert((twin_0, twin_2, twin_3) == (1, 2, -1))
+    assert([e[-1] for e in sg.iter_edges()] == [1, 1, 1, 1])
+    assert(sg.count_reduced() == 4)
+    assert(sg.count_not_reduced() == 0)
+
+def test_parallel_tr_reduced_positions(tmpdir, monkeypatch):
+    """
+    The transitive reduction in a pool of processes reduces the edges of
+    the serial one.
+
+    Setup:
+        - Overlaps of reads across a bubble, a repeat, a spur and a chimer.
+        - Small batches of nodes, so that each of the 2 workers reduces
+          several batches with the same node marks.
+    Expected:
+        The same reduced positions, batch by batch, and the same reduce
+        flags as with a single process.
+    """
+    # Inputs.
+    monkeypatch.setattr(uut, 'TR_BATCH_SIZE', 16)
+    overlap_file = tmpdir.join('preads.m4')
+    overlap_file.write(string_graph_test_m4())
+    sg = uut.init_string_graph(uut.read_overlaps(str(overlap_file)), tr_workers=1)
+    out_nbr = array.array('l', map(sg.e_out.__getitem__, sg.out_edges))
+    out_len = array.array('l', map(sg.e_length.__getitem__, sg.out_edges))
+    node_order = sg.node_order
+    n_nodes = len(sg.node_seen)
+
+    # Expected results.
+    n_mark = bytearray(n_nodes)
+    expected_batches = [uut.tr_reduced_positions(node_order[b:b + 16], sg.out_start, out_nbr, out_len, n_mark)
+                        for b in range(0, len(node_order), 16)]
+    expected_flags = [e[-1] for e in sg.iter_edges()]
+
+    # Run unit under test.
+    batches = uut.parallel_tr_reduced_positions(2, node_order, sg.out_start, out_nbr, out_len, n_nodes)
+    sg_2 = uut.init_string_graph(uut.read_overlaps(str(overlap_file)), tr_workers=2)
+
+    # Evaluate.
+    assert(len(batches) > 4)
+    assert([list(b) for b in batches] == expected_batches)
+    assert(any(expected_flags))
+    assert([e[-1] for e in sg_2.iter_edges()] == expected_flags)
+
+def test_ego_graph_view():
+    """
+    The lazy EgoGraphView has the nodes and edges of nx.ego_graph.
+
+    Setup:
+        - Graph with a bubble and a spur at the bubble fork node.
+        - Several radii, from the fork node.
+    Expected:
+        The same nodes, and for each node the same out and in edges, with the
+        in edges in the node order of the graph.
+    """
+    # Inputs.
+    u_edge_data = TEST_DATA_4__u_edge_data
+    ug = build_ug(u_edge_data)
+    start_node = '4'
+    node_rank = {n: i for (i, n) in enumerate(ug)}
+
+    for radius in (0, 1, 2, 3, 10):
+        # Expected results.
+        ego_graph = nx.ego_graph(ug, start_node, radius)
+
+        # Run unit under test.
+        view = uut.EgoGraphView(ug, start_node, radius)
+
+        # Evaluate.
+        assert(set(n for n in ug if n in view) == set(ego_graph.nodes()))
+        for v in ego_graph:
+            assert(set(view.out_edges(v, keys=True)) == set(ego_graph.out_edges(v, keys=True)))
+            assert(set(view.in_edges(v, keys=True)) == set(ego_graph.in_edges(v, keys=True)))
+            in_nodes = [u for (u, _, _) in view.in_edges(v, keys=True)]
+            assert(in_nodes == sorted(in_nodes, key=node_rank.__getitem__))
+
+def test_ego_graph_view_in_edges_from_outside():
+    """
+    The in edges from outside the view do not extend its BFS.
+
+    Setup:
+        - Linear chain a -> b -> c -> d -> e -> f, with an edge f -> b back
+          into the chain, and an edge x -> c from a node not reachable from a.
+        - Radius 4 from a, so f is just outside the view.
+    Expected:
+        The in edges of b and c are those of nx.ego_graph, and the BFS of the
+        view is still at the start node.
+    """
+    # Inputs.
+    ug = nx.MultiDiGraph()
+    nx.add_path(ug, ['a', 'b', 'c', 'd', 'e', 'f'])
+    ug.add_edge('f', 'b')
+    ug.add_edge('x', 'c')
+    start_node = 'a'
+    radius = 4
+
+    # Expected results.
+    ego_graph = nx.ego_graph(ug, start_node, radius)
+
+    # Run unit under test.
+    view = uut.EgoGraphView(ug, start_node, radius)
+    in_edges_b = list(view.in_edges('b', keys=True))
+    in_edges_c = list(view.in_edges('c', keys=True))
+
+    # Evaluate.
+    assert(in_edges_b == list(ego_graph.in_edges('b', keys=True)))
+    assert(in_edges_c == list(ego_graph.in_edges('c', keys=True)))
+    assert(view.level == 0)
+    assert(list(view.dist) == ['a'])
+
+def test_tracer(tmpdir, monkeypatch):
+    """
+    Trace records are written for the enabled stages only.
+
+    Setup:
+        - Bubble graph, searched for a bundle from the fork node.
+        - Tracing enabled for find_bundle only.
+    Expected:
+        JSON records of the find_bundle stage, from its start to its result,
+        and none of the other stages.
+    """
+    import json
+
+    # Inputs.
+    node_ids, u_edge_data = to_int_nodes(TEST_DATA_2__u_edge_data)
+    ug = build_ug(u_edge_data)
+    trace_fn = str(tmpdir.join('trace.jsonl'))
+    tracer = uut.Tracer()
+    tracer.enable(['find_bundle'], trace_fn)
+    monkeypatch.setattr(uut, 'TRACE', tracer)
+
+    # Run unit under test.
+    coverage, data, _ = uut.find_bundle(ug, u_edge_data, node_ids['4'], 48, 16, 500000, set())
+    uut.identify_simple_paths(nx.DiGraph([(0, 2), (3, 1)]), {(0, 2): (0, 0, 0, 5, 10), (3, 1): (0, 0, 0, 5, 10)})
+    tracer.close()
+
+    # Evaluate.
+    with open(trace_fn) as fp:
+        records = [json.loads(line) for line in fp]
+    assert(coverage == True)
+    assert(set(r['stage'] for r in records) == {'find_bundle'})
+    assert(records[0] == {'stage': 'find_bundle', 'event': 'start', 'node': node_ids['4']})
+    assert(records[-1]['event'] == 'result')
+    assert(records[-1]['data'][1] == node_ids['10'])
+
+def test_checkpoint(tmpdir):
+    """
+    The state of a stage is read back from its checkpoint.
+
+    Setup:
+        - A read index and a unitig graph, written as a checkpoint.
+    Expected:
+        The same read index, graph nodes and edges (in the same order), and
+        an error for a checkpoint of another stage.
+    """
+    # Inputs.
+    reads = uut.ReadIndex()
+    for name in ('000000001', '000000002', '000000003'):
+        reads.get_index(name)
+    ug = build_ug(TEST_DATA_2__u_edge_data)
+    params = {'overlap_file': 'preads.m4', 'lfc': False}
+    fn = str(tmpdir.join('checkpoint'))
+
+    # Run unit under test.
+    uut.write_checkpoint(fn, 'unitig_graph', params, (reads, ug))
+    reads2, ug2 = uut.read_checkpoint(fn, 'unitig_graph', params)
+
+    # Evaluate.
+    assert(reads2.names == reads.names)
+    assert(reads2.get_index('000000002') == 1)
+    assert(reads2.node_name(5) == '000000003:E')
+    assert(list(ug2.nodes()) == list(ug.nodes()))
+    assert(list(ug2.edges(keys=True, data=True)) == list(ug.edges(keys=True, data=True)))
+    with pytest.raises(Exception):
+        uut.read_checkpoint(fn, 'string_graph', params)
+
+def test_sweep(tmpdir, monkeypatch):
+    """
+    A sweep gives the outputs of separate runs.
+
+    Setup:
+        - Small overlap file.
+        - A sweep of two runs, with and without the chimer bridge removal.
+    Expected:
+        Each sweep subdirectory has the same contigs and unitigs as a
+        separate run with the options of the sweep run.
+    """
+    # Inputs.
+    monkeypatch.chdir(tmpdir)
+    tmpdir.join('preads.m4').write(TEST_DATA_M4)
+    options = ['--disable-chimer-bridge-removal', '--haplospur']
+
+    # Expected results.
+    for i, run_options in enumerate(([], options)):
+        monkeypatch.chdir(tmpdir.mkdir('run.{}'.format(i)))
+        uut.main(['ipa2_ovlp_to_graph', '--overlap-file', '../preads.m4'] + run_options)
+    monkeypatch.chdir(tmpdir)
+
+    # Run unit under test.
+    uut.main(['ipa2_ovlp_to_graph', '--sweep=', '--sweep', ' '.join(options)])
+
+    # Evaluate.
+    for i in range(2):
+        for fn in ('ctg_paths', 'utg_data', 'ug.final.gfa', 'sg_edges_list'):
+            assert(tmpdir.join('sweep.{}'.format(i), fn).read() == tmpdir.join('run.{}'.format(i), fn).read())
+
+def test_sweep_resume_checkpoint(tmpdir, monkeypatch):
+    """
+    Concurrent sweep runs resumed from a checkpoint write their own checkpoints.
+
+    Setup:
+        - Small overlap file, run with --checkpoint.
+        - A sweep of two runs at once, resumed from the string graph, with
+          --checkpoint and other cutoffs.
+    Expected:
+        The unitig graph checkpoint of each run in its subdirectory, the
+        checkpoints of the first run unchanged, and no temporary files left.
+    """
+    # Inputs.
+    monkeypatch.chdir(tmpdir)
+    tmpdir.join('preads.m4').write(TEST_DATA_M4)
+    uut.main(['ipa2_ovlp_to_graph', '--checkpoint', '--haplospur'])
+    unitig_graph = tmpdir.join('ovlp_to_graph.checkpoint.unitig_graph.pickle').read_binary()
+
+    # Run unit under test.
+    uut.main(['ipa2_ovlp_to_graph', '--resume-from', 'string_graph', '--checkpoint', '--haplospur',
+              '--sweep-workers', '2', '--sweep=--depth-cutoff 10', '--sweep=--depth-cutoff 20'])
+
+    # Evaluate.
+    assert(tmpdir.join('ovlp_to_graph.checkpoint.unitig_graph.pickle').read_binary() == unitig_graph)
+    for i in range(2):
+        sweep_dir = tmpdir.join('sweep.{}'.format(i))
+        assert(sweep_dir.join('ctg_paths').read() == tmpdir.join('ctg_paths').read())
+        assert(sweep_dir.join('ovlp_to_graph.checkpoint.unitig_graph.pickle').exists())
+    assert(not [fn for fn in tmpdir.visit() if fn.basename.endswith('.tmp')])
+
+def test_buffered_text_writer(tmpdir):
+    """
+    Buffered (and compressed) text output.
+
+    Setup:
+        - Lines written one by one, with a buffer smaller than the text.
+    Expected:
+        The same text as written directly, and the same text after gunzip.
+    """
+    import gzip
+
+    # Inputs.
+    lines = ['%s %5d %5.2f\n' % ('000000001:E', i, i / 3.0) for i in range(100)]
+
+    # Expected results.
+    expected = ''.join(lines)
+
+    # Run unit under test.
+    for compress in (False, True):
+        with uut.BufferedTextWriter(str(tmpdir.join('out')), compress, buffer_size=64) as f:
+            for line in lines:
+                f.write(line)
+
+    # Evaluate.
+    assert(tmpdir.join('out').read() == expected)
+    with gzip.open(str(tmpdir.join('out.gz')), 'rt') as f:
+        assert(f.read() == expected)
+
+def test_stage_report(tmpdir):
+    """
+    Measurements of nested stages.
+
+    Setup:
+        - A stage with a nested stage which allocates a large list.
+        - Python allocation tracing enabled.
+    Expected:
+        The stages in the order they ended, with their nesting level and
+        counts, and the allocation peak of the nested stage in both.
+    """
+    import json
+    import tracemalloc
+
+    # Inputs.
+    report = uut.StageReport()
+    report_fn = str(tmpdir.join('report.json'))
+
+    # Run unit under test.
+    report.enable_trace_malloc()
+    try:
+        outer = report.start()
+        inner = report.start()
+        big = [0] * 1000000
+        report.end('  - inner', inner, items=len(big))
+        del big
+        report.end('outer', outer)
+    finally:
+        tracemalloc.stop()
+    report.write(report_fn, program='test')
+
+    # Evaluate.
+    with open(report_fn) as f:
+        result = json.load(f)
+    assert(result['program'] == 'test')
+    stages = result['stages']
+    assert([(s['name'], s['level']) for s in stages] == [('inner', 1), ('outer', 0)])
+    assert(stages[0]['items'] == 1000000)
+    assert(stages[0]['py_alloc_peak_bytes'] >= 8000000)
+    assert(stages[1]['py_alloc_peak_bytes'] >= stages[0]['py_alloc_peak_bytes'])
+    assert(stages[1]['wall_s'] >= stages[0]['wall_s'])
+
+
+def test_stage_report_profile(tmpdir):
+    """
+    Profiles of nested stages.
+
+    Setup:
+        - A stage with a nested stage, each calling its own function.
+        - Profiling enabled.
+    Expected:
+        A pstats file per stage, where the function of the nested stage is
+        only in the profile of the nested stage, and both functions in the
+        merged profile and its summary.
+    """
+    import pstats
+
+    def inner_work():
+        return sum(range(1000))
+
+    def outer_work():
+        return sum(range(1000))
+
+    # Inputs.
+    report = uut.StageReport()
+    prefix = str(tmpdir.join('profile'))
+
+    # Run unit under test.
+    report.enable_profile(prefix)
+    outer = report.start()
+    outer_work()
+    inner = report.start()
+    inner_work()
+    report.end('  - inner', inner)
+    report.end('outer', outer)
+    report.write_profile_summary()
+
+    # Evaluate.
+    def functions(fn):
+        return set(func[2] for func in pstats.Stats(fn).stats)
+    assert([s['profile'] for s in report.stages] == [prefix + '.00.inner.pstats', prefix + '.01.outer.pstats'])
+    assert('inner_work' in functions(prefix + '.00.inner.pstats'))
+    assert('outer_work' not in functions(prefix + '.00.inner.pstats'))
+    assert('outer_work' in functions(prefix + '.01.outer.pstats'))
+    assert('inner_work' not in functions(prefix + '.01.outer.pstats'))
+    assert(set(['inner_work', 'outer_work']) <= functions(prefix + '.pstats'))
+    with open(prefix + '.txt') as f:
+        summary = f.read()
+    assert('Ordered by: internal time' in summary)
+    assert('Ordered by: cumulative time' in summary)
+
+
+def test_forward_bfs():
+    """
+    Nodes within a radius, in breadth first order, with their BFS parents.
+
+    Setup:
+        - Graph with a bubble and a spur at the bubble fork node.
+    Expected:
+        The same nodes, in the same order, as
+        nx.single_source_shortest_path_length for each radius; the parent
+        of each node is a predecessor one edge closer to the start node.
+    """
+    # Inputs.
+    ug = build_ug(TEST_DATA_4__u_edge_data)
+
+    for radius in range(0, 12):
+        # Expected results.
+        expected = nx.single_source_shortest_path_length(ug, '1', cutoff=radius)
+
+        # Run unit under test.
+        result = uut.forward_bfs(ug.succ, '1', radius)
+
+        # Evaluate.
+        assert(list(result) == list(expected))
+        assert(result['1'] is None)
+        for v, u in result.items():
+            if u is not None:
+                assert(ug.has_edge(u, v))
+                assert(expected[u] == expected[v] - 1)
+
+
+def test_identify_spurs():
+    """
+    A short spur is removed on both strands, a long tip is kept.
+
+    Setup:
+        - Chain 0 -> 2 -> 4 -> 6 -> 8 of 40 kb edges, and a 1 kb spur
+          10 -> 4, with the reverse complement edges.
+    Expected:
+        The spur edge and its reverse complement are removed from the
+        graph and marked as "spur:2"; the chain is kept.
+    """
+    # Inputs.
+    u_edge_data = {}
+    for (s, t, length) in ((0, 2, 40000), (2, 4, 40000), (4, 6, 40000), (6, 8, 40000), (10, 4, 1000)):
+        u_edge_data[(s, t, uut.NA)] = (length, 10, [], 'simple')
+        u_edge_data[(t ^ 1, s ^ 1, uut.NA)] = (length, 10, [], 'simple')
+    ug = nx.MultiDiGraph()
+    for (s, t, v) in u_edge_data:
+        ug.add_edge(s, t, key=v)
+
+    # Run unit under test.
+    result = uut.identify_spurs(ug, u_edge_data, 50000)
+
+    # Evaluate.
+    assert(result is ug)
+    assert(sorted(ug.edges()) == [(0, 2), (2, 4), (3, 1), (4, 6), (5, 3), (6, 8), (7, 5), (9, 7)])
+    assert(u_edge_data[(10, 4, uut.NA)][3] == 'spur:2')
+    assert(u_edge_data[(5, 11, uut.NA)][3] == 'spur:2')
+    assert(u_edge_data[(0, 2, uut.NA)][3] == 'simple')
+
+
+def test_identify_spurs_nearest_branch_node():
+    """
+    A spur is removed up to the nearest branch node.
+
+    Setup:
+        - Chain 0 -> 2 -> 4 -> 16 -> 18, with a 5 kb edge 4 -> 16, a 1 kb
+          spur 10 -> 4, and a chain 12 -> 14 -> 16 joining at 16, with the
+          reverse complement edges. Both 4 and 16 are branch nodes within
+          50 kb of the spur tip.
+    Expected:
+        Only the spur edge and its reverse complement are removed; the edge
+        4 -> 16 is kept.
+    """
+    # Inputs.
+    u_edge_data = {}
+    for (s, t, length) in ((0, 2, 40000), (2, 4, 40000), (4, 16, 5000), (16, 18, 40000), (10, 4, 1000),
+                           (12, 14, 40000), (14, 16, 40000)):
+        u_edge_data[(s, t, uut.NA)] = (length, 10, [], 'simple')
+        u_edge_data[(t ^ 1, s ^ 1, uut.NA)] = (length, 10, [], 'simple')
+    ug = nx.MultiDiGraph()
+    for (s, t, v) in u_edge_data:
+        ug.add_edge(s, t, key=v)
+
+    # Run unit under test.
+    uut.identify_spurs(ug, u_edge_data, 50000)
+
+    # Evaluate.
+    assert(sorted(k for (k, vals) in u_edge_data.items() if vals[3] == 'spur:2') == [(5, 11, uut.NA), (10, 4, uut.NA)])
+    assert(ug.has_edge(4, 16))
+    assert(ug.has_edge(17, 5))
+
+
+def test_unitig_edge_index():
+    """
+    Overlapping bundles are claimed once, on both strands.
+
+    Setup:
+        - Bubble 0 -> (2, 4) -> 6 with the reverse complement edges, and
+          the bundles of the bubble and of its reverse complement.
+    Expected:
+        The twin of each edge is its reverse complement edge; only the
+        first bundle (and its reverse complement) makes compound paths,
+        and no path is contained in another.
+    """
+    # Inputs.
+    ug = nx.MultiDiGraph()
+    for (s, t) in ((0, 2), (0, 4), (2, 6), (4, 6)):
+        ug.add_edge(s, t, key=s + 100)
+        ug.add_edge(t ^ 1, s ^ 1, key=(s + 100) ^ 1)
+    bundle = [(0, 2, 100), (0, 4, 100), (2, 6, 102), (4, 6, 104)]
+    bundle_r = [(7, 3, 103), (7, 5, 105), (3, 1, 101), (5, 1, 101)]
+    compound_paths_0 = [
+        (0, uut.NA, 6, 1.0, 10, 10, bundle),
+        (7, uut.NA, 1, 1.0, 10, 10, bundle_r),
+    ]
+
+    # Run unit under test.
+    index = uut.UnitigEdgeIndex(ug)
+    compound_paths_1 = uut.construct_compound_paths_1(compound_paths_0, index)
+    compound_paths_2 = uut.construct_compound_paths_2(compound_paths_1, index)
+    compound_paths_3 = uut.construct_compound_paths_3(ug, compound_paths_2, index)
+
+    # Evaluate.
+    assert(len(index) == 8)
+    for (v, w, k), i in index.ids.items():
+        assert(index.twin[i] == index.ids[(w ^ 1, v ^ 1, k ^ 1)])
+    assert(list(compound_paths_1) == [(0, uut.NA, 6), (7, uut.NA, 1)])
+    assert(compound_paths_1[(7, uut.NA, 1)][-1] == [(3, 1, 101), (5, 1, 101), (7, 3, 103), (7, 5, 105)])
+    assert(all(index.claimed))
+    assert(list(index.n_cpaths) == [1] * 8)
+    assert(list(compound_paths_3) == [(0, uut.NA, 6), (7, uut.NA, 1)])
+
+
+def test_find_best_in_for_simple_ctg_paths():
+    """
+    A spur contig is removed once a resolved node makes its rival longer.
+
+    Setup:
+        - Contigs 4 -> 20 (spur, 500), 10 -> 20 (300), 0 -> 10 (1000),
+          2 -> 10 (spur, 100) and 20 -> 30, where node 20 comes before
+          node 10 in the order of the nodes.
+    Expected:
+        The 2 -> 10 spur is removed, which adds the 1000 of 0 -> 10 to
+        10 -> 20, so the 4 -> 20 spur is removed in the next pass. The
+        best in nodes of 10 and 20 are the read before them on the kept
+        contigs.
+    """
+    # Inputs.
+    u_edge_data = {}
+    simple_ctg_paths = []
+    sg = nx.DiGraph()
+    for (s, mid, t, length, is_spur) in ((4, 45, 20, 500, True), (10, 15, 20, 300, False),
+                                         (0, 7, 10, 1000, False), (2, 25, 10, 100, True),
+                                         (20, 27, 30, 1000, False)):
+        u_edge_data[(s, t, mid)] = (length, 1, [s, mid, t], 'simple')
+        simple_ctg_paths.append((s, uut.NA, t, length, 1, [(s, t, mid)], 1, is_spur))
+        sg.add_edge(mid, t, score=length)
+    best_in_dict = {20: 45, 10: 25}
+
+    # Run unit under test.
+    result = uut.find_best_in_for_simple_ctg_paths(simple_ctg_paths, None, u_edge_data, sg, best_in_dict)
+
+    # Evaluate.
+    assert(result == {20: 15, 10: 7})
+
+
+def test_find_shards():
+    """
+    Components are grouped with their reverse complements.
+
+    Setup:
+        - Components 0 -> 2 -> 4 and 10 -> 12, with their reverse
+          complements, and a component 20 -> 21 which is its own reverse
+          complement.
+    Expected:
+        The largest component pair in one group, the others in the other
+        group; as many groups as component pairs at most; the nodes in
+        the order of the graph.
+    """
+    # Inputs.
+    sg = nx.DiGraph()
+    for (v, w) in ((0, 2), (2, 4), (10, 12), (20, 21)):
+        sg.add_edge(v, w)
+        sg.add_edge(w ^ 1, v ^ 1)
+
+    # Run unit under test.
+    shards_2 = uut.find_shards(sg, 2)
+    shards_5 = uut.find_shards(sg, 5)
+
+    # Evaluate.
+    assert(shards_2 == [[0, 2, 3, 1, 4, 5], [10, 12, 13, 11, 20, 21]])
+    assert(shards_5 == [[0, 2, 3, 1, 4, 5], [10, 12, 13, 11], [20, 21]])
+    assert(uut.find_shards(nx.DiGraph(), 2) == [[]])
+
+def test_induced_subgraph():
+    """
+    Subgraph copy in the order of the graph.
+
+    Setup:
+        - Graph with the edges into node 4 added out of node order.
+    Expected:
+        The nodes, edge data, and in and out edge order of the graph.
+    """
+    # Inputs.
+    g = nx.DiGraph()
+    g.add_nodes_from([0, 2, 4, 6, 8])
+    g.add_edge(2, 4, length=1)
+    g.add_edge(0, 4, length=2)
+    g.add_edge(4, 6, length=3)
+    g.add_edge(8, 6, length=4)
+
+    # Run unit under test.
+    h = uut.induced_subgraph(g, [0, 2, 4, 6, 8])
+
+    # Evaluate.
+    assert(list(h) == list(g))
+    assert(list(h.edges(data=True)) == list(g.edges(data=True)))
+    for v in g:
+        assert(list(h.in_edges(v)) == list(g.in_edges(v)))
+
+def test_renumber_contigs():
+    """
+    Contigs of the shards named as by extract_contigs().
+
+    Setup:
+        - Two shards, with linear contigs of several lengths and a circular
+          unitig; the contigs of the first shard are not by length.
+    Expected:
+        The linear contig pairs merged by decreasing length (ties in shard
+        order) without reordering a shard, then the circular unitig.
+    """
+    # Inputs.
+    def contig(name, type_, length):
+        return (name, type_, (0, 2, 1), 2, length, 1, [(0, 2, 1)])
+    shard_contigs = [
+        [contig('c000000F', 'ctg_linear', 10), contig('c000000R', 'ctg_linear', 10),
+         contig('c2', 'ctg_circular', 30),
+         contig('c000001F', 'ctg_linear', 15), contig('c000001R', 'ctg_linear', 15)],
+        [contig('c000000F', 'ctg_circular', 20), contig('c000000R', 'ctg_circular', 20),
+         contig('c000001F', 'ctg_linear', 10), contig('c000001R', 'ctg_linear', 10)],
+    ]
+
+    # Run unit under test.
+    result = list(uut.renumber_contigs(shard_contigs, 'ctg'))
+
+    # Evaluate.
+    assert([(c[0], c[1], c[4]) for c in result] == [
+        ('ctg000000F', 'ctg_circular', 20), ('ctg000000R', 'ctg_circular', 20),
+        ('ctg000001F', 'ctg_linear', 10), ('ctg000001R', 'ctg_linear', 10),
+        ('ctg000002F', 'ctg_linear', 15), ('ctg000002R', 'ctg_linear', 15),
+        ('ctg000003F', 'ctg_linear', 10), ('ctg000003R', 'ctg_linear', 10),
+        ('ctg4', 'ctg_circular', 30),
+    ])
+
+def test_shards(tmpdir, monkeypatch):
+    """
+    Sharded runs give the unitigs and contigs of a single run.
+
+    Setup:
+        - Three copies of a small overlap file, with other read ids.
+        - Runs with 3 shards, in one and in two processes.
+    Expected:
+        The same unitigs and contigs (but for the contig names) as a
+        run without shards, and the same outputs in both sharded runs.
+    """
+    # Inputs.
+    monkeypatch.chdir(tmpdir)
+    tmpdir.join('preads.m4').write(''.join(TEST_DATA_M4.replace('00000000', prefix) for prefix in ('10000000', '20000000', '30000000')))
+    run_options = {'run': [], 'shards.1': ['--shards', '3'], 'shards.2': ['--shards', '3', '--shard-workers', '2']}
+
+    # Run unit under test.
+    for name, options in run_options.items():
+        monkeypatch.chdir(tmpdir.mkdir(name))
+        uut.main(['ipa2_ovlp_to_graph', '--overlap-file', '../preads.m4', '--haplospur'] + options)
+    monkeypatch.chdir(tmpdir)
+
+    # Evaluate.
+    def lines(name, fn, first_column=0):
+        return sorted(line.split(' ', first_column)[-1] for line in tmpdir.join(name, fn).read().splitlines())
+    for name in ('shards.1', 'shards.2'):
+        assert(lines(name, 'utg_data') == lines('run', 'utg_data'))
+        assert(lines(name, 'c_path') == lines('run', 'c_path'))
+        assert(lines(name, 'ctg_paths', 1) == lines('run', 'ctg_paths', 1))
+        assert(not tmpdir.join(name, 'shard.0').exists())
+    for fn in ('ctg_paths', 'utg_data', 'ug.final.gfa'):
+        assert(tmpdir.join('shards.1', fn).read() == tmpdir.join('shards.2', fn).read())
+
+def test_write_shards(tmpdir, monkeypatch):
+    """
+    Runs on the shards written by --write-shards, merged by --merge-shards,
+    give the outputs of a run with --shards.
+
+    Setup:
+        - Three copies of a small overlap file, with other read ids.
+        - A run with 3 shards, and the runs of the 3 shards written with
+          --write-shards, each followed by ipa2_graph_to_contig.
+    Expected:
+        The same outputs, with the same contig names and tiling paths.
+    """
+    # Inputs.
+    monkeypatch.chdir(tmpdir)
+    tmpdir.join('preads.m4').write(''.join(TEST_DATA_M4.replace('00000000', prefix) for prefix in ('10000000', '20000000', '30000000')))
+    options = ['--overlap-file', '../preads.m4', '--haplospur']
+    monkeypatch.chdir(tmpdir.mkdir('shards'))
+    uut.main(['ipa2_ovlp_to_graph', '--shards', '3'] + options)
+    ipa2_graph_to_contig.main(['ipa2_graph_to_contig'])
+
+    # Run unit under test.
+    monkeypatch.chdir(tmpdir.mkdir('prepare'))
+    uut.main(['ipa2_ovlp_to_graph', '--shards', '3', '--write-shards'] + options)
+    shard_dirs = []
+    for i in range(3):
+        shard_dir = tmpdir.mkdir('run.{}'.format(i))
+        monkeypatch.chdir(shard_dir)
+        prefix = '../prepare/shard.{}'.format(i)
+        uut.main(['ipa2_ovlp_to_graph', '--resume-from', 'string_graph', '--checkpoint-prefix', prefix, '--haplospur'])
+        ipa2_graph_to_contig.main(['ipa2_graph_to_contig', '--sg-edges-list-fn', prefix + '.sg_edges_list'])
+        shard_dirs.append(str(shard_dir))
+    monkeypatch.chdir(tmpdir.mkdir('merge'))
+    tmpdir.join('merge', 'shards.fofn').write(''.join(d + '\n' for d in shard_dirs))
+    uut.main(['ipa2_ovlp_to_graph', '--merge-shards', 'shards.fofn'])
+    monkeypatch.chdir(tmpdir)
+
+    # Evaluate.
+    assert(not tmpdir.join('prepare', 'shard.3.string_graph.pickle').exists())
+    for fn in ('ctg_paths', 'utg_data', 'c_path', 'ug.final.gfa', 'p_ctg_tiling_path', 'a_ctg_all_tiling_path'):
+        assert(tmpdir.join('merge', fn).read() == tmpdir.join('shards', fn).read())
+    assert(tmpdir.join('merge', 'p_ctg_tiling_path').read())